@@ -1,37 +1,556 @@
 import os
+import re
 import time
+import json
+import hashlib
 import uuid
+import array
+import queue
+import atexit
+import asyncio
+import logging
+import sqlite3
+import operator
+import textwrap
+import threading
+from collections import OrderedDict
 from typing import TypedDict, Annotated, List, Dict, Any, Union
-from langgraph.graph import StateGraph, END
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
+from observability import registry, span, timed, configure_logging
+import side_effects
+import notifications
+from side_effects import after_reply
+# langgraph, langchain_google_genai and pinecone are imported on first use (see get_app,
+# get_llm, VectorMemoryManager) so importing this module stays fast.
+
+configure_logging()
+logger = logging.getLogger("attendance_agent")
 
 # --- Configuration & Constants ---
 INDEX_NAME = "index-autowhat-v1"
 EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
 LLM_MODEL = "models/gemini-2.0-flash-exp"
 
+# Memory backend: "pinecone" (remote), "local" (in-process NumPy index, see local_index.py)
+# or "compact" (truncated, quantized vectors in memory-mapped files, see compact_index.py)
+MEMORY_BACKEND = os.environ.get("MEMORY_BACKEND", "pinecone")
+# .npz file the local backend loads on start and saves on shutdown ("" = in-memory only)
+LOCAL_INDEX_PATH = os.environ.get("LOCAL_INDEX_PATH", "")
+# Directory for the compact backend's files ("" = in-memory only)
+COMPACT_INDEX_PATH = os.environ.get("COMPACT_INDEX_PATH", "")
+
+# Embedding cache: max in-memory entries, and an optional SQLite file for a persistent tier
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "")
+
+# Write-behind memory saves: flush after MEMORY_BATCH_SIZE pending saves or MEMORY_FLUSH_INTERVAL seconds
+MEMORY_WRITE_BEHIND = os.environ.get("MEMORY_WRITE_BEHIND", "1") == "1"
+MEMORY_BATCH_SIZE = int(os.environ.get("MEMORY_BATCH_SIZE", "64"))
+MEMORY_FLUSH_INTERVAL = float(os.environ.get("MEMORY_FLUSH_INTERVAL", "1.0"))
+MEMORY_UPSERT_CHUNK = int(os.environ.get("MEMORY_UPSERT_CHUNK", "100"))
+MEMORY_WRITE_QUEUE_SIZE = int(os.environ.get("MEMORY_WRITE_QUEUE_SIZE", "10000"))
+
+# Compaction: memories of one employee at or above MEMORY_DEDUPE_THRESHOLD similarity are merged
+# into one record (count, first_seen, timestamp = last seen). Memories last seen more than
+# MEMORY_RETENTION_DAYS ago are deleted (0 = keep forever). Employees with new saves are
+# compacted every MEMORY_COMPACT_INTERVAL seconds (0 = only when compact() is called).
+MEMORY_DEDUPE_THRESHOLD = float(os.environ.get("MEMORY_DEDUPE_THRESHOLD", "0.95"))
+MEMORY_RETENTION_DAYS = float(os.environ.get("MEMORY_RETENTION_DAYS", "0"))
+MEMORY_COMPACT_INTERVAL = float(os.environ.get("MEMORY_COMPACT_INTERVAL", "600"))
+MEMORY_COMPACT_SCAN = int(os.environ.get("MEMORY_COMPACT_SCAN", "1000"))  # Pinecone's top_k cap with values
+# How long a fresh upsert may be missing from queries (Pinecone is eventually consistent);
+# compaction keeps saves this recent in the excuse clusters even if its scan missed them
+MEMORY_INDEX_LAG = float(os.environ.get("MEMORY_INDEX_LAG", "60"))
+# Only memories from the last N days are searched and counted (0 = all)
+MEMORY_SEARCH_WINDOW_DAYS = float(os.environ.get("MEMORY_SEARCH_WINDOW_DAYS", "0"))
+# After a failed memory backend connect, try again on first use after this many seconds (0 = never)
+MEMORY_INIT_RETRY = float(os.environ.get("MEMORY_INIT_RETRY", "60"))
+
+# Server-side sessions (session_store.py): each employee's conversation is kept between
+# turns, as a ring buffer of the last SESSION_MAX_MESSAGES messages
+SESSIONS_ENABLED = os.environ.get("SESSIONS_ENABLED", "1") == "1"
+SESSION_MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", "12"))
+
+# Escalation policy: past excuses scoring above the threshold count as repeats
+SIMILARITY_THRESHOLD = 0.60
+ESCALATION_LIMIT = 3
+
+# Excuse clusters: each employee's saved excuses grouped into reason clusters with running
+# counts, so the repeat count doesn't depend on top_k. Optional SQLite file to keep them.
+EXCUSE_CLUSTERS_ENABLED = os.environ.get("EXCUSE_CLUSTERS_ENABLED", "1") == "1"
+EXCUSE_CLUSTERS_PATH = os.environ.get("EXCUSE_CLUSTERS_PATH", "")
+EXCUSE_CLUSTERS_MAX = int(os.environ.get("EXCUSE_CLUSTERS_MAX", "64"))  # per employee
+
+# Reasoning prompt context: token budget shared by history and memory, and per-memory snippet length
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "400"))
+MEMORY_SNIPPET_CHARS = int(os.environ.get("MEMORY_SNIPPET_CHARS", "120"))
+
+# Fast-path rules resolve formulaic turns before the LLM; longer inputs always go to the LLM
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "1") == "1"
+FAST_PATH_MAX_WORDS = int(os.environ.get("FAST_PATH_MAX_WORDS", "12"))
+
+# Decision cache: LLM decisions reused for the same input, recent history and memory matches
+DECISION_CACHE_ENABLED = os.environ.get("DECISION_CACHE_ENABLED", "1") == "1"
+DECISION_CACHE_SIZE = int(os.environ.get("DECISION_CACHE_SIZE", "5000"))
+DECISION_CACHE_TTL = float(os.environ.get("DECISION_CACHE_TTL", "3600"))
+DECISION_CACHE_HISTORY = int(os.environ.get("DECISION_CACHE_HISTORY", "4"))  # history lines in the key
+DECISION_SCORE_BUCKET = 0.05  # memory scores are rounded to this step in the key
+
+# Counters served on serve_agent's /metrics (latency histograms live in observability.py)
+decisions_total = registry.counter("attendance_decisions_total", "Turns by final decision and what decided it",
+                                   ["decision", "decided_by"])
+fallbacks_total = registry.counter("attendance_llm_fallbacks_total", "Turns answered by the deterministic fallback",
+                                   ["reason"])
+
 # --- 1. Tool Implementations ---
 
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed by normalized text.
+    If `path` is set, entries are also written to a SQLite file so they survive restarts.
+    """
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE, path: str = EMBED_CACHE_PATH,
+                 model: str = EMBEDDING_MODEL):
+        self.max_entries = max_entries
+        self.model = model
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, key TEXT, vector BLOB, PRIMARY KEY (model, key))"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def get(self, text: str):
+        key = self.normalize(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND key = ?", (self.model, key)
+                ).fetchone()
+                if row:
+                    vector = array.array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, text: str, vector: List[float]):
+        key = self.normalize(text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)",
+                    (self.model, key, array.array("f", vector).tobytes())
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+def _cosine(a, b, b_norm: float = None) -> float:
+    if len(a) != len(b):
+        raise ValueError(f"Cannot compare vectors of {len(a)} and {len(b)} dimensions")
+    a_norm = sum(map(operator.mul, a, a)) ** 0.5
+    if b_norm is None:
+        b_norm = sum(map(operator.mul, b, b)) ** 0.5
+    if not a_norm or not b_norm:
+        return 0.0
+    return sum(map(operator.mul, a, b)) / (a_norm * b_norm)
+
+class ExcuseClusters:
+    """
+    Online clustering of each employee's saved excuses into reason clusters.
+    A saved excuse joins its closest cluster when the cosine similarity to the cluster's
+    centroid (the running mean of its members) is above SIMILARITY_THRESHOLD, otherwise
+    it starts a new one. count() then sums the clusters the current input falls into,
+    which stays exact however many excuses an employee has, unlike a top_k search.
+    Each cluster also counts its excuses per day, for counts within a time window.
+    If `path` is set, clusters are written to a SQLite file and loaded per employee.
+    With `dims`, vectors are cut to their leading `dims` dimensions before clustering,
+    for an index that returns only those (the compact backend without re-ranking).
+    """
+    def __init__(self, path: str = EXCUSE_CLUSTERS_PATH, threshold: float = SIMILARITY_THRESHOLD,
+                 max_clusters: int = EXCUSE_CLUSTERS_MAX, dims: int = None):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.dims = dims
+        self._clusters: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.added = 0
+        self.created = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS excuse_clusters (employee_id TEXT, id TEXT, label TEXT, centroid BLOB, "
+                "count INTEGER, first_seen REAL, last_seen REAL, days TEXT, PRIMARY KEY (employee_id, id))"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(excuse_clusters)")}
+            if "days" not in columns:
+                self._db.execute("ALTER TABLE excuse_clusters ADD COLUMN days TEXT")
+            self._db.commit()
+
+    def add(self, employee_id: str, vector: List[float], text: str, timestamp: float = None,
+            count: int = 1, first_seen: float = None):
+        """
+        Assigns a saved excuse (or a compacted memory standing for `count` of them) to a cluster.
+        """
+        with self._lock:
+            self._add(employee_id, vector, text, timestamp, count, first_seen)
+            if self._db is not None:
+                self._db.commit()
+
+    def rebuild(self, employee_id: str, records: List[Any]):
+        """
+        Replaces the employee's clusters with ones built from `records`, the
+        (id, vector, metadata) tuples left in the index after compaction.
+        """
+        with self._lock:
+            self._clusters[employee_id] = []
+            if self._db is not None:
+                self._db.execute("DELETE FROM excuse_clusters WHERE employee_id = ?", (employee_id,))
+            for _, vector, metadata in sorted(records, key=lambda r: r[2].get("timestamp") or 0):
+                self._add(employee_id, vector, metadata.get("text", ""), metadata.get("timestamp"),
+                          int(metadata.get("count", 1)), metadata.get("first_seen"))
+            if self._db is not None:
+                self._db.commit()
+
+    def count(self, employee_id: str, vector: List[float], since: float = None) -> int:
+        """
+        Number of saved excuses in the clusters similar to `vector`. With `since`,
+        only excuses given on or after that day are counted.
+        """
+        vector = self._fit(vector)
+        norm = sum(map(operator.mul, vector, vector)) ** 0.5
+        since_day = None if since is None else int(since // 86400)
+        with self._lock:
+            total = 0
+            for c in self._load(employee_id):
+                if since is not None and c["last_seen"] < since:
+                    continue
+                if _cosine(c["centroid"], vector, norm) > self.threshold:
+                    total += c["count"] if since is None else sum(n for day, n in c["days"].items()
+                                                                    if day >= since_day)
+            return total
+
+    def clusters(self, employee_id: str) -> List[Dict[str, Any]]:
+        """
+        The employee's clusters without centroids, most frequent first.
+        """
+        with self._lock:
+            clusters = [{k: v for k, v in c.items() if k not in ("centroid", "days")} for c in self._load(employee_id)]
+        return sorted(clusters, key=lambda c: c["count"], reverse=True)
+
+    def _add(self, employee_id: str, vector: List[float], text: str, timestamp, count: int, first_seen):
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        first_seen = timestamp if first_seen is None else float(first_seen)
+        vector = self._fit(vector)
+        clusters = self._load(employee_id)
+        best, best_score = None, self.threshold
+        for cluster in clusters:
+            score = _cosine(cluster["centroid"], vector)
+            if score > best_score:
+                best, best_score = cluster, score
+
+        if best is None:
+            best = {"id": uuid.uuid4().hex, "label": _shorten(text, MEMORY_SNIPPET_CHARS),
+                    "centroid": array.array("f", vector), "count": 0,
+                    "first_seen": first_seen, "last_seen": timestamp, "days": {}}
+            clusters.append(best)
+            self.created += 1
+            if len(clusters) > self.max_clusters:
+                # Forget the cluster seen least recently
+                stale = min(clusters, key=lambda c: c["last_seen"])
+                clusters.remove(stale)
+                if self._db is not None:
+                    self._db.execute("DELETE FROM excuse_clusters WHERE employee_id = ? AND id = ?",
+                                     (employee_id, stale["id"]))
+        else:
+            n = best["count"]
+            centroid = best["centroid"]
+            best["centroid"] = array.array("f", ((centroid[i] * n + vector[i] * count) / (n + count)
+                                                 for i in range(len(centroid))))
+
+        best["count"] += count
+        # A compacted memory counts on its last-seen day, as the index's timestamp filter does
+        day = int(timestamp // 86400)
+        best["days"][day] = best["days"].get(day, 0) + count
+        best["first_seen"] = min(best["first_seen"], first_seen)
+        best["last_seen"] = max(best["last_seen"], timestamp)
+        self.added += count
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO excuse_clusters (employee_id, id, label, centroid, count, first_seen, "
+                "last_seen, days) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (employee_id, best["id"], best["label"], best["centroid"].tobytes(), best["count"],
+                 best["first_seen"], best["last_seen"], json.dumps(best["days"]))
+            )
+
+    def _load(self, employee_id: str) -> List[Dict[str, Any]]:
+        clusters = self._clusters.get(employee_id)
+        if clusters is None:
+            clusters = []
+            if self._db is not None:
+                rows = self._db.execute(
+                    "SELECT id, label, centroid, count, first_seen, last_seen, days FROM excuse_clusters "
+                    "WHERE employee_id = ?", (employee_id,)
+                ).fetchall()
+                for cluster_id, label, centroid, count, first_seen, last_seen, days in rows:
+                    centroid = array.array("f", centroid)
+                    if self.dims and len(centroid) != self.dims:
+                        continue  # clustered at another dimension (EXCUSE_CLUSTERS_PATH reused); rebuilt over time
+                    clusters.append({"id": cluster_id, "label": label, "centroid": centroid,
+                                     "count": count, "first_seen": first_seen, "last_seen": last_seen,
+                                     # Rows written before per-day counts: all on the last-seen day
+                                     "days": ({int(k): n for k, n in json.loads(days).items()} if days
+                                              else {int(last_seen // 86400): count})})
+            self._clusters[employee_id] = clusters
+        return clusters
+
+    def _fit(self, vector: List[float]) -> List[float]:
+        if not self.dims or len(vector) == self.dims:
+            return vector
+        if len(vector) < self.dims:
+            raise ValueError(f"Expected a vector of at least {self.dims} dimensions, got {len(vector)}")
+        # Leading dimensions, renormalized, as the compact backend stores them
+        head = vector[:self.dims]
+        norm = sum(map(operator.mul, head, head)) ** 0.5 or 1.0
+        return [v / norm for v in head]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "added": self.added,
+                "created": self.created,
+                "employees": len(self._clusters),
+                "clusters": sum(len(c) for c in self._clusters.values()),
+            }
+
+class MemoryWriteBehind:
+    """
+    Background write-behind queue for memory saves.
+    The request path only enqueues. A worker thread embeds pending texts with one
+    embed_documents call and upserts them in chunks of MEMORY_UPSERT_CHUNK, flushing
+    once MEMORY_BATCH_SIZE saves are pending or MEMORY_FLUSH_INTERVAL seconds have passed.
+    """
+    def __init__(self, manager, batch_size: int = MEMORY_BATCH_SIZE, flush_interval: float = MEMORY_FLUSH_INTERVAL,
+                 upsert_chunk: int = MEMORY_UPSERT_CHUNK, max_queue: int = MEMORY_WRITE_QUEUE_SIZE):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.upsert_chunk = upsert_chunk
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.failed = 0
+
+    def enqueue(self, employee_id: str, text: str, timestamp: float = None) -> bool:
+        """
+        Queues a save. Returns False if the queue is full (caller should write directly).
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(("save", (employee_id, text, time.time() if timestamp is None else timestamp)))
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Blocks until everything queued so far has been written.
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Drains the queue and stops the worker thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(("stop", done))
+        if not done.wait(timeout):
+            logger.warning(f"Memory writer did not drain within {timeout}s")
+        thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        pending = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Flush interval elapsed
+                self._flush(pending)
+                pending = []
+                continue
+
+            if kind == "save":
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(payload)
+                if len(pending) >= self.batch_size:
+                    self._flush(pending)
+                    pending = []
+                continue
+
+            # "flush" / "stop": the queue is FIFO, so every earlier save is in `pending`
+            self._flush(pending)
+            pending = []
+            payload.set()
+            if kind == "stop":
+                return
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        texts = [text for _, text, _ in pending]
+        try:
+            vectors = self.manager._embed_batch(texts)
+        except Exception as e:
+            logger.error(f"Batch embedding failed for {len(pending)} memories: {e}")
+            self.failed += len(pending)
+            return
+
+        records = []
+        for (employee_id, text, timestamp), vector in zip(pending, vectors):
+            metadata = {"employee_id": employee_id, "timestamp": timestamp, "text": text}
+            records.append((str(uuid.uuid4()), vector, metadata))
+
+        for i in range(0, len(records), self.upsert_chunk):
+            chunk = records[i:i + self.upsert_chunk]
+            self.manager._memory_saving(chunk)
+            try:
+                with span("index_upsert"):
+                    self.manager.index.upsert(vectors=chunk)
+                self.saved += len(chunk)
+            except Exception as e:
+                logger.error(f"Pinecone Batch Upsert Failed ({len(chunk)} vectors): {e}")
+                self.failed += len(chunk)
+                continue
+            self.manager._memory_saved(chunk)
+
 class VectorMemoryManager:
     """
     Manages interactions with Pinecone for storage and retrieval.
     Strictly uses metadata filtering for employee isolation.
     Refactored to use native pinecone-client to avoid langchain-pinecone dependency issues.
     """
-    def __init__(self):
+    def __init__(self, embeddings=None, index=None, embedding_cache=None, backend: str = MEMORY_BACKEND,
+                 excuse_clusters=None):
+        # embeddings/index can be injected (e.g. the local fakes used by the benchmarks)
         # We assume keys are set in env by the caller
-        self.embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+        if embeddings is None:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+        self.embeddings = embeddings
+        # Shared by search and save, so a turn's text is embedded only once
+        self.embedding_cache = embedding_cache or EmbeddingCache()
+        self.writer = MemoryWriteBehind(self) if MEMORY_WRITE_BEHIND else None
+        # Updated on every successful save; gives search the exact repeat count
+        if excuse_clusters is None and EXCUSE_CLUSTERS_ENABLED:
+            excuse_clusters = ExcuseClusters()
+        self.excuse_clusters = excuse_clusters
+        # Called with an employee_id after that employee's memories are written or deleted
+        self.change_listeners = [_on_memory_changed]
+        # Employees saved to since the last compaction pass
+        self._uncompacted = set()
+        self._compact_lock = threading.Lock()
+        # Per employee: held by cluster updates and by compaction from its scan to the rebuild
+        self._employee_locks: Dict[str, threading.Lock] = {}
+        # Per employee: id -> [vector, metadata, saved_at, state] for saves in the last MEMORY_INDEX_LAG;
+        # state is "saving" (upsert not confirmed), "clustered", or "rebuilt" (a compaction counted it first)
+        self._recent: Dict[str, Dict[str, list]] = {}
+        self._compactor = None
+        self._stop_compactor = threading.Event()
+        self.compactions = {"runs": 0, "scanned": 0, "merged": 0, "expired": 0}
+        if index is not None:
+            self.index = index
+            self._fit_clusters_to_index()
+            return
+
+        if backend == "local":
+            from local_index import LocalVectorIndex
+            self.index = LocalVectorIndex(dimension=EMBEDDING_DIM, path=LOCAL_INDEX_PATH)
+            logger.info(f"Local Index Stats: {self.index.describe_index_stats()}")
+            return
+        if backend == "compact":
+            from compact_index import CompactVectorIndex
+            self.index = CompactVectorIndex(dimension=EMBEDDING_DIM, path=COMPACT_INDEX_PATH)
+            logger.info(f"Compact Index Stats: {self.index.describe_index_stats()}")
+            self._fit_clusters_to_index()
+            return
+        if backend != "pinecone":
+            raise ValueError(f"Unknown MEMORY_BACKEND '{backend}' (expected 'pinecone', 'local' or 'compact')")
+
+        from pinecone import Pinecone, ServerlessSpec
         self.pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))
         
         # Ensure index exists (Basic check, usually expected to be pre-created in production)
         existing_indexes = [i.name for i in self.pc.list_indexes()]
         if INDEX_NAME not in existing_indexes:
-            print(f"[WARNING] Index '{INDEX_NAME}' not found. Creating it...")
+            logger.warning(f"Index '{INDEX_NAME}' not found. Creating it...")
             self.pc.create_index(
                 name=INDEX_NAME,
-                dimension=768, 
+                dimension=EMBEDDING_DIM, 
                 metric="cosine",
                 spec=ServerlessSpec(cloud="aws", region="us-east-1") # Example spec
             )
@@ -41,13 +560,24 @@ class VectorMemoryManager:
         # Debug Index Stats
         try:
             stats = self.index.describe_index_stats()
-            print(f"[INFO] Pinecone Index Stats: {stats}")
+            logger.info(f"Pinecone Index Stats: {stats}")
         except Exception as e:
-            print(f"[WARNING] Could not fetch index stats: {e}")
+            logger.warning(f"Could not fetch index stats: {e}")
+
+    def _fit_clusters_to_index(self):
+        # Without re-ranking the compact backend returns only its stored leading dimensions,
+        # and compaction rebuilds the clusters from those, so cluster at that size throughout
+        dims = getattr(self.index, "dims", None)
+        if (self.excuse_clusters is not None and self.excuse_clusters.dims is None
+                and dims and not getattr(self.index, "rerank", True)):
+            self.excuse_clusters.dims = dims
 
-    def execute(self, action: str, employee_id: str, text: str = "") -> Dict[str, Any]:
+    def execute(self, action: str, employee_id: str, text: str = "", since: float = None,
+                timestamp: float = None) -> Dict[str, Any]:
         """
         Executes memory operations: save or search.
+        For search, `since` (epoch seconds) limits matches to memories last seen after it.
+        For save, `timestamp` is when the excuse was given (default: now).
         """
         if action == "save":
             if not text:
@@ -55,244 +585,775 @@ class VectorMemoryManager:
             
             # Generate embedding
             try:
-                vector = self.embeddings.embed_query(text)
+                vector = self._embed(text)
             except Exception as e:
                 return {"status": "error", "message": f"Embedding failed: {e}"}
 
-            # Add timestamp to metadata for potential temporal logic
-            metadata = {
-                "employee_id": employee_id, 
-                "timestamp": time.time(),
-                "text": text
-            }
-            
-            # Upsert to Pinecone
-            doc_id = str(uuid.uuid4())
-            try:
-                self.index.upsert(vectors=[(doc_id, vector, metadata)])
-                return {"status": "success", "message": "Memory saved"}
-            except Exception as e:
-                print(f"[ERROR] Pinecone Upsert Failed: {e}")
-                return {"status": "error", "message": f"Upsert failed: {e}"}
+            return self._save(employee_id, text, vector, timestamp)
 
         elif action == "search":
-            # Search for semantically similar past excuses
-            # Filtering STRICTLY by employee_id
-            filter_dict = {"employee_id": {"$eq": employee_id}}
-            
             # Generate embedding for query
             try:
-                query_vector = self.embeddings.embed_query(text)
+                query_vector = self._embed(text)
             except Exception as e:
                 return {"status": "error", "message": f"Embedding failed: {e}"}
 
-            # Query Pinecone
+            return self._search(employee_id, query_vector, since)
+        
+        return {"status": "error", "message": "Invalid action"}
+
+    async def aexecute(self, action: str, employee_id: str, text: str = "", since: float = None,
+                       timestamp: float = None) -> Dict[str, Any]:
+        """
+        Async variant of execute().
+        Embeds through the async Gemini client and runs the blocking Pinecone
+        round trip in a worker thread so the event loop stays free.
+        """
+        if action not in ("save", "search"):
+            return {"status": "error", "message": "Invalid action"}
+        if action == "save" and not text:
+            return {"status": "error", "message": "No text to save"}
+
+        try:
+            vector = await self._aembed(text)
+        except Exception as e:
+            return {"status": "error", "message": f"Embedding failed: {e}"}
+
+        if action == "save":
+            return await asyncio.to_thread(self._save, employee_id, text, vector, timestamp)
+        return await asyncio.to_thread(self._search, employee_id, vector, since)
+
+    def enqueue_save(self, employee_id: str, text: str, timestamp: float = None) -> Dict[str, Any]:
+        """
+        Queues a save on the write-behind writer; falls back to a direct write
+        if write-behind is disabled or its queue is full.
+        """
+        if not text:
+            return {"status": "error", "message": "No text to save"}
+        if self.writer and self.writer.enqueue(employee_id, text, timestamp):
+            return {"status": "queued", "message": "Memory queued"}
+        return self.execute(action="save", employee_id=employee_id, text=text, timestamp=timestamp)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until saves from finished turns are written. Saves are handed over
+        after the reply, so pending side effects are drained first.
+        """
+        side_effects.drain(timeout)
+        return self.writer.flush(timeout) if self.writer else True
+
+    def close(self, timeout: float = 10.0):
+        # Saves still in the side-effect pool reach the writer before it stops
+        side_effects.drain(timeout)
+        if self.writer:
+            self.writer.close(timeout)
+        self._stop_compactor.set()
+        # Local backend persists its matrices on shutdown
+        if hasattr(self.index, "close"):
+            self.index.close()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self.embedding_cache.get(t) for t in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            # Same task type as embed_query so saved vectors share the query embedding space
+            with span("embed_batch"):
+                embedded = self.embeddings.embed_documents(missing, task_type="RETRIEVAL_QUERY")
+            for text, vector in zip(missing, embedded):
+                self.embedding_cache.put(text, vector)
+            lookup = dict(zip(missing, embedded))
+            vectors = [v if v is not None else lookup[t] for t, v in zip(texts, vectors)]
+        return vectors
+
+    def _embed(self, text: str) -> List[float]:
+        vector = self.embedding_cache.get(text)
+        if vector is None:
+            with span("embed"):
+                vector = self.embeddings.embed_query(text)
+            self.embedding_cache.put(text, vector)
+        return vector
+
+    async def _aembed(self, text: str) -> List[float]:
+        vector = self.embedding_cache.get(text)
+        if vector is None:
+            with span("embed"):
+                vector = await self.embeddings.aembed_query(text)
+            self.embedding_cache.put(text, vector)
+        return vector
+
+    def _save(self, employee_id: str, text: str, vector: List[float], timestamp: float = None) -> Dict[str, Any]:
+        # Add timestamp to metadata for potential temporal logic
+        metadata = {
+            "employee_id": employee_id, 
+            "timestamp": time.time() if timestamp is None else timestamp,
+            "text": text
+        }
+        
+        # Upsert to Pinecone
+        record = (str(uuid.uuid4()), vector, metadata)
+        self._memory_saving([record])
+        try:
+            with span("index_upsert"):
+                self.index.upsert(vectors=[record])
+        except Exception as e:
+            logger.error(f"Pinecone Upsert Failed: {e}")
+            return {"status": "error", "message": f"Upsert failed: {e}"}
+        self._memory_saved([record])
+        return {"status": "success", "message": "Memory saved"}
+
+    def _employee_lock(self, employee_id: str) -> threading.Lock:
+        with self._compact_lock:
+            return self._employee_locks.setdefault(employee_id, threading.Lock())
+
+    def _recent_saves(self, employee_id: str) -> Dict[str, list]:
+        # Caller holds the employee's lock
+        recent = self._recent.setdefault(employee_id, {})
+        horizon = time.time() - MEMORY_INDEX_LAG
+        for doc_id in [k for k, entry in recent.items() if entry[2] < horizon]:
+            del recent[doc_id]
+        return recent
+
+    def _memory_saving(self, records):
+        # records: the (id, vector, metadata) tuples about to be upserted
+        if self.excuse_clusters is None:
+            return
+        now = time.time()
+        for doc_id, vector, metadata in records:
+            with self._employee_lock(metadata["employee_id"]):
+                self._recent_saves(metadata["employee_id"])[doc_id] = [vector, metadata, now, "saving"]
+
+    def _memory_saved(self, records):
+        # records: the (id, vector, metadata) tuples just upserted
+        if self.excuse_clusters is not None:
+            for doc_id, vector, metadata in records:
+                employee_id = metadata["employee_id"]
+                with self._employee_lock(employee_id):
+                    recent = self._recent_saves(employee_id)
+                    entry = recent.get(doc_id)
+                    if entry is not None:
+                        if entry[3] == "rebuilt":
+                            del recent[doc_id]
+                            continue
+                        entry[3] = "clustered"
+                    try:
+                        self.excuse_clusters.add(employee_id, vector, metadata["text"], metadata["timestamp"])
+                    except Exception as e:
+                        logger.warning(f"Excuse cluster update failed for {employee_id}: {e}")
+        employee_ids = {metadata["employee_id"] for _, _, metadata in records}
+        with self._compact_lock:
+            self._uncompacted.update(employee_ids)
+        self._ensure_compactor()
+        self._memory_changed(employee_ids)
+
+    def _memory_changed(self, employee_ids):
+        for employee_id in employee_ids:
+            for listener in self.change_listeners:
+                try:
+                    listener(employee_id)
+                except Exception as e:
+                    logger.warning(f"Memory change listener failed for {employee_id}: {e}")
+
+    def _search(self, employee_id: str, query_vector: List[float], since: float = None) -> Dict[str, Any]:
+        # Search for semantically similar past excuses
+        # Filtering STRICTLY by employee_id
+        filter_dict = {"employee_id": {"$eq": employee_id}}
+        if since is not None:
+            filter_dict["timestamp"] = {"$gte": since}
+
+        # Query Pinecone
+        with span("index_query"):
             results = self.index.query(
                 vector=query_vector,
                 top_k=5, # Fetch top 5 to have enough history
                 filter=filter_dict,
                 include_metadata=True
             )
-            
-            # Format results for the LLM
-            formatted_results = []
-            for match in results.get('matches', []):
-                formatted_results.append({
-                    "content": match['metadata'].get('text', ''),
-                    "score": match['score'],
-                    "metadata": match['metadata']
-                })
-            
-            return {"status": "success", "matches": formatted_results}
         
-        return {"status": "error", "message": "Invalid action"}
+        # Format results for the LLM
+        formatted_results = []
+        for match in results.get('matches', []):
+            formatted_results.append({
+                "id": match.get('id'),
+                "content": match['metadata'].get('text', ''),
+                "score": match['score'],
+                "metadata": match['metadata']
+            })
 
-def notify_hierarchy(level: str, message: str):
+        # The clusters count every saved excuse; the matches only see the top 5. Excuses
+        # saved before the clusters existed are only in the index, hence the max().
+        similar_count = _count_similar_excuses(formatted_results)
+        if self.excuse_clusters is not None:
+            similar_count = max(similar_count, self.excuse_clusters.count(employee_id, query_vector, since))
+
+        return {"status": "success", "matches": formatted_results, "similar_count": similar_count}
+
+    def compact(self, employee_id: str, threshold: float = MEMORY_DEDUPE_THRESHOLD,
+                retention_days: float = MEMORY_RETENTION_DAYS) -> Dict[str, int]:
+        """
+        Merges the employee's near-duplicate memories and deletes those past retention.
+        Each merged group keeps its newest record, with `count` summed, `first_seen` the
+        earliest and `timestamp` the latest of the group. The excuse clusters are then
+        rebuilt from what is left, so expired excuses stop counting toward escalations.
+        """
+        # Saves landing meanwhile wait for the rebuild, so it cannot wipe their cluster update
+        with self._employee_lock(employee_id):
+            return self._compact(employee_id, threshold, retention_days)
+
+    def _compact(self, employee_id: str, threshold: float, retention_days: float) -> Dict[str, int]:
+        records = self._employee_records(employee_id)
+        cutoff = time.time() - retention_days * 86400 if retention_days > 0 else None
+        expired, live = [], []
+        for record in records:
+            stale = cutoff is not None and float(record[2].get("timestamp") or 0) < cutoff
+            (expired if stale else live).append(record)
+        live.sort(key=lambda r: float(r[2].get("timestamp") or 0))
+
+        # Greedy grouping against each group's first (oldest) record
+        groups: List[List[Any]] = []
+        for record in live:
+            for group in groups:
+                if _cosine(group[0][1], record[1]) >= threshold:
+                    group.append(record)
+                    break
+            else:
+                groups.append([record])
+
+        merged, doomed, kept = [], [r[0] for r in expired], []
+        for group in groups:
+            doc_id, vector, metadata = group[-1]
+            if len(group) > 1:
+                metadata = {
+                    **metadata,
+                    "count": sum(int(r[2].get("count", 1)) for r in group),
+                    "first_seen": min(float(r[2].get("first_seen", r[2].get("timestamp") or 0)) for r in group),
+                    "timestamp": max(float(r[2].get("timestamp") or 0) for r in group),
+                }
+                merged.append((doc_id, vector, metadata))
+                doomed.extend(r[0] for r in group[:-1])
+            kept.append((doc_id, vector, metadata))
+
+        # Merged records are written before their duplicates go, so counts never dip
+        for i in range(0, len(merged), MEMORY_UPSERT_CHUNK):
+            with span("index_upsert"):
+                self.index.upsert(vectors=merged[i:i + MEMORY_UPSERT_CHUNK])
+        for i in range(0, len(doomed), 1000):
+            with span("index_delete"):
+                self.index.delete(ids=doomed[i:i + 1000])
+
+        if merged or doomed:
+            if self.excuse_clusters is not None:
+                scanned = {r[0] for r in records}
+                recent = self._recent_saves(employee_id)
+                fresh = []
+                for doc_id, entry in list(recent.items()):
+                    if doc_id in scanned:
+                        if entry[3] == "saving":
+                            entry[3] = "rebuilt"  # counted by the rebuild; its own update is skipped
+                        else:
+                            del recent[doc_id]
+                    elif entry[3] == "clustered":
+                        fresh.append((doc_id, entry[0], entry[1]))  # in the clusters, not yet in queries
+                self.excuse_clusters.rebuild(employee_id, kept + fresh)
+            self._memory_changed({employee_id})
+        result = {"scanned": len(records), "merged": len(doomed) - len(expired), "expired": len(expired)}
+        with self._compact_lock:
+            self.compactions["runs"] += 1
+            for key, value in result.items():
+                self.compactions[key] += value
+        return {**result, "kept": len(kept)}
+
+    def compact_pending(self) -> Dict[str, int]:
+        """
+        Compacts every employee saved to since the last pass.
+        """
+        with self._compact_lock:
+            employee_ids, self._uncompacted = self._uncompacted, set()
+        totals = {"employees": 0, "scanned": 0, "merged": 0, "expired": 0, "kept": 0}
+        for employee_id in employee_ids:
+            try:
+                result = self.compact(employee_id)
+            except Exception as e:
+                logger.error(f"Memory compaction failed for {employee_id}: {e}")
+                with self._compact_lock:
+                    self._uncompacted.add(employee_id)
+                continue
+            totals["employees"] += 1
+            for key, value in result.items():
+                totals[key] += value
+        if totals["merged"] or totals["expired"]:
+            logger.info(f"Memory compaction: {totals}")
+        return totals
+
+    def _employee_records(self, employee_id: str) -> List[Any]:
+        # Pinecone has no "list by metadata", so one filtered query with a constant probe
+        # vector returns the employee's records (up to MEMORY_COMPACT_SCAN per pass)
+        probe = [1.0] * EMBEDDING_DIM
+        with span("index_query"):
+            results = self.index.query(vector=probe, top_k=MEMORY_COMPACT_SCAN,
+                                       filter={"employee_id": {"$eq": employee_id}},
+                                       include_metadata=True, include_values=True)
+        return [(m["id"], m.get("values") or [], m.get("metadata") or {}) for m in results.get("matches", [])]
+
+    def _ensure_compactor(self):
+        if self._compactor is not None or MEMORY_COMPACT_INTERVAL <= 0:
+            return
+        with self._compact_lock:
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._run_compactor, name="memory-compactor", daemon=True)
+                self._compactor.start()
+
+    def _run_compactor(self):
+        while not self._stop_compactor.wait(MEMORY_COMPACT_INTERVAL):
+            self.compact_pending()
+
+def notify_hierarchy(level: str, message: str, employee_id: str = None, reason: str = None):
     """
-    Stub for WhatsApp notification logic.
+    Queues a WhatsApp notification for the team leader or manager.
+    Delivery, per-recipient digests and retries are handled by notifications.py;
+    the same employee and reason is sent once per digest.
     """
-    prefix = ""
-    if level == "team_leader":
-        prefix = "[ALERT - WHATSAPP TO TL]"
-    elif level == "manager":
-        prefix = "[CRITICAL - WHATSAPP TO MANAGER]"
-    else:
-        prefix = "[WHATSAPP]"
-        
-    print(f"\n{prefix}: {message}\n")
-    return "Notification sent."
+    notifications.notify(level, message, employee_id=employee_id, reason=reason)
+    return "Notification queued."
 
 # --- 2. State Definition ---
 
+# Written to `messages` to end the conversation; the next turn starts with empty history
+RESET_CONVERSATION = "__reset_conversation__"
+
+def bounded_messages(existing: List[BaseMessage], new: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Reducer for `messages`: appends the new messages and keeps the last SESSION_MAX_MESSAGES.
+    """
+    merged = list(existing or []) + list(new or [])
+    if RESET_CONVERSATION in merged:
+        merged = merged[len(merged) - merged[::-1].index(RESET_CONVERSATION):]
+    return merged[-SESSION_MAX_MESSAGES:]
+
 class AgentState(TypedDict):
     employee_id: str
     current_input: str
     memory_context: List[Dict]
     analysis_decision: str
     response: str
-    messages: List[BaseMessage]
+    messages: Annotated[List[BaseMessage], bounded_messages]
+    similar_count: int  # past excuses similar to current_input (see ExcuseClusters)
+    timestamp: float  # when the message was sent, if not now (batch_agent.py backfills)
+    decided_by: str  # "rules", "cache", "llm" or "fallback"
 
 # --- 3. LangGraph Nodes ---
 
-# Initialize global tools
-# Lazy logic to ensure we don't crash on import if env vars missing, but init happens in node or main
-try:
-    memory_manager = VectorMemoryManager()
-except Exception as e:
-    print(f"[WARNING] Memory Manager Init Warning (Ignore if just importing): {e}")
-    memory_manager = None
+# Global tools, created on first use (or by warm_up()) rather than at import time.
+# Either can be assigned directly, e.g. with the fakes used by the benchmarks.
+memory_manager = None
+llm = None
 
-llm = ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0, google_api_key=os.environ.get("GOOGLE_API_KEY"))
+# "pending" -> "ready" | "failed" (memory: "failed" -> "ready" on a later retry)
+_init_state = {"graph": "pending", "memory": "pending", "llm": "pending"}
+_init_locks = {name: threading.Lock() for name in _init_state}
+_memory_retry_at = 0.0  # time.monotonic() after which a failed memory init is tried again
 
-def search_memory_node(state: AgentState):
+def _memory_init_due() -> bool:
+    state = _init_state["memory"]
+    return state == "pending" or (state == "failed" and MEMORY_INIT_RETRY > 0
+                                  and time.monotonic() >= _memory_retry_at)
+
+def get_memory_manager():
     """
-    Embeds current input and searches Pinecone for history.
+    Returns the shared VectorMemoryManager, connecting on first call.
+    Returns None if the memory backend is unavailable (the agent then runs without memory);
+    the connect is retried on a later call, at most every MEMORY_INIT_RETRY seconds.
     """
-    print("--- [SEARCH] SEARCHING MEMORY ---")
-    emp_id = state["employee_id"]
-    text = state["current_input"]
-    
-    if not memory_manager:
-        return {"memory_context": []}
+    global memory_manager, _memory_retry_at
+    if memory_manager is None and _memory_init_due():
+        with _init_locks["memory"]:
+            if memory_manager is None and _memory_init_due():
+                try:
+                    memory_manager = VectorMemoryManager()
+                    _init_state["memory"] = "ready"
+                except Exception as e:
+                    retry = f", retrying in {MEMORY_INIT_RETRY:g}s" if MEMORY_INIT_RETRY > 0 else ""
+                    logger.warning(f"Memory Manager Init Failed, continuing without memory{retry}: {e}")
+                    _init_state["memory"] = "failed"
+                    _memory_retry_at = time.monotonic() + MEMORY_INIT_RETRY
+    return memory_manager
 
-    result = memory_manager.execute(action="search", employee_id=emp_id, text=text)
-    
+def get_llm():
+    """
+    Returns the shared Gemini chat model, created on first call.
+    """
+    global llm
+    if llm is None:
+        with _init_locks["llm"]:
+            if llm is None:
+                try:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    from llm_client import guarded
+                    # Retries, pacing and the circuit breaker live in the guard, so the
+                    # client itself makes a single attempt per call
+                    llm = guarded(ChatGoogleGenerativeAI(model=LLM_MODEL, temperature=0, max_retries=1,
+                                                         google_api_key=os.environ.get("GOOGLE_API_KEY")))
+                    registry.collector("attendance_llm_guard", "LLM rate-limit guard counters", llm.guard.stats)
+                except Exception:
+                    _init_state["llm"] = "failed"
+                    raise
+                _init_state["llm"] = "ready"
+    return llm
+
+async def aget_memory_manager():
+    # Connecting to Pinecone blocks, so the first call runs in a worker thread
+    if memory_manager is not None or not _memory_init_due():
+        return memory_manager
+    return await asyncio.to_thread(get_memory_manager)
+
+async def aget_llm():
+    if llm is not None:
+        return llm
+    return await asyncio.to_thread(get_llm)
+
+def shutdown_memory():
+    """
+    Drains post-reply side effects and queued memory saves. Registered with atexit;
+    servers also call it on shutdown.
+    """
+    if memory_manager:
+        memory_manager.close()
+    else:
+        side_effects.drain(10.0)
+
+atexit.register(shutdown_memory)
+
+def _log_search_result(result: Dict[str, Any]) -> Dict[str, Any]:
     if result.get("status") == "error":
-        print(f"[ERROR] Search Failed: {result.get('message')}")
+        logger.error(f"Search Failed: {result.get('message')}")
     
     matches = result.get("matches", [])
-    print(f"[DEBUG] Found {len(matches)} matches. Top scores: {[m.get('score') for m in matches]}")
-    return {"memory_context": matches}
-    
-# ... (reasoning_node stays the same) ...
+    logger.debug(f"Found {len(matches)} matches. Top scores: {[m.get('score') for m in matches]}")
+    return {"memory_context": matches,
+            "similar_count": result.get("similar_count", _count_similar_excuses(matches))}
 
-# ... (escalation_node stays same) ...
+def _search_since(state: AgentState):
+    # Relative to when the message was sent, so backfilled check-ins see their own window
+    now = state.get("timestamp") or time.time()
+    return now - MEMORY_SEARCH_WINDOW_DAYS * 86400 if MEMORY_SEARCH_WINDOW_DAYS > 0 else None
 
-def save_memory_node(state: AgentState):
+def search_memory_node(state: AgentState):
     """
-    Saves the current interaction to Pinecone.
+    Embeds current input and searches Pinecone for history.
     """
-    decision = state.get("analysis_decision", "")
-    
-    # Don't save partial conversations
-    if decision in ["ASK_REASON", "ASK_TRANSPORT"]:
-        print(f"--- [SAVE] SKIPPING SAVE (Gathering info: {decision}) ---")
-        return {}
-        
-    print("--- [SAVE] SAVING MEMORY ---")
+    logger.debug("[SEARCH] SEARCHING MEMORY")
     emp_id = state["employee_id"]
     text = state["current_input"]
     
-    if memory_manager:
-        # Ideally save accumulated reason, but triggering text is okay for matching
-        if "messages" in state:
-             # Try to find user messages
-             user_msgs = [m.content for m in state["messages"] if isinstance(m, HumanMessage)]
-             full_context = " ".join(user_msgs[-3:]) # Last 3 user inputs
-             text = full_context
-             
-        res = memory_manager.execute(action="save", employee_id=emp_id, text=text)
-        print(f"[DEBUG] Save Result: {res}")
-        if res.get("status") == "error":
-            print(f"[ERROR] Save Failed: {res.get('message')}")
-    return {}
+    mm = get_memory_manager()
+    if not mm:
+        return {"memory_context": [], "similar_count": 0}
 
-def reasoning_node(state: AgentState):
+    result = mm.execute(action="search", employee_id=emp_id, text=text, since=_search_since(state))
+    return _log_search_result(result)
+
+async def asearch_memory_node(state: AgentState):
     """
-    Analyzes current input vs memory context to decide actions.
+    Async variant of search_memory_node, used by app.ainvoke.
     """
-    print("--- [REASON] REASONING ---")
-    memory = state["memory_context"]
-    current_text = state["current_input"]
-    history = state.get("messages", [])
-    
-    # Format history for LLM
-    history_text = "\n".join([f"{type(m).__name__}: {m.content}" for m in history[-5:]])
-    
-    # Logic:
-    # 1. Check if "Virar" + "Bus" in current AND NOT in memory (First time).
-    # 2. Check max similarity score for escalation triggers.
+    logger.debug("[SEARCH] SEARCHING MEMORY")
+    emp_id = state["employee_id"]
+    text = state["current_input"]
     
-    prompt = f"""
-    You are an Attendance Manager Agent. 
+    mm = await aget_memory_manager()
+    if not mm:
+        return {"memory_context": [], "similar_count": 0}
+
+    result = await mm.aexecute(action="search", employee_id=emp_id, text=text, since=_search_since(state))
+    return _log_search_result(result)
+
+# --- Fast-Path Rules ---
+# Formulaic turns (greetings, a reason without transport, repeat offenders) are decided
+# here without a model call; anything the rules are not confident about goes to the LLM.
+
+# Words that carry no reason: greetings, check-in phrases and "sorry, running late"
+FILLER_WORDS = {
+    "hi", "hii", "hello", "hey", "namaste", "good", "morning", "afternoon", "evening",
+    "start", "login", "log", "in", "check", "checkin", "check-in", "checking", "here",
+    "present", "reached", "ok", "okay", "sir", "madam", "maam", "i", "am", "im", "i'm",
+    "is", "will", "be", "coming", "running", "little", "bit", "a", "late", "today",
+    "sorry", "please", "mins", "minutes", "min", "thanks", "thank", "you",
+}
+GREETING_WORDS = {"hi", "hii", "hello", "hey", "namaste", "good", "start", "login", "checkin", "check-in"}
+TRANSPORT_WORDS = {
+    "bus", "buses", "train", "trains", "local", "metro", "auto", "rickshaw", "cab", "taxi",
+    "uber", "ola", "rapido", "bike", "scooter", "scooty", "car", "walk", "walked", "walking",
+    "drive", "drove", "driving", "cycle", "bicycle", "ferry", "tram", "shuttle", "carpool",
+}
+REASON_WORDS = {
+    "traffic", "jam", "stuck", "delay", "delayed", "rain", "raining", "flood", "flooded",
+    "waterlogging", "sick", "ill", "fever", "unwell", "doctor", "hospital", "accident",
+    "breakdown", "broke", "broken", "puncture", "missed", "overslept", "alarm", "emergency",
+    "strike", "cancelled", "canceled", "crowd", "crowded", "diversion", "construction",
+}
+
+class FastPathStats:
+    """
+    Counts how many turns the fast-path rules decide without the LLM.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.short_circuited = 0
+        self.by_rule: Dict[str, int] = {}
+
+    def record(self, rule: str = None):
+        with self._lock:
+            self.turns += 1
+            if rule:
+                self.short_circuited += 1
+                self.by_rule[rule] = self.by_rule.get(rule, 0) + 1
+
+    def rate(self) -> float:
+        return self.short_circuited / self.turns if self.turns else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "short_circuited": self.short_circuited,
+                "rate": round(self.rate(), 4),
+                "by_rule": dict(self.by_rule),
+            }
+
+fast_path_stats = FastPathStats()
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z]+(?:[-'][a-z]+)?", text.lower())
+
+def _count_similar_excuses(memory: List[Dict]) -> int:
+    # A compacted memory stands for `count` excuses
+    return sum(int(m.get('metadata', {}).get('count', 1)) for m in memory if m.get('score', 0) > SIMILARITY_THRESHOLD)
+
+def _similar_count(state: AgentState) -> int:
+    # Set by the search node; recount the matches for states built without it
+    count = state.get("similar_count")
+    return _count_similar_excuses(state.get("memory_context", [])) if count is None else count
+
+def _user_texts(state: AgentState) -> List[str]:
+    # Recent user turns plus the current input (which may or may not already be in messages)
+    texts = [m.content for m in state.get("messages", []) if isinstance(m, HumanMessage)][-3:]
+    if not texts or texts[-1] != state["current_input"]:
+        texts.append(state["current_input"])
+    return texts
+
+def fast_path_decision(state: AgentState):
+    """
+    Returns (rule_name, decision dict) when a rule is confident, else (None, None).
+    """
+    current_words = _tokenize(state["current_input"])
+    # Empty, emoji-only or number-only input says nothing the rules can read
+    if not current_words or len(current_words) > FAST_PATH_MAX_WORDS:
+        return None, None
+
+    words = set()
+    for text in _user_texts(state):
+        words.update(_tokenize(text))
+
+    # Greeting / "I'm late" with nothing else said yet
+    if words <= FILLER_WORDS:
+        rule = "greeting" if words & GREETING_WORDS else "missing_reason"
+        return rule, {"analysis_decision": "ASK_REASON", "response": "Why are you late?"}
+
+    has_reason = bool(words & REASON_WORDS)
+    has_transport = bool(words & TRANSPORT_WORDS)
+
+    if has_reason and not has_transport:
+        return "missing_transport", {"analysis_decision": "ASK_TRANSPORT", "response": "How did you travel?"}
+
+    if has_reason and has_transport:
+        count = _similar_count(state)
+        if count >= ESCALATION_LIMIT:
+            return "escalate_manager", {"analysis_decision": "ESCALATE_MANAGER",
+                                        "response": "Limit exceeded. Escalating to Manager."}
+        if count > 0:
+            return "escalate_tl", {"analysis_decision": "ESCALATE_TL", "response": "Reason logged. TL Notified."}
+        # First occurrence: the LLM decides whether to suggest an alternative route
+
+    return None, None
+
+def fast_path_node(state: AgentState):
+    """
+    Rule-engine stage between memory search and the LLM.
+    Sets decided_by="rules" when it resolves the turn, so the graph skips reasoning.
+    """
+    if not FAST_PATH_ENABLED:
+        return {"decided_by": ""}
+
+    rule, decision = fast_path_decision(state)
+    fast_path_stats.record(rule)
+    if decision is None:
+        return {"decided_by": ""}
+
+    logger.info(f"[FAST PATH] {decision['analysis_decision']} (rule: {rule}, "
+                f"{fast_path_stats.rate():.0%} of turns short-circuited)")
+    return {**decision, "decided_by": "rules"}
+
+def _route_after_fast_path(state: AgentState) -> str:
+    return "escalate" if state.get("decided_by") == "rules" else "reasoning"
+
+# --- Prompt Context ---
+# Renders history and memory compactly (score, short text, relative date) and keeps
+# them within PROMPT_TOKEN_BUDGET, so prompt size no longer grows with top_k or history.
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token), good enough for budgeting.
+    """
+    return (len(text) + 3) // 4
+
+class PromptStats:
+    """
+    Tracks estimated reasoning prompt sizes across LLM calls.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.last: Dict[str, int] = {}
+
+    def record(self, counts: Dict[str, int]):
+        with self._lock:
+            self.calls += 1
+            self.total_tokens += counts["total"]
+            self.max_tokens = max(self.max_tokens, counts["total"])
+            self.last = dict(counts)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_tokens": round(self.total_tokens / self.calls, 1) if self.calls else 0.0,
+                "max_tokens": self.max_tokens,
+                "last": dict(self.last),
+            }
+
+prompt_stats = PromptStats()
+
+def _relative_date(timestamp, now: float) -> str:
+    if not timestamp:
+        return "unknown date"
+    days = int((now - float(timestamp)) // 86400)
+    if days <= 0:
+        return "today"
+    if days == 1:
+        return "yesterday"
+    return f"{days}d ago"
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+def _memory_lines(memory: List[Dict], now: float) -> List[str]:
+    # Dedupe by normalized text, keeping the best score; highest scores first
+    best: Dict[str, Dict] = {}
+    repeats: Dict[str, int] = {}
+    for m in memory:
+        text = m.get("content") or m.get("metadata", {}).get("text", "")
+        key = EmbeddingCache.normalize(text)
+        if not key:
+            continue
+        repeats[key] = repeats.get(key, 0) + int(m.get("metadata", {}).get("count", 1))
+        if key not in best or m.get("score", 0) > best[key].get("score", 0):
+            best[key] = {**m, "content": text, "key": key}
+    ranked = sorted(best.values(), key=lambda m: m.get("score", 0), reverse=True)
+    return [
+        f"- {m.get('score', 0):.2f} | {_relative_date(m.get('metadata', {}).get('timestamp'), now)} | "
+        f"{_shorten(m['content'], MEMORY_SNIPPET_CHARS)}"
+        + (f" (x{repeats[m['key']]})" if repeats[m["key"]] > 1 else "")
+        for m in ranked
+    ]
+
+def _history_lines(history: List[BaseMessage], current_text: str) -> List[str]:
+    messages = [m for m in history if isinstance(m, BaseMessage)]
+    # The current input is rendered separately
+    if messages and isinstance(messages[-1], HumanMessage) and messages[-1].content == current_text:
+        messages = messages[:-1]
+    return [f"{'Employee' if isinstance(m, HumanMessage) else 'Agent'}: {_shorten(m.content, MEMORY_SNIPPET_CHARS)}"
+            for m in messages]
+
+def _fit_budget(lines: List[str], budget: int, newest_first: bool = False) -> List[str]:
+    kept, used = [], 0
+    for line in (reversed(lines) if newest_first else lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return list(reversed(kept)) if newest_first else kept
+
+def build_prompt_context(state: AgentState, budget: int = None) -> Dict[str, Any]:
+    """
+    Returns the compact history and memory blocks for the reasoning prompt.
+    Memory (best matches first) gets up to half the budget, history (newest first) the rest.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    memory = state.get("memory_context", [])
+    memory_block = _fit_budget(_memory_lines(memory, time.time()), budget // 2)
+    memory_tokens = sum(estimate_tokens(line) + 1 for line in memory_block)
+    history_block = _fit_budget(_history_lines(state.get("messages", []), state["current_input"]),
+                                budget - memory_tokens, newest_first=True)
+    return {
+        "history": "\n".join(history_block) or "(none)",
+        "memory": "\n".join(memory_block) or "(none)",
+        "similar_count": _similar_count(state),
+    }
+
+_REASONING_PROMPT = textwrap.dedent("""\
+    You are an Attendance Manager Agent.
     Conversation History:
-    {history_text}
-    
+    {history}
+
     Current Input: "{current_text}"
-    
-    Past Memory for this Employee (Top Matches):
+
+    Past Memory for this Employee (score | when | excuse):
     {memory}
-    
+    Similar past excuses (score > {threshold:.2f}): {similar_count}
+
     Goal: Identify (1) The Reason for lateness, and (2) The Mode of Transport.
-    
+
     Steps:
     1. If this is the START of conversation (or input is just "hi", "check in", "login") and 'Reason' is missing: Output: ASK_REASON | Why are you late?
     2. If the 'Reason' for lateness is NOT in history or input, output: ASK_REASON | Why are you late?
     3. If 'Transport' is NOT in history or input, output: ASK_TRANSPORT | How did you travel?
     4. If BOTH Reason and Transport are clear, apply these Rules:
-    
-       Rule A: Count semantically similar past excuses (score > 0.60).
-       Rule B: If Count < 3: Output: ESCALATE_TL | Reason logged. (If first time & Virar/Bus, SUGGEST_TRAIN | <advice>).
-       Rule C: If Count >= 3: Output: ESCALATE_MANAGER | Limit exceeded. Escalating to Manager.
-    
+       Rule A: Count semantically similar past excuses (score > {threshold:.2f}).
+       Rule B: If Count < {limit}: Output: ESCALATE_TL | Reason logged. (If first time & Virar/Bus, SUGGEST_TRAIN | <advice>).
+       Rule C: If Count >= {limit}: Output: ESCALATE_MANAGER | Limit exceeded. Escalating to Manager.
+
     Return ONLY the decision keyword followed by a pipe | and the user-facing reply.
-    """
+    """)
+
+def _build_reasoning_prompt(state: AgentState) -> str:
+    context = build_prompt_context(state)
     
-    try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-    except Exception as e:
-        error_msg = str(e)
-        if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-            print(f"[WARNING] Google AI Rate Limit Exceeded (Free Tier). Switching to Fallback.")
-        else:
-            print(f"[ERROR] LLM Invocation Failed: {error_msg}")
-            
-        with open("llm_error.txt", "a", encoding="utf-8") as f:
-            f.write(f"\n{error_msg}")
-        
-        # --- Fallback Logic (Deterministic based on Vector Scores) ---
-        print("[INFO] Switching to Deterministic Fallback Logic.")
-        
-        high_similarity_count = 0
-        for m in memory:
-            if m.get('score', 0) > 0.60:
-                high_similarity_count += 1
-        
-        # Rule 1: First time (implicitly handled if count == 0 and "Virar" check is fuzzy, 
-        # but here we assume if we found no similar history, it's new)
-        # New Rules: 
-        # 0, 1, 2 past similar -> ESCALATE_TL (Provide suggestion on 0)
-        # 3+ past similar -> ESCALATE_MANAGER
-        
-        # Fallback Slot Filling Check
-        # If input looks like a start ("check-in"), assume we need reason
-        triggers = ["check-in", "check in", "hi", "start", "login"]
-        if any(t in current_text.lower() for t in triggers) and len(current_text.split()) < 3:
-            return {"analysis_decision": "ASK_REASON", "response": "Why are you late?"}
-        
-        if high_similarity_count == 0:
-            decision = "ESCALATE_TL"
-            
-            # Smart Fallback Suggestion Logic
-            # If text mentions "bus", "traffic", "stuck" AND any location-like word (heuristic), suggest train.
-            # Simplified: If "bus" or "traffic" mentioned, suggest train.
-            has_mobility_issue = any(w in current_text.lower() for w in ["bus", "traffic", "stuck", "road", "jam"])
-            
-            if has_mobility_issue:
-                 reply = "You might want to try the train next time to avoid traffic. TL Notified."
-            else:
-                 reply = "Reason logged. TL Notified."
-                 
-        elif high_similarity_count < 3:
-            decision = "ESCALATE_TL"
-            reply = "Reason logged. TL Notified."
-        else: # >= 3
-            decision = "ESCALATE_MANAGER"
-            reply = "Limit exceeded. Escalating to Manager."
-
-        return {"analysis_decision": decision, "response": reply}
+    # Logic:
+    # 1. Check if "Virar" + "Bus" in current AND NOT in memory (First time).
+    # 2. Check max similarity score for escalation triggers.
     
+    prompt = _REASONING_PROMPT.format(
+        history=context["history"],
+        current_text=state["current_input"],
+        memory=context["memory"],
+        similar_count=context["similar_count"],
+        threshold=SIMILARITY_THRESHOLD,
+        limit=ESCALATION_LIMIT,
+    )
+    counts = {
+        "total": estimate_tokens(prompt),
+        "history": estimate_tokens(context["history"]),
+        "memory": estimate_tokens(context["memory"]),
+    }
+    prompt_stats.record(counts)
+    logger.debug(f"Prompt tokens (est.): {counts}")
+    return prompt
+
+def _parse_decision(content: str) -> Dict[str, str]:
     # Parse decision
     if "|" in content:
         decision, reply = content.split("|", 1)
@@ -303,7 +1364,215 @@ def reasoning_node(state: AgentState):
     decision = decision.strip()
     reply = reply.strip()
     
-    return {"analysis_decision": decision, "response": reply}
+    return {"analysis_decision": decision, "response": reply, "decided_by": "llm"}
+
+def _fallback_decision(state: AgentState, error: Exception) -> Dict[str, str]:
+    current_text = state["current_input"]
+
+    # Failed attempts are already written to llm_error.txt by the guard (llm_client.py)
+    from llm_client import LLMUnavailable, is_rate_limit
+    if isinstance(error, LLMUnavailable):
+        logger.warning(f"{error}. Switching to Fallback.")
+        fallbacks_total.inc(reason=error.reason)
+    elif is_rate_limit(error):
+        logger.warning(f"Google AI Rate Limit Exceeded (Free Tier). Switching to Fallback.")
+        fallbacks_total.inc(reason="rate_limited")
+    else:
+        logger.error(f"LLM Invocation Failed: {error}")
+        fallbacks_total.inc(reason="error")
+    
+    # --- Fallback Logic (Deterministic based on Vector Scores) ---
+    logger.info("Switching to Deterministic Fallback Logic.")
+    
+    high_similarity_count = _similar_count(state)
+    
+    # Rule 1: First time (implicitly handled if count == 0 and "Virar" check is fuzzy, 
+    # but here we assume if we found no similar history, it's new)
+    # New Rules: 
+    # 0, 1, 2 past similar -> ESCALATE_TL (Provide suggestion on 0)
+    # 3+ past similar -> ESCALATE_MANAGER
+    
+    # Fallback Slot Filling Check
+    # If input looks like a start ("check-in"), assume we need reason
+    triggers = ["check-in", "check in", "hi", "start", "login"]
+    if any(t in current_text.lower() for t in triggers) and len(current_text.split()) < 3:
+        return {"analysis_decision": "ASK_REASON", "response": "Why are you late?", "decided_by": "fallback"}
+    
+    if high_similarity_count == 0:
+        decision = "ESCALATE_TL"
+        
+        # Smart Fallback Suggestion Logic
+        # If text mentions "bus", "traffic", "stuck" AND any location-like word (heuristic), suggest train.
+        # Simplified: If "bus" or "traffic" mentioned, suggest train.
+        has_mobility_issue = any(w in current_text.lower() for w in ["bus", "traffic", "stuck", "road", "jam"])
+        
+        if has_mobility_issue:
+             reply = "You might want to try the train next time to avoid traffic. TL Notified."
+        else:
+             reply = "Reason logged. TL Notified."
+             
+    elif high_similarity_count < ESCALATION_LIMIT:
+        decision = "ESCALATE_TL"
+        reply = "Reason logged. TL Notified."
+    else: # >= 3
+        decision = "ESCALATE_MANAGER"
+        reply = "Limit exceeded. Escalating to Manager."
+
+    return {"analysis_decision": decision, "response": reply, "decided_by": "fallback"}
+
+class DecisionCache:
+    """
+    Bounded LRU + TTL cache of reasoning decisions.
+    Entries built from an employee's own memory matches are tracked per employee and
+    dropped by invalidate() when that employee's memory changes; entries with no
+    memory behind them depend only on the text, so they are shared across employees.
+    """
+    def __init__(self, max_entries: int = DECISION_CACHE_SIZE, ttl: float = DECISION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, employee_id or None, decision)
+        self._by_employee: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key_for(state: AgentState) -> str:
+        memory = state.get("memory_context", [])
+        current_text = state["current_input"]
+        # Match ids with scores rounded to a bucket, so small score jitter still hits
+        fingerprint = sorted(
+            f"{m.get('id') or EmbeddingCache.normalize(m.get('content', ''))}:"
+            f"{int(m.get('score', 0) / DECISION_SCORE_BUCKET)}"
+            for m in memory
+        )
+        history = _history_lines(state.get("messages", []), current_text)[-DECISION_CACHE_HISTORY:]
+        parts = [
+            EmbeddingCache.normalize(current_text),
+            "\n".join(EmbeddingCache.normalize(line) for line in history),
+            ",".join(fingerprint),
+            # The escalation rules depend on this count, so it must match exactly
+            str(_similar_count(state)),
+        ]
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[2])
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, decision: Dict[str, str], employee_id: str = None):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.time() + self.ttl, employee_id, dict(decision))
+            if employee_id is not None:
+                self._by_employee.setdefault(employee_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, employee_id: str):
+        with self._lock:
+            keys = self._by_employee.pop(employee_id, ())
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_employee.clear()
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            keys = self._by_employee.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_employee[entry[1]]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
+
+decision_cache = DecisionCache()
+
+def _on_memory_changed(employee_id: str):
+    # Registered on VectorMemoryManager.change_listeners
+    decision_cache.invalidate(employee_id)
+
+def _cached_decision(state: AgentState):
+    """
+    Returns (decision or None, cache key); the key is None when the cache is disabled.
+    """
+    if not DECISION_CACHE_ENABLED:
+        return None, None
+    key = DecisionCache.key_for(state)
+    decision = decision_cache.get(key)
+    if decision is not None:
+        logger.debug(f"Decision cache hit: {decision['analysis_decision']}")
+        decision["decided_by"] = "cache"
+    return decision, key
+
+def _remember_decision(state: AgentState, key: str, decision: Dict[str, str]) -> Dict[str, str]:
+    # Only LLM decisions are cached; fallback decisions are retried on the next turn
+    if key is not None and decision.get("decided_by") == "llm":
+        owner = state["employee_id"] if state.get("memory_context") else None
+        decision_cache.put(key, decision, employee_id=owner)
+    return decision
+
+def reasoning_node(state: AgentState):
+    """
+    Analyzes current input vs memory context to decide actions.
+    """
+    logger.debug("[REASON] REASONING")
+    cached, cache_key = _cached_decision(state)
+    if cached is not None:
+        return cached
+    prompt = _build_reasoning_prompt(state)
+    
+    try:
+        with span("llm"):
+            response = get_llm().invoke(prompt)
+        content = response.content.strip()
+    except Exception as e:
+        return _fallback_decision(state, e)
+    
+    return _remember_decision(state, cache_key, _parse_decision(content))
+
+async def areasoning_node(state: AgentState):
+    """
+    Async variant of reasoning_node, used by app.ainvoke.
+    """
+    logger.debug("[REASON] REASONING")
+    cached, cache_key = _cached_decision(state)
+    if cached is not None:
+        return cached
+    prompt = _build_reasoning_prompt(state)
+    
+    try:
+        model = await aget_llm()
+        with span("llm"):
+            response = await model.ainvoke(prompt)
+        content = response.content.strip()
+    except Exception as e:
+        return _fallback_decision(state, e)
+    
+    return _remember_decision(state, cache_key, _parse_decision(content))
 
 def escalation_node(state: AgentState):
     """
@@ -312,9 +1581,14 @@ def escalation_node(state: AgentState):
     decision = state["analysis_decision"]
     response = state["response"]
     emp_id = state["employee_id"]
+    decisions_total.inc(decision=decision, decided_by=state.get("decided_by", ""))
     
+    # Notifications don't change the reply: they are only queued here (see notifications.py)
+    reason = state["current_input"]
     if decision == "ESCALATE_TL":
-        notify_hierarchy("team_leader", f"Employee {emp_id} is late again. Reason: {state['current_input']}")
+        repeats = _similar_count(state)
+        notify_hierarchy("team_leader", f"Employee {emp_id} is late again ({repeats} similar past excuses). "
+                                        f"Reason: {reason}", employee_id=emp_id, reason=reason)
     elif decision == "ESCALATE_MANAGER":
         # Specific User Requested Message Pattern
         # "I have given the suggestion for coming early but employee {name} doesn't listen 
@@ -323,42 +1597,220 @@ def escalation_node(state: AgentState):
         msg = (f"I have given the suggestion for coming early but employee {emp_id} doesn't listen "
                f"and I had also informed the Team Leader (TL) but no actions were taken. "
                f"Current Reason: {state['current_input']}")
-        notify_hierarchy("manager", msg)
+        notify_hierarchy("manager", msg, employee_id=emp_id, reason=reason)
     elif decision == "SUGGEST_TRAIN":
         # Usually checking early, but we can append to response
         pass
         
-    return {"response": response} # Pass through the response
+    # Pass through the response, and record it in the conversation for the next turn
+    return {"response": response, "messages": [AIMessage(content=response)]}
 
-def save_memory_node(state: AgentState):
+def _memory_text_to_save(state: AgentState):
     """
-    Saves the current interaction to Pinecone.
+    Returns the text to persist for this turn, or None if the turn should not be saved.
     """
-    print("--- [SAVE] SAVING MEMORY ---")
-    emp_id = state["employee_id"]
+    decision = state.get("analysis_decision", "")
+    
+    # Don't save partial conversations
+    if decision in ["ASK_REASON", "ASK_TRANSPORT"]:
+        logger.debug(f"[SAVE] SKIPPING SAVE (Gathering info: {decision})")
+        return None
+        
+    logger.debug("[SAVE] SAVING MEMORY")
     text = state["current_input"]
     
-    if memory_manager:
-        memory_manager.execute(action="save", employee_id=emp_id, text=text)
+    # Ideally save accumulated reason, but triggering text is okay for matching
+    if "messages" in state:
+         # Try to find user messages
+         user_msgs = [m.content for m in state["messages"] if isinstance(m, HumanMessage)]
+         full_context = " ".join(user_msgs[-3:]) # Last 3 user inputs
+         text = full_context
+    return text
+
+def _save_turn(mm, employee_id: str, text: str, timestamp: float = None):
+    res = mm.enqueue_save(employee_id=employee_id, text=text, timestamp=timestamp)
+    logger.debug(f"Save Result: {res}")
+    if res.get("status") == "error":
+        # Counted as a failed side effect
+        raise RuntimeError(f"Save Failed: {res.get('message')}")
+
+def save_memory_node(state: AgentState):
+    """
+    Saves the current interaction to Pinecone, after the reply.
+    """
+    text = _memory_text_to_save(state)
+    mm = get_memory_manager()
+    if text is None or not mm:
+        return {}
+
+    # Usually only enqueues on the write-behind writer, but falls back to a direct
+    # write when its queue is full; neither needs to hold up the reply
+    after_reply("save_memory", _save_turn, mm, state["employee_id"], text, state.get("timestamp"))
     return {}
 
+async def asave_memory_node(state: AgentState):
+    """
+    Async variant of save_memory_node, used by app.ainvoke.
+    """
+    text = _memory_text_to_save(state)
+    mm = await aget_memory_manager()
+    if text is None or not mm:
+        return {}
+
+    after_reply("save_memory", _save_turn, mm, state["employee_id"], text, state.get("timestamp"))
+    return {}
+
+def end_turn_node(state: AgentState):
+    """
+    Ends the conversation once a final decision is made, so the employee's next
+    message starts a new check-in instead of continuing this one.
+    """
+    if state.get("analysis_decision") in ["ASK_REASON", "ASK_TRANSPORT"]:
+        return {}
+    return {"messages": [RESET_CONVERSATION]}
+
 # --- 4. Graph Construction ---
 
-workflow = StateGraph(AgentState)
+_app = None
+session_store = None
+
+def get_session_store():
+    """
+    Returns the shared SessionStore (the graph's checkpointer), created on first call.
+    """
+    global session_store
+    if session_store is None:
+        from session_store import SessionStore
+        session_store = SessionStore()
+        # Writes queued for SESSION_DB_PATH reach the disk before exit
+        atexit.register(session_store.close)
+    return session_store
+
+def session_config(employee_id: str) -> Dict[str, Any]:
+    """
+    Graph config for an employee's turn: their conversation is LangGraph thread `employee_id`.
+    """
+    return {"configurable": {"thread_id": employee_id}}
+
+def _build_graph():
+    from langgraph.graph import StateGraph, END
+    from langchain_core.runnables import RunnableLambda
+
+    # Each I/O-bound node carries a sync and an async implementation:
+    # app.invoke() runs the sync one, app.ainvoke() (used by serve_agent) the async one.
+    workflow = StateGraph(AgentState)
+
+    # Every node runs inside a latency span (observability.node_latency)
+    def node(name, func, afunc=None):
+        if afunc is None:
+            return timed(func, name)
+        return RunnableLambda(timed(func, name), afunc=timed(afunc, name), name=name)
+
+    workflow.add_node("search_memory", node("search_memory", search_memory_node, asearch_memory_node))
+    workflow.add_node("fast_path", node("fast_path", fast_path_node))
+    workflow.add_node("reasoning", node("reasoning", reasoning_node, areasoning_node))
+    workflow.add_node("escalate", node("escalate", escalation_node))
+    workflow.add_node("save_memory", node("save_memory", save_memory_node, asave_memory_node))
+    workflow.add_node("end_turn", node("end_turn", end_turn_node))
+
+    workflow.set_entry_point("search_memory")
+
+    workflow.add_edge("search_memory", "fast_path")
+    # Rules that resolve the turn skip the LLM entirely
+    workflow.add_conditional_edges("fast_path", _route_after_fast_path, {"reasoning": "reasoning", "escalate": "escalate"})
+    workflow.add_edge("reasoning", "escalate")
+    workflow.add_edge("escalate", "save_memory")
+    workflow.add_edge("save_memory", "end_turn")
+    workflow.add_edge("end_turn", END)
+
+    # With sessions on, history lives server-side: callers pass only the new message
+    # plus session_config(employee_id)
+    return workflow.compile(checkpointer=get_session_store() if SESSIONS_ENABLED else None)
+
+def get_app():
+    """
+    Returns the compiled graph, building it on first call (imports langgraph).
+    """
+    global _app
+    if _app is None:
+        with _init_locks["graph"]:
+            if _app is None:
+                _app = _build_graph()
+                _init_state["graph"] = "ready"
+    return _app
+
+async def aget_app():
+    if _app is not None:
+        return _app
+    return await asyncio.to_thread(get_app)
+
+def __getattr__(name):
+    # Keeps `from attendance_agent import app` working; the graph is built on that access
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Warm-up & Readiness ---
 
-workflow.add_node("search_memory", search_memory_node)
-workflow.add_node("reasoning", reasoning_node)
-workflow.add_node("escalate", escalation_node)
-workflow.add_node("save_memory", save_memory_node)
+def warm_up() -> Dict[str, Any]:
+    """
+    Builds the graph and initializes the LLM and memory manager ahead of the first request.
+    Safe to call more than once and from a background thread.
+    """
+    started = time.perf_counter()
+    get_app()
+    try:
+        get_llm()
+    except Exception as e:
+        logger.warning(f"LLM Init Failed: {e}")
+    get_memory_manager()
+    logger.info(f"Agent warm-up finished in {time.perf_counter() - started:.2f}s: {_init_state}")
+    return readiness()
+
+def start_warm_up() -> threading.Thread:
+    """
+    Runs warm_up() in a daemon thread so callers can keep starting up.
+    """
+    thread = threading.Thread(target=warm_up, name="agent-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def readiness() -> Dict[str, Any]:
+    """
+    Reports warm-up state per component. `ready` means the graph and LLM are usable;
+    a failed memory backend leaves the agent ready but running without memory.
+    """
+    state = dict(_init_state)
+    if memory_manager is not None:
+        state["memory"] = "ready"
+    if llm is not None:
+        state["llm"] = "ready"
+    return {
+        "ready": state["graph"] == "ready" and state["llm"] == "ready" and state["memory"] != "pending",
+        "components": state,
+    }
 
-workflow.set_entry_point("search_memory")
+# --- Metrics collectors (read at scrape time) ---
 
-workflow.add_edge("search_memory", "reasoning")
-workflow.add_edge("reasoning", "escalate")
-workflow.add_edge("escalate", "save_memory")
-workflow.add_edge("save_memory", END)
+def _writer_stats():
+    writer = memory_manager.writer if memory_manager else None
+    if writer is None:
+        return None
+    return {"pending": writer.pending(), "saved": writer.saved, "failed": writer.failed}
 
-app = workflow.compile()
+registry.collector("attendance_embedding_cache", "Embedding cache counters",
+                   lambda: memory_manager.embedding_cache.stats() if memory_manager else None)
+registry.collector("attendance_decision_cache", "Decision cache counters", decision_cache.stats)
+registry.collector("attendance_fast_path", "Fast-path rule counters", fast_path_stats.snapshot)
+registry.collector("attendance_prompt_tokens", "Estimated reasoning prompt tokens", prompt_stats.snapshot)
+registry.collector("attendance_memory_writer", "Write-behind memory queue", _writer_stats)
+registry.collector("attendance_memory_compaction", "Memory compaction totals",
+                   lambda: dict(memory_manager.compactions) if memory_manager else None)
+registry.collector("attendance_excuse_clusters", "Per-employee excuse clusters",
+                   lambda: memory_manager.excuse_clusters.stats()
+                   if memory_manager and memory_manager.excuse_clusters else None)
+registry.collector("attendance_sessions", "Conversation session store",
+                   lambda: session_store.stats() if session_store else None)
 
 # --- 5. Main Execution Helper ---
 
@@ -371,7 +1823,23 @@ def run_agent(employee_id: str, message: str):
         "messages": [HumanMessage(content=message)]
     }
     
-    result = app.invoke(inputs)
+    result = get_app().invoke(inputs, session_config(employee_id))
+    print(f"[REPLY]: {result['response']}")
+    return result
+
+async def arun_agent(employee_id: str, message: str):
+    """
+    Async counterpart of run_agent(), runs the graph through app.ainvoke.
+    """
+    print(f"\n>>> PROCESSING INPUT: '{message}' for Employee: {employee_id}")
+    inputs = {
+        "employee_id": employee_id,
+        "current_input": message,
+        "memory_context": [],
+        "messages": [HumanMessage(content=message)]
+    }
+    
+    result = await (await aget_app()).ainvoke(inputs, session_config(employee_id))
     print(f"[REPLY]: {result['response']}")
     return result
 
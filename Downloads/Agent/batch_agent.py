@@ -0,0 +1,340 @@
+"""
+Batch mode: runs a file of check-in messages through the attendance graph.
+
+Input is JSONL or CSV with employee_id, message and an optional timestamp (epoch
+seconds or ISO 8601) and id. Each employee's messages run in timestamp order, as one
+conversation (LangGraph thread "batch:<employee_id>", separate from live sessions).
+Messages run in waves: wave k holds every employee's k-th message.
+  - a wave runs up to --concurrency graphs at once (app.ainvoke)
+  - a wave's texts are embedded up front with embed_documents, in chunks of --embed-chunk
+  - each employee's memories are fetched with one index query and searched locally
+    after that (GroupedIndex), instead of one remote query per message
+  - memory saves are flushed between waves, so an employee's next message sees them
+
+Escalations from a batch run are only logged (notifications.LogSink), since the
+check-ins are usually historical; pass --send-notifications to deliver them through
+the configured sink (WhatsApp when set up).
+
+Results stream to --out as JSONL, one line per message as it finishes. Re-running
+with the same --out skips the messages already written without an error, so an
+interrupted run resumes where it stopped.
+
+Usage:
+  python batch_agent.py checkins.jsonl --out results.jsonl [--concurrency 16]
+  python batch_agent.py checkins.csv --out results.jsonl --fake   # offline, fakes.py
+"""
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "16"))
+BATCH_EMBED_CHUNK = int(os.environ.get("BATCH_EMBED_CHUNK", "100"))  # Gemini's batch embedding limit
+
+logger = logging.getLogger("batch_agent")
+
+
+def parse_timestamp(value) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def read_records(path: str, fmt: str = None) -> List[Dict[str, Any]]:
+    """
+    Reads (id, employee_id, message, timestamp) records from a JSONL or CSV file.
+    Records without an id get their 1-based row number.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows: Iterable[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        records = []
+        for row_number, row in enumerate(rows, 1):
+            if not row.get("employee_id") or not row.get("message"):
+                raise ValueError(f"{path} row {row_number}: employee_id and message are required")
+            records.append({
+                "id": str(row.get("id") or row_number),
+                "employee_id": str(row["employee_id"]),
+                "message": row["message"],
+                "timestamp": parse_timestamp(row.get("timestamp")),
+            })
+    return records
+
+
+def completed_ids(out_path: str) -> set:
+    """
+    Ids already written to `out_path` without an error (the resume checkpoint).
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            if "error" not in result:
+                done.add(result["id"])
+    return done
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def plan_waves(records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Groups records by employee in timestamp order and returns the waves: wave k
+    holds every employee's k-th message.
+    """
+    by_employee: Dict[str, List[Dict[str, Any]]] = {}
+    for order, record in enumerate(records):
+        by_employee.setdefault(record["employee_id"], []).append((record["timestamp"] or 0, order, record))
+    queues = [[r for _, _, r in sorted(q, key=lambda x: x[:2])] for q in by_employee.values()]
+    depth = max((len(q) for q in queues), default=0)
+    return [[q[k] for q in queues if k < len(q)] for k in range(depth)]
+
+
+class GroupedIndex:
+    """
+    Wraps the memory index for a batch run. The first query for an employee fetches
+    all their records (one filtered query, like VectorMemoryManager.compact); later
+    queries for that employee are answered from that copy, which upserts keep current.
+    Employees with more records than one fetch returns, and anything else, go to the
+    wrapped index.
+    """
+    def __init__(self, index, scan: int, dimension: int):
+        from local_index import matches_filter
+        self._matches_filter = matches_filter
+        self.index = index
+        self.scan = scan
+        self.dimension = dimension
+        self._records: Dict[str, Optional[Dict[str, Any]]] = {}  # employee_id -> id -> record (None = remote)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.remote_queries = 0
+        self.local_queries = 0
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Dict[str, Any] = None,
+              include_metadata: bool = False, include_values: bool = False, **kwargs) -> Dict[str, Any]:
+        employee_id = self._employee(filter)
+        records = self._prefetch(employee_id) if employee_id is not None and not include_values else None
+        if records is None:
+            with self._lock:
+                self.remote_queries += 1
+            return self.index.query(vector=vector, top_k=top_k, filter=filter, include_metadata=include_metadata,
+                                    include_values=include_values, **kwargs)
+
+        from attendance_agent import _cosine
+        with self._lock:
+            self.local_queries += 1
+            candidates = [r for r in records.values() if self._matches_filter(r["metadata"], filter)]
+        # The compact backend without re-ranking returns only its stored leading dimensions,
+        # while records upserted during the run are full length: score each against the
+        # query cut to the same length, as that backend does
+        queries = {}
+        for r in candidates:
+            n = len(r["values"])
+            if n not in queries:
+                if n > len(vector):
+                    raise ValueError(f"Stored vector has {n} dimensions, query has {len(vector)}")
+                head = vector[:n]
+                queries[n] = (head, sum(v * v for v in head) ** 0.5)
+        scored = sorted(({"id": r["id"], "score": _cosine(r["values"], *queries[len(r["values"])]),
+                          "metadata": r["metadata"]} for r in candidates),
+                        key=lambda m: m["score"], reverse=True)[:top_k]
+        if not include_metadata:
+            for match in scored:
+                del match["metadata"]
+        return {"matches": scored}
+
+    def upsert(self, vectors: List[Any], **kwargs):
+        result = self.index.upsert(vectors=vectors, **kwargs)
+        with self._lock:
+            for item in vectors:
+                doc_id, values, metadata = ((item["id"], item["values"], item.get("metadata") or {})
+                                            if isinstance(item, dict) else item)
+                records = self._records.get(metadata.get("employee_id"))
+                if records is not None:
+                    records[doc_id] = {"id": doc_id, "values": list(values), "metadata": dict(metadata)}
+        return result
+
+    def delete(self, ids: List[str] = None, **kwargs):
+        result = self.index.delete(ids=ids, **kwargs)
+        with self._lock:
+            if ids:
+                for records in self._records.values():
+                    if records is not None:
+                        for doc_id in ids:
+                            records.pop(doc_id, None)
+            else:
+                # Deletes by filter are not mirrored; fall back to the wrapped index
+                self._records = {key: None for key in self._records}
+        return result
+
+    @staticmethod
+    def _employee(filter: Dict[str, Any]) -> Optional[str]:
+        cond = (filter or {}).get("employee_id")
+        if isinstance(cond, dict) and set(cond) == {"$eq"}:
+            return cond["$eq"]
+        return cond if isinstance(cond, str) else None
+
+    def _prefetch(self, employee_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if employee_id in self._records:
+                return self._records[employee_id]
+            lock = self._locks.setdefault(employee_id, threading.Lock())
+        with lock:
+            with self._lock:
+                if employee_id in self._records:
+                    return self._records[employee_id]
+                self.remote_queries += 1
+            results = self.index.query(vector=[1.0] * self.dimension, top_k=self.scan,
+                                       filter={"employee_id": {"$eq": employee_id}},
+                                       include_metadata=True, include_values=True)
+            matches = results.get("matches", [])
+            records = None if len(matches) >= self.scan else {
+                m["id"]: {"id": m["id"], "values": m.get("values") or [], "metadata": m.get("metadata") or {}}
+                for m in matches
+            }
+            with self._lock:
+                self._records[employee_id] = records
+            return records
+
+
+async def run_batch(records: List[Dict[str, Any]], out_path: str, concurrency: int = BATCH_CONCURRENCY,
+                    embed_chunk: int = BATCH_EMBED_CHUNK, notify_sink=None) -> Dict[str, Any]:
+    """
+    Runs `records` (see read_records) through the graph and appends one JSON line
+    per message to `out_path`, skipping ids already completed there. Returns totals.
+    Escalations go to `notify_sink` if given, else to the dispatcher's own sink.
+    """
+    import attendance_agent
+    import notifications
+    from langchain_core.messages import HumanMessage
+
+    done = completed_ids(out_path)
+    todo = [r for r in records if r["id"] not in done]
+    totals = {"records": len(records), "skipped": len(records) - len(todo), "ok": 0, "errors": 0}
+    waves = plan_waves(todo)
+
+    app = await attendance_agent.aget_app()
+    mm = await attendance_agent.aget_memory_manager()
+    grouped = None
+    if mm is not None:
+        grouped = GroupedIndex(mm.index, attendance_agent.MEMORY_COMPACT_SCAN, attendance_agent.EMBEDDING_DIM)
+        mm.index = grouped
+
+    live_sink = notifications.default.sink
+    if notify_sink is not None:
+        notifications.default.sink = notify_sink
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def run_one(record: Dict[str, Any], out) -> None:
+        inputs = {
+            "employee_id": record["employee_id"],
+            "current_input": record["message"],
+            "memory_context": [],
+            "messages": [HumanMessage(content=record["message"])],
+            "timestamp": record["timestamp"],
+        }
+        result = dict(record)
+        async with semaphore:
+            try:
+                state = await app.ainvoke(inputs, {"configurable": {"thread_id": f"batch:{record['employee_id']}"}})
+                result.update(decision=state.get("analysis_decision"), decided_by=state.get("decided_by"),
+                              response=state.get("response"))
+                totals["ok"] += 1
+            except Exception as e:
+                logger.error(f"Record {record['id']} failed: {e}")
+                result["error"] = str(e)
+                totals["errors"] += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    try:
+        with open(out_path, "a", encoding="utf-8") as out:
+            if out.tell() and not _ends_with_newline(out_path):
+                out.write("\n")  # after a line cut short by an interrupted run
+            for number, wave in enumerate(waves, 1):
+                if mm is not None:
+                    # Embeds the wave's texts in a few calls; search then hits the embedding cache
+                    texts = list(dict.fromkeys(r["message"] for r in wave))
+                    for i in range(0, len(texts), embed_chunk):
+                        await asyncio.to_thread(mm._embed_batch, texts[i:i + embed_chunk])
+                await asyncio.gather(*(run_one(record, out) for record in wave))
+                if mm is not None:
+                    await asyncio.to_thread(mm.flush)
+                logger.info(f"Wave {number}/{len(waves)}: {len(wave)} messages, "
+                            f"{totals['ok'] + totals['errors']}/{len(todo)} done")
+    finally:
+        if grouped is not None:
+            mm.index = grouped.index
+        if notify_sink is not None:
+            # Held digests still go to the batch's sink
+            await asyncio.to_thread(notifications.flush, 30.0)
+            notifications.default.sink = live_sink
+
+    elapsed = time.perf_counter() - started
+    totals.update(
+        waves=len(waves),
+        elapsed_s=round(elapsed, 3),
+        messages_per_s=round((totals["ok"] + totals["errors"]) / elapsed, 2) if elapsed else 0.0,
+    )
+    if grouped is not None:
+        totals.update(remote_queries=grouped.remote_queries, local_queries=grouped.local_queries)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a file of check-in messages through the attendance graph.")
+    parser.add_argument("input", help="JSONL or CSV with employee_id, message[, timestamp, id]")
+    parser.add_argument("--out", required=True, help="JSONL results file (appended to; also the resume checkpoint)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="input format (default: from the extension)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--embed-chunk", type=int, default=BATCH_EMBED_CHUNK)
+    parser.add_argument("--fake", action="store_true", help="run offline against fakes.py")
+    parser.add_argument("--send-notifications", action="store_true",
+                        help="deliver escalations through the configured sink (default: log them only)")
+    args = parser.parse_args()
+
+    if args.fake:
+        os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    import attendance_agent
+    if args.fake:
+        import fakes
+        fakes.install_attendance_fakes(attendance_agent)
+
+    import notifications
+    records = read_records(args.input, args.format)
+    notify_sink = None if args.send_notifications else notifications.LogSink()
+    totals = asyncio.run(run_batch(records, args.out, args.concurrency, args.embed_chunk, notify_sink))
+    attendance_agent.shutdown_memory()
+    print(json.dumps(totals))
+
+
+if __name__ == "__main__":
+    main()
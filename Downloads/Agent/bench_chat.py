@@ -0,0 +1,131 @@
+"""
+Throughput benchmark for the /chat path, run offline against the local fakes.
+
+Compares:
+  - sync:  app.invoke() on a 40-thread pool (what the old sync FastAPI handler
+           got from Starlette's default threadpool)
+  - async: serve_agent.chat_endpoint() running app.ainvoke() under the
+           CHAT_MAX_CONCURRENCY limit
+
+Usage: python bench_chat.py [--requests 400] [--llm-latency 0.4] ...
+"""
+# --- SETUP ENV VARS BEFORE IMPORTS ---
+import os
+import sys
+
+# Dummy key so the Gemini client can be constructed; no real call is ever made.
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.pop("PINECONE_API_KEY", None)
+# The nodes log per step; keep the benchmark output readable.
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import time
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import attendance_agent
+from fakes import FakeEmbeddings, FakeIndex, FakeLLM
+
+SAMPLE_MESSAGES = [
+    "I am late because the bus from Virar got stuck in traffic.",
+    "Train was delayed, took the local.",
+    "Bus late again, came by bus.",
+    "Heavy rain, auto rickshaw was not available so I walked.",
+]
+
+
+def install_fakes(args):
+    attendance_agent.memory_manager = attendance_agent.VectorMemoryManager(
+        embeddings=FakeEmbeddings(latency=args.embed_latency),
+        index=FakeIndex(latency=args.index_latency),
+    )
+    attendance_agent.llm = FakeLLM(latency=args.llm_latency)
+
+
+EMPLOYEES = 400
+
+
+def make_inputs(i):
+    from langchain_core.messages import HumanMessage
+    message = SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]
+    return {
+        "employee_id": f"EMP{i % EMPLOYEES:04d}",
+        "current_input": message,
+        "memory_context": [],
+        "messages": [HumanMessage(content=message)],
+    }
+
+
+def invoke_one(i):
+    inputs = make_inputs(i)
+    return attendance_agent.app.invoke(inputs, attendance_agent.session_config(inputs["employee_id"]))
+
+
+def run_sync(args):
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        start = time.perf_counter()
+        list(pool.map(invoke_one, range(args.requests)))
+        return time.perf_counter() - start
+
+
+async def run_async(args):
+    import serve_agent
+    requests = [
+        serve_agent.ChatRequest(employee_id=inp["employee_id"], message=inp["current_input"])
+        for inp in map(make_inputs, range(args.requests))
+    ]
+    async with serve_agent.lifespan(serve_agent.api):
+        start = time.perf_counter()
+        await asyncio.gather(*(serve_agent.chat_endpoint(r) for r in requests))
+        return time.perf_counter() - start
+
+
+def main():
+    global EMPLOYEES
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=40, help="Threadpool size for the sync baseline")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="CHAT_MAX_CONCURRENCY for the async run (default: serve_agent's setting)")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--index-latency", type=float, default=0.08)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--employees", type=int, default=EMPLOYEES,
+                        help="Distinct employees (turns of one employee are serialized by /chat)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    EMPLOYEES = args.employees
+
+    if args.concurrency:
+        os.environ["CHAT_MAX_CONCURRENCY"] = str(args.concurrency)
+
+    results = {}
+    install_fakes(args)
+    sync_elapsed = run_sync(args)
+    install_fakes(args)
+    async_elapsed = asyncio.run(run_async(args))
+
+    import serve_agent
+    results["requests"] = args.requests
+    results["sync_threads"] = args.threads
+    results["async_concurrency"] = serve_agent.CHAT_MAX_CONCURRENCY
+    results["sync_rps"] = round(args.requests / sync_elapsed, 2)
+    results["async_rps"] = round(args.requests / async_elapsed, 2)
+    results["speedup"] = round(sync_elapsed / async_elapsed, 2)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(f"Requests:          {results['requests']}")
+    print(f"Sync  (invoke, {args.threads} threads):   {results['sync_rps']} req/s")
+    print(f"Async (ainvoke, limit {results['async_concurrency']}): {results['async_rps']} req/s")
+    print(f"Speedup:           {results['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Cold-start benchmark: wall time to import the agent modules in a fresh interpreter.
+
+Each case runs in its own subprocess (so nothing is cached in sys.modules) and the
+median of --runs is reported. No network calls are made: since initialization is
+lazy, importing does not touch Gemini or Pinecone.
+
+Usage: python bench_startup.py [--runs 5] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASES = {
+    "import attendance_agent": "import attendance_agent",
+    "import serve_agent": "import serve_agent",
+    "import + build graph": "import attendance_agent; attendance_agent.get_app()",
+}
+
+TIMER = """
+import time, sys
+sys.path.insert(0, {here!r})
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def time_case(code, runs):
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", TIMER.format(here=HERE, code=code)],
+            capture_output=True, text=True, env=env, cwd=HERE, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"median_s": round(statistics.median(samples), 3), "min_s": round(min(samples), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {name: time_case(code, args.runs) for name, code in CASES.items()}
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, r in results.items():
+        print(f"{name:<26} median {r['median_s']:.3f}s   min {r['min_s']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Offline benchmark suite for the attendance graph and agent-server.py.
+
+Runs N employees x M turns against the local fakes (fakes.py: deterministic
+embeddings, in-memory Pinecone-contract index, scripted LLM with latency), so it
+needs no API keys or network, and reports:
+  - throughput (turns/s)
+  - per-node and per-external-call latency (p50/p95/p99, from observability.py)
+  - memory growth per round (RSS, and Python heap with --trace-memory), plus the
+    size of the index, sessions and caches
+
+Turns are played in rounds: in each round every employee sends their next message,
+with up to --concurrency turns in flight. Memory writes are flushed between rounds
+so later rounds see earlier excuses.
+
+Usage:
+  python bench_suite.py [--employees 200] [--turns 4] [--target all|agent|server]
+                        [--json] [--out results.json]
+                        [--compare baseline.json --tolerance 0.25]
+
+With --compare the run exits non-zero if throughput dropped or a p95 latency grew
+by more than --tolerance relative to the baseline results file.
+"""
+# --- SETUP ENV VARS BEFORE IMPORTS ---
+import os
+import sys
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.pop("PINECONE_API_KEY", None)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import gc
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import observability
+import side_effects
+from observability import span
+
+# One check-in conversation per employee, replayed from the start once it ends
+CONVERSATION = [
+    "Hi, checking in",
+    "I am late because the bus from Virar got stuck in traffic",
+    "Came by bus",
+    "Bus was late again, took the bus",
+]
+
+
+def message_for(employee: int, turn: int) -> str:
+    return CONVERSATION[(employee + turn) % len(CONVERSATION)]
+
+
+def rss_mb() -> float:
+    # Current RSS where /proc is available, otherwise the peak
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def memory_sample(round_no: int, turns: int, extra: dict) -> dict:
+    gc.collect()
+    sample = {"round": round_no, "turns": turns, "rss_mb": round(rss_mb(), 2)}
+    if tracemalloc.is_tracing():
+        sample["heap_mb"] = round(tracemalloc.get_traced_memory()[0] / 2**20, 2)
+    sample.update(extra)
+    return sample
+
+
+def growth_per_1k(samples: list, key: str):
+    # From the first round on, so import and warm-up cost is excluded
+    if len(samples) < 2 or key not in samples[0]:
+        return None
+    first, last = samples[0], samples[-1]
+    turns = last["turns"] - first["turns"]
+    return round((last[key] - first[key]) / turns * 1000, 3) if turns else None
+
+
+SERVER_PREFIX = "server:"
+
+
+def latency_section(server: bool = False) -> dict:
+    snapshot = observability.registry.snapshot()
+    calls = snapshot.get(observability.call_latency.name, {})
+    if server:
+        return {"calls": {k[len(SERVER_PREFIX):]: v for k, v in calls.items() if k.startswith(SERVER_PREFIX)}}
+    return {"nodes": snapshot.get(observability.node_latency.name, {}), "calls": calls}
+
+
+# --- Attendance graph ---
+
+async def bench_agent(args) -> dict:
+    import attendance_agent
+    from fakes import install_attendance_fakes
+    from langchain_core.messages import HumanMessage
+
+    _, index, llm = install_attendance_fakes(
+        attendance_agent, embed_latency=args.embed_latency, index_latency=args.index_latency,
+        llm_latency=args.llm_latency,
+    )
+    app = attendance_agent.get_app()
+    slots = asyncio.Semaphore(args.concurrency)
+    observability.registry.reset()
+
+    async def turn(employee: int, turn_no: int):
+        employee_id = f"EMP{employee:05d}"
+        message = message_for(employee, turn_no)
+        inputs = {"employee_id": employee_id, "current_input": message, "memory_context": [],
+                  "messages": [HumanMessage(content=message)]}
+        async with slots:
+            await app.ainvoke(inputs, attendance_agent.session_config(employee_id))
+
+    def structure():
+        store = attendance_agent.session_store
+        return {
+            "vectors": len(index.vectors),
+            "session_bytes": store.stats()["bytes"] if store else 0,
+            "embed_cache": attendance_agent.memory_manager.embedding_cache.stats()["size"],
+            "decision_cache": attendance_agent.decision_cache.stats()["size"],
+        }
+
+    samples = [memory_sample(0, 0, structure())]
+    elapsed = flush_elapsed = 0.0
+    for round_no in range(args.turns):
+        start = time.perf_counter()
+        await asyncio.gather(*(turn(e, round_no) for e in range(args.employees)))
+        elapsed += time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.to_thread(attendance_agent.memory_manager.flush)
+        flush_elapsed += time.perf_counter() - start
+        samples.append(memory_sample(round_no + 1, (round_no + 1) * args.employees, structure()))
+
+    turns = args.employees * args.turns
+    decisions = observability.registry.snapshot().get("attendance_decisions_total", {})
+    return {
+        "turns": turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(turns / elapsed, 2),
+        "memory_flush_s": round(flush_elapsed, 3),
+        "llm_calls": llm.calls,
+        "decisions": decisions,
+        **latency_section(),
+        "memory": samples,
+        "rss_mb_per_1k_turns": growth_per_1k(samples[1:], "rss_mb"),
+        "heap_mb_per_1k_turns": growth_per_1k(samples[1:], "heap_mb"),
+    }
+
+
+# --- agent-server.py ---
+
+def _instrument(obj, method: str, name: str):
+    original = getattr(obj, method)
+
+    def wrapper(*a, **kw):
+        with span(SERVER_PREFIX + name):
+            return original(*a, **kw)
+    setattr(obj, method, wrapper)
+
+
+def bench_server(args) -> dict:
+    from fakes import load_agent_server
+
+    server = load_agent_server(db_latency=args.db_latency, index_latency=args.index_latency,
+                               graph_latency=args.graph_latency, llm_latency=args.llm_latency,
+                               embed_latency=args.embed_latency)
+    _instrument(server.fact_system, "store_raw_message", "store_raw_message")
+    _instrument(server.memory_system, "search_similar_cases", "search_similar_cases")
+    _instrument(server.agent_executor, "invoke", "agent")
+    _instrument(server.decision_graph, "log_decision_trace", "log_decision_trace")
+    _instrument(server, "process_message_flow", "process_message_flow")
+    observability.registry.reset()
+
+    def turn(job):
+        employee, turn_no = job
+        server.process_message_flow("employee", f"91{employee:08d}", message_for(employee, turn_no))
+
+    samples = [memory_sample(0, 0, {})]
+    elapsed = 0.0
+    # Flask serves requests from a thread per request; --concurrency threads approximates that
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for round_no in range(args.turns):
+            start = time.perf_counter()
+            list(pool.map(turn, [(e, round_no) for e in range(args.employees)]))
+            elapsed += time.perf_counter() - start
+            side_effects.drain()
+            server.fact_system.flush()
+            server.decision_graph.flush()
+            samples.append(memory_sample(round_no + 1, (round_no + 1) * args.employees, {
+                "raw_messages": len(server.fact_system.raw_messages.docs),
+                "graph_writes": len(server.decision_graph.driver.runs),
+                "graph_traces": server.decision_graph.stats().get("written", 0),
+            }))
+
+    turns = args.employees * args.turns
+    return {
+        "turns": turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(turns / elapsed, 2),
+        **latency_section(server=True),
+        "memory": samples,
+        "rss_mb_per_1k_turns": growth_per_1k(samples[1:], "rss_mb"),
+        "heap_mb_per_1k_turns": growth_per_1k(samples[1:], "heap_mb"),
+    }
+
+
+# --- Regression check ---
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns regressions: throughput lower, or a p95 higher, than baseline by more than tolerance.
+    """
+    regressions = []
+    for target, current in results.items():
+        base = baseline.get(target)
+        if not isinstance(current, dict) or not isinstance(base, dict) or "turns_per_s" not in base:
+            continue
+        if current["turns_per_s"] < base["turns_per_s"] * (1 - tolerance):
+            regressions.append(f"{target}.turns_per_s: {current['turns_per_s']} < baseline {base['turns_per_s']}")
+        for section in ("nodes", "calls"):
+            for name, stats in current.get(section, {}).items():
+                base_p95 = base.get(section, {}).get(name, {}).get("p95")
+                # Sub-millisecond spans are too noisy to compare
+                if base_p95 and base_p95 >= 0.001 and stats["p95"] > base_p95 * (1 + tolerance):
+                    regressions.append(f"{target}.{section}.{name}.p95: {stats['p95']} > baseline {base_p95}")
+    return regressions
+
+
+def print_summary(results: dict):
+    for target in ("agent", "server"):
+        r = results.get(target)
+        if not r:
+            continue
+        print(f"== {target}: {r['turns']} turns in {r['elapsed_s']}s -> {r['turns_per_s']} turns/s")
+        for section in ("nodes", "calls"):
+            for name, s in r.get(section, {}).items():
+                print(f"   {section[:-1]:<5} {name:<24} p50 {s['p50'] * 1000:8.1f}ms  p95 {s['p95'] * 1000:8.1f}ms  "
+                      f"p99 {s['p99'] * 1000:8.1f}ms  n={s['count']}")
+        last = r["memory"][-1]
+        print(f"   memory: rss {last['rss_mb']} MB, +{r['rss_mb_per_1k_turns']} MB per 1k turns"
+              + (f", heap +{r['heap_mb_per_1k_turns']} MB per 1k turns" if r["heap_mb_per_1k_turns"] is not None else ""))
+        if r.get("decisions"):
+            print(f"   decisions: {r['decisions']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=4, help="Turns per employee")
+    parser.add_argument("--target", choices=["all", "agent", "server"], default="all")
+    parser.add_argument("--concurrency", type=int, default=64, help="Turns in flight at once")
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--index-latency", type=float, default=0.03)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Fake MongoDB latency (server)")
+    parser.add_argument("--graph-latency", type=float, default=0.005, help="Fake Neo4j latency (server)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also track the Python heap with tracemalloc (slows the run down)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    results = {"config": {k: v for k, v in vars(args).items() if k not in ("json", "out", "compare")}}
+    if args.target in ("all", "agent"):
+        results["agent"] = asyncio.run(bench_agent(args))
+    if args.target in ("all", "server"):
+        results["server"] = bench_server(args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_summary(results)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
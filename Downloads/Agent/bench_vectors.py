@@ -0,0 +1,176 @@
+"""
+Recall versus size for the compact vector backend (compact_index.py).
+
+Stores an excuse corpus in one CompactVectorIndex per setting (stored dimensions x
+dtype x re-rank) and compares each query's matches with the exact float32 index
+(local_index.py):
+  - recall@k per employee (the agent's filtered query) and over the whole corpus
+  - escalation agreement: how often the count of matches above SIMILARITY_THRESHOLD
+    (what the escalation rules use) equals the exact count
+  - bytes per memory scanned by queries, and on disk including the re-rank copy
+
+The corpus is generated from excuse templates by default, or read from --corpus
+(one excuse per line). Embeddings come from fakes.FakeEmbeddings (offline) or, with
+--embeddings gemini, from text-embedding-004 (needs GOOGLE_API_KEY). --npz reads the
+vectors of a saved local index (LOCAL_INDEX_PATH) instead, with no embedding calls.
+
+Usage: python bench_vectors.py [--memories 2000] [--employees 50] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from local_index import LocalVectorIndex
+from compact_index import CompactVectorIndex
+
+SIMILARITY_THRESHOLD = 0.60  # attendance_agent's escalation threshold
+
+OPENERS = ["", "Sorry, ", "Sir, ", "Good morning, ", "Hi, "]
+REASONS = [
+    "I am late because of heavy traffic", "the bus broke down", "the train was delayed",
+    "it was raining heavily and roads were flooded", "I overslept, my alarm did not ring",
+    "I was feeling sick with fever", "there was an accident on the highway",
+    "my bike had a puncture", "the local train was cancelled", "there was a strike",
+    "I had a family emergency", "there was a diversion due to construction",
+]
+PLACES = ["", " near Virar", " at Dadar", " on the Western Express Highway", " in Andheri", " at Thane station"]
+TRANSPORTS = ["", ", came by bus", ", took the local train", ", came by auto", ", drove my car",
+              ", took a cab", ", came on my bike", ", walked from the station"]
+
+
+def generate_corpus(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    combos = list(itertools.product(OPENERS, REASONS, PLACES, TRANSPORTS))
+    rng.shuffle(combos)
+    return [f"{o}{r}{p}{t}".strip() for o, r, p, t in itertools.islice(itertools.cycle(combos), n)]
+
+
+def embed(texts, backend: str):
+    if backend == "gemini":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        model = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+        vectors = []
+        for i in range(0, len(texts), 100):
+            vectors.extend(model.embed_documents(texts[i:i + 100], task_type="RETRIEVAL_QUERY"))
+        return np.asarray(vectors, dtype=np.float32)
+    from fakes import FakeEmbeddings
+    return np.asarray(FakeEmbeddings().embed_documents(texts), dtype=np.float32)
+
+
+def load_npz(path: str):
+    index = LocalVectorIndex(path=path)
+    rows = []
+    for key in index.partition_keys():
+        partition = index._partitions[key]
+        rows.extend(partition.matrix[:len(partition)])
+    return np.asarray(rows, dtype=np.float32)
+
+
+def build(index, vectors, employees: int):
+    for start in range(0, len(vectors), 500):
+        index.upsert(vectors=[(f"m{i}", vectors[i].tolist(), {"employee_id": f"E{i % employees}"})
+                              for i in range(start, min(start + 500, len(vectors)))])
+    return index
+
+
+def matches(index, query, k: int, employee_id: str = None):
+    flt = {"employee_id": {"$eq": employee_id}} if employee_id else None
+    return index.query(vector=query.tolist(), top_k=k, filter=flt)["matches"]
+
+
+def evaluate(index, exact, queries, owners, k: int):
+    recall_emp, recall_all, agree, elapsed = [], [], 0, 0.0
+    for query, owner in zip(queries, owners):
+        truth = matches(exact, query, k, owner)
+        started = time.perf_counter()
+        got = matches(index, query, k, owner)
+        elapsed += time.perf_counter() - started
+        truth_ids = {m["id"] for m in truth}
+        recall_emp.append(len(truth_ids & {m["id"] for m in got}) / max(1, len(truth_ids)))
+        count = lambda ms: sum(1 for m in ms if m["score"] > SIMILARITY_THRESHOLD)
+        agree += count(truth) == count(got)
+
+        truth_all = {m["id"] for m in matches(exact, query, k)}
+        recall_all.append(len(truth_all & {m["id"] for m in matches(index, query, k)}) / max(1, len(truth_all)))
+    n = len(queries)
+    return {
+        "recall_employee": round(float(np.mean(recall_emp)), 4),
+        "recall_global": round(float(np.mean(recall_all)), 4),
+        "escalation_agreement": round(agree / n, 4),
+        "query_us": round(elapsed / n * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs size for compact vector storage.")
+    parser.add_argument("--memories", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--employees", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", default="768,384,256,128")
+    parser.add_argument("--dtypes", default="float32,float16,int8")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--corpus", help="file with one excuse per line")
+    parser.add_argument("--embeddings", choices=["fake", "gemini"], default="fake")
+    parser.add_argument("--npz", help="use the vectors of a saved local index instead of embedding a corpus")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.npz:
+        vectors = load_npz(args.npz)
+    else:
+        if args.corpus:
+            with open(args.corpus, encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        else:
+            texts = generate_corpus(args.memories + args.queries)
+        vectors = embed(texts, args.embeddings)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    n_queries = min(args.queries, len(vectors) // 5)
+    queries, stored = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    owners = [f"E{rng.integers(args.employees)}" for _ in range(n_queries)]
+    dimension = vectors.shape[1]
+
+    exact = build(LocalVectorIndex(dimension=dimension), stored, args.employees)
+    results = []
+    for dims, dtype, rerank in itertools.product([int(d) for d in args.dims.split(",")],
+                                                 args.dtypes.split(","), (False, True)):
+        if dims >= dimension and dtype == "float32" and rerank:
+            continue  # identical to the exact index
+        index = build(CompactVectorIndex(dimension=dimension, dims=dims, dtype=dtype, rerank=rerank,
+                                         rerank_factor=args.rerank_factor), stored, args.employees)
+        row = {
+            "dims": index.dims, "dtype": dtype, "rerank": rerank,
+            "bytes_scanned": index.scanned_bytes_per_vector(),
+            "bytes_on_disk": index.bytes_per_vector(),
+            "reduction": round(dimension * 4 / index.bytes_per_vector(), 1),
+            **evaluate(index, exact, queries, owners, args.k),
+        }
+        results.append(row)
+
+    report = {"memories": len(stored), "queries": n_queries, "employees": args.employees, "k": args.k,
+              "dimension": dimension, "float32_bytes": dimension * 4, "results": results}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(stored)} memories over {args.employees} employees, {n_queries} queries, recall@{args.k} "
+          f"vs exact float32 ({dimension * 4} bytes per memory)")
+    print(f"{'dims':>5} {'dtype':>8} {'rerank':>6} {'scanned':>8} {'on disk':>8} {'x':>6} "
+          f"{'recall/emp':>10} {'recall/all':>10} {'escalation':>10} {'query us':>9}")
+    for r in results:
+        print(f"{r['dims']:>5} {r['dtype']:>8} {('yes' if r['rerank'] else 'no'):>6} {r['bytes_scanned']:>8} "
+              f"{r['bytes_on_disk']:>8} {r['reduction']:>6} {r['recall_employee']:>10.4f} "
+              f"{r['recall_global']:>10.4f} {r['escalation_agreement']:>10.4f} {r['query_us']:>9}")
+
+
+if __name__ == "__main__":
+    main()
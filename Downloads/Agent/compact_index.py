@@ -0,0 +1,393 @@
+"""
+Compact on-disk vector index for MEMORY_BACKEND=compact.
+
+Same Pinecone Index contract as local_index.py, but each memory costs a fraction of
+a 768-dim float32 vector (3 KB):
+  - only the leading COMPACT_DIMS dimensions are kept (re-normalized), quantized to
+    int8 (one float32 scale per row) or float16
+  - the rows live in memory-mapped files, so the OS pages them in as needed
+  - the memory text lives in a SQLite side store and is read only for the matches
+    returned, not held per row in memory
+  - with COMPACT_RERANK=1 (off by default) the full float32 vectors are also kept, in
+    their own memory-mapped file; a query scores COMPACT_RERANK_FACTOR x top_k candidates
+    on the compact rows and re-scores just those at full precision. That file adds
+    dimension x 4 bytes per memory, more than the compact row itself.
+
+Defaults (256 dims, int8, no re-rank) take 260 bytes per memory, about 12x less than
+float32; with re-rank it is 260 + 3072. bench_vectors.py measures the recall cost of
+each setting.
+"""
+import os
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from local_index import DEFAULT_DIMENSION, matches_filter
+
+COMPACT_DIMS = int(os.environ.get("COMPACT_DIMS", "256"))
+COMPACT_DTYPE = os.environ.get("COMPACT_DTYPE", "int8")  # "int8", "float16" or "float32"
+COMPACT_RERANK = os.environ.get("COMPACT_RERANK", "0") == "1"
+COMPACT_RERANK_FACTOR = int(os.environ.get("COMPACT_RERANK_FACTOR", "4"))
+
+DTYPES = ("int8", "float16", "float32")
+
+
+class _Rows:
+    """
+    Growable matrix of fixed-width rows, memory-mapped onto `path` if set.
+    """
+    def __init__(self, path: str, width: int, dtype: str, initial: int = 64):
+        self.path = path
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        rows = 0
+        if path and os.path.exists(path):
+            rows = os.path.getsize(path) // (width * self.dtype.itemsize)
+        self.data = None
+        self._resize(max(rows, initial))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def ensure(self, n: int):
+        if n > len(self):
+            self._resize(max(n, len(self) * 2))
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+    def _resize(self, rows: int):
+        if not self.path:
+            grown = np.zeros((rows, self.width), dtype=self.dtype)
+            if self.data is not None:
+                grown[:len(self.data)] = self.data
+            self.data = grown
+            return
+        self.flush()
+        with open(self.path, "a+b") as f:
+            f.truncate(rows * self.width * self.dtype.itemsize)
+        self.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(rows, self.width))
+
+
+class _Partition:
+    """
+    One employee's rows: ids, row slots and metadata (without the text).
+    """
+    def __init__(self):
+        self.ids: List[str] = []
+        self.slots: List[int] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, doc_id: str, slot: int, metadata: Dict[str, Any]):
+        row = self.rows.get(doc_id)
+        if row is None:
+            self.rows[doc_id] = len(self.ids)
+            self.ids.append(doc_id)
+            self.slots.append(slot)
+            self.metadata.append(metadata)
+        else:
+            self.slots[row] = slot
+            self.metadata[row] = metadata
+
+    def delete(self, doc_id: str) -> Optional[int]:
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return None
+        slot = self.slots[row]
+        last = len(self.ids) - 1
+        if row != last:
+            self.ids[row], self.slots[row], self.metadata[row] = self.ids[last], self.slots[last], self.metadata[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.slots.pop()
+        self.metadata.pop()
+        return slot
+
+
+class CompactVectorIndex:
+    """
+    Cosine index over truncated, quantized vectors, partitioned by a metadata key.
+    If `path` (a directory) is set, rows and the side store are kept there and
+    reopened on start; otherwise everything is in memory.
+    """
+    def __init__(self, dimension: int = DEFAULT_DIMENSION, path: str = "", dims: int = COMPACT_DIMS,
+                 dtype: str = COMPACT_DTYPE, rerank: bool = COMPACT_RERANK,
+                 rerank_factor: int = COMPACT_RERANK_FACTOR, partition_key: str = "employee_id"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown COMPACT_DTYPE '{dtype}' (expected one of {', '.join(DTYPES)})")
+        self.dimension = dimension
+        self.dims = min(dims, dimension)
+        self.dtype = dtype
+        self.rerank = rerank
+        self.rerank_factor = max(1, rerank_factor)
+        self.path = path
+        self.partition_key = partition_key
+        self._partitions: Dict[str, _Partition] = {}
+        self._owner: Dict[str, str] = {}  # doc id -> partition
+        self._free: List[int] = []
+        self._next_slot = 0
+        self._lock = threading.RLock()
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+        file = (lambda name: os.path.join(path, name)) if path else (lambda name: "")
+        self._db = sqlite3.connect(file("meta.db") or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS memories (id TEXT PRIMARY KEY, partition TEXT, slot INTEGER, "
+            "metadata TEXT, text TEXT)"
+        )
+        self._check_settings()
+
+        self._codes = _Rows(file("vectors.bin"), self.dims, dtype)
+        self._scales = _Rows(file("scales.bin"), 1, "float32") if dtype == "int8" else None
+        self._full = _Rows(file("full.bin"), dimension, "float32") if rerank else None
+        self._load()
+
+    # --- Pinecone Index contract ---
+
+    def upsert(self, vectors: List[Any], **kwargs) -> Dict[str, int]:
+        with self._lock:
+            rows = []
+            for item in vectors:
+                if isinstance(item, dict):
+                    doc_id, values, metadata = item["id"], item["values"], item.get("metadata") or {}
+                else:
+                    doc_id, values, metadata = item
+                    metadata = metadata or {}
+                metadata = dict(metadata)
+                text = metadata.pop("text", None)
+                slot = self._upsert_one(doc_id, np.asarray(values, dtype=np.float32), metadata)
+                rows.append((doc_id, self._owner[doc_id], slot, json.dumps(metadata), text))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO memories (id, partition, slot, metadata, text) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = False, include_values: bool = False, **kwargs) -> Dict[str, Any]:
+        full_query = self._unit(np.asarray(vector, dtype=np.float32))
+        query = self._unit(full_query[:self.dims])
+        extra_filter = {k: v for k, v in (filter or {}).items() if k != self.partition_key}
+        shortlist = top_k * self.rerank_factor if self._full is not None else top_k
+
+        candidates = []
+        with self._lock:
+            for key in self._select_partitions(filter):
+                partition = self._partitions[key]
+                rows = np.arange(len(partition))
+                if extra_filter:
+                    rows = np.array([r for r in rows if matches_filter(partition.metadata[r], extra_filter)],
+                                    dtype=np.intp)
+                if not len(rows):
+                    continue
+                slots = np.asarray(partition.slots, dtype=np.intp)[rows]
+                scores = self._scores(slots, query)
+                if len(rows) > shortlist:
+                    keep = np.argpartition(-scores, shortlist)[:shortlist]
+                    rows, slots, scores = rows[keep], slots[keep], scores[keep]
+                if self._full is not None:
+                    # Full-precision re-rank of the shortlist
+                    scores = self._full.data[slots] @ full_query
+                candidates.extend((float(s), key, int(r)) for s, r in zip(scores, rows))
+
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            matches = []
+            for score, key, row in candidates[:top_k]:
+                partition = self._partitions[key]
+                match = {"id": partition.ids[row], "score": score}
+                if include_metadata:
+                    match["metadata"] = dict(partition.metadata[row])
+                if include_values:
+                    match["values"] = self._values(partition.slots[row]).tolist()
+                matches.append(match)
+            if include_metadata and matches:
+                texts = self._texts([m["id"] for m in matches])
+                for match in matches:
+                    if match["id"] in texts:
+                        match["metadata"]["text"] = texts[match["id"]]
+        return {"matches": matches}
+
+    def fetch(self, ids: List[str], **kwargs) -> Dict[str, Any]:
+        vectors = {}
+        with self._lock:
+            texts = self._texts(ids)
+            for doc_id in ids:
+                key = self._owner.get(doc_id)
+                if key is None:
+                    continue
+                partition = self._partitions[key]
+                row = partition.rows[doc_id]
+                metadata = dict(partition.metadata[row])
+                if doc_id in texts:
+                    metadata["text"] = texts[doc_id]
+                vectors[doc_id] = {"id": doc_id, "values": self._values(partition.slots[row]).tolist(),
+                                   "metadata": metadata}
+        return {"vectors": vectors}
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None,
+               delete_all: bool = False, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if delete_all:
+                doomed = list(self._owner)
+            elif ids:
+                doomed = [doc_id for doc_id in ids if doc_id in self._owner]
+            elif filter:
+                doomed = [partition.ids[r] for key in self._select_partitions(filter)
+                          for partition in [self._partitions[key]] for r in range(len(partition))
+                          if matches_filter({**partition.metadata[r], self.partition_key: key}, filter)]
+            else:
+                doomed = []
+            for doc_id in doomed:
+                key = self._owner.pop(doc_id)
+                self._free.append(self._partitions[key].delete(doc_id))
+            self._db.executemany("DELETE FROM memories WHERE id = ?", [(doc_id,) for doc_id in doomed])
+            self._db.commit()
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dimension": self.dimension,
+                "stored_dimension": self.dims,
+                "dtype": self.dtype,
+                "rerank": self._full is not None,
+                "total_vector_count": len(self._owner),
+                "partitions": len(self._partitions),
+                "bytes_per_vector": self.bytes_per_vector(),
+                "scanned_bytes_per_vector": self.scanned_bytes_per_vector(),
+            }
+
+    def partition_keys(self) -> List[str]:
+        with self._lock:
+            return [key for key, partition in self._partitions.items() if len(partition)]
+
+    def bytes_per_vector(self) -> int:
+        """
+        Bytes stored per memory: the compact row and, with re-ranking, its full float32 copy.
+        """
+        return self.scanned_bytes_per_vector() + (self.dimension * 4 if self._full is not None else 0)
+
+    def scanned_bytes_per_vector(self) -> int:
+        """
+        Bytes per memory in the compact rows (what queries scan), scale included.
+        """
+        return self.dims * np.dtype(self.dtype).itemsize + (4 if self._scales is not None else 0)
+
+    # --- Persistence ---
+
+    def save(self, path: str = ""):
+        # Rows are written in place; flushing makes them durable
+        with self._lock:
+            for rows in (self._codes, self._scales, self._full):
+                if rows is not None:
+                    rows.flush()
+            self._db.commit()
+
+    def close(self):
+        self.save()
+
+    # --- Internals ---
+
+    def _check_settings(self):
+        settings = {"dimension": self.dimension, "dims": self.dims, "dtype": self.dtype, "rerank": self.rerank}
+        row = self._db.execute("SELECT value FROM settings WHERE key = 'layout'").fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO settings (key, value) VALUES ('layout', ?)", (json.dumps(settings),))
+            self._db.commit()
+        elif json.loads(row[0]) != settings:
+            raise ValueError(f"Compact index at '{self.path}' was built with {row[0]}, not {json.dumps(settings)}")
+
+    def _load(self):
+        used = set()
+        for doc_id, key, slot, metadata in self._db.execute("SELECT id, partition, slot, metadata FROM memories"):
+            self._partitions.setdefault(key, _Partition()).upsert(doc_id, slot, json.loads(metadata))
+            self._owner[doc_id] = key
+            used.add(slot)
+        self._next_slot = max(used) + 1 if used else 0
+        self._free = [slot for slot in range(self._next_slot) if slot not in used]
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _upsert_one(self, doc_id: str, values: np.ndarray, metadata: Dict[str, Any]) -> int:
+        if values.shape not in ((self.dimension,), (self.dims,)):
+            raise ValueError(f"Vector dimension {values.shape} does not match index dimension {self.dimension}")
+        if values.shape == (self.dims,) and self._full is not None and self.dims != self.dimension:
+            raise ValueError(f"Re-ranking needs full {self.dimension}-dim vectors")
+        key = str(metadata.get(self.partition_key, ""))
+        previous = self._owner.get(doc_id)
+        slot = None
+        if previous is not None:
+            slot = self._partitions[previous].delete(doc_id)
+        if slot is None:
+            slot = self._free.pop() if self._free else self._next_slot
+            self._next_slot = max(self._next_slot, slot + 1)
+
+        full = self._unit(values)
+        compact = self._unit(full[:self.dims])
+        for rows in (self._codes, self._scales, self._full):
+            if rows is not None:
+                rows.ensure(slot + 1)
+        if self.dtype == "int8":
+            scale = float(np.abs(compact).max()) / 127 or 1.0
+            self._codes.data[slot] = np.round(compact / scale).astype(np.int8)
+            self._scales.data[slot, 0] = scale
+        else:
+            self._codes.data[slot] = compact.astype(self.dtype)
+        if self._full is not None:
+            self._full.data[slot] = full
+
+        self._partitions.setdefault(key, _Partition()).upsert(doc_id, slot, metadata)
+        self._owner[doc_id] = key
+        return slot
+
+    def _scores(self, slots: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = self._codes.data[slots].astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales.data[slots, 0]
+        return scores
+
+    def _values(self, slot: int) -> np.ndarray:
+        # Full vector when kept, else the dequantized compact one (COMPACT_DIMS long)
+        if self._full is not None:
+            return self._full.data[slot]
+        values = self._codes.data[slot].astype(np.float32)
+        return values * self._scales.data[slot, 0] if self._scales is not None else values
+
+    def _texts(self, ids: List[str]) -> Dict[str, str]:
+        texts = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT id, text FROM memories WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            texts.update((doc_id, text) for doc_id, text in rows if text is not None)
+        return texts
+
+    def _select_partitions(self, filter_dict: Optional[Dict[str, Any]]) -> List[str]:
+        cond = (filter_dict or {}).get(self.partition_key)
+        if cond is None:
+            return list(self._partitions)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        if set(cond) == {"$eq"}:
+            keys = [cond["$eq"]]
+        elif set(cond) == {"$in"}:
+            keys = cond["$in"]
+        else:
+            return [k for k in self._partitions if matches_filter({self.partition_key: k}, {self.partition_key: cond})]
+        return [str(k) for k in keys if str(k) in self._partitions]
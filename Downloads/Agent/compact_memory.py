@@ -0,0 +1,58 @@
+"""
+Merges near-duplicate memories and applies retention for a set of employees.
+
+The running agent compacts employees it has saved to every MEMORY_COMPACT_INTERVAL
+seconds; this script covers full sweeps, e.g. after changing MEMORY_RETENTION_DAYS.
+
+Usage:
+  python compact_memory.py E001 E002 ...
+  python compact_memory.py --file employee_ids.txt
+  MEMORY_BACKEND=local LOCAL_INDEX_PATH=memory.npz python compact_memory.py --all
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import attendance_agent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact per-employee memories.")
+    parser.add_argument("employee_ids", nargs="*")
+    parser.add_argument("--file", help="file with one employee id per line")
+    parser.add_argument("--all", action="store_true", help="every employee in the index (local backend only)")
+    parser.add_argument("--threshold", type=float, default=attendance_agent.MEMORY_DEDUPE_THRESHOLD)
+    parser.add_argument("--retention-days", type=float, default=attendance_agent.MEMORY_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    mm = attendance_agent.get_memory_manager()
+    if mm is None:
+        sys.exit("Memory backend unavailable")
+
+    employee_ids = list(args.employee_ids)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            employee_ids.extend(line.strip() for line in f if line.strip())
+    if args.all:
+        if not hasattr(mm.index, "partition_keys"):
+            sys.exit("--all needs MEMORY_BACKEND=local; pass employee ids for Pinecone")
+        employee_ids.extend(mm.index.partition_keys())
+    if not employee_ids:
+        parser.error("no employees given")
+
+    totals = {"employees": 0, "scanned": 0, "merged": 0, "expired": 0, "kept": 0}
+    for employee_id in dict.fromkeys(employee_ids):
+        result = mm.compact(employee_id, threshold=args.threshold, retention_days=args.retention_days)
+        print(json.dumps({"employee_id": employee_id, **result}))
+        totals["employees"] += 1
+        for key, value in result.items():
+            totals[key] += value
+    print(json.dumps({"total": totals}))
+    attendance_agent.shutdown_memory()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Offline test setup: fakes.py stands in for Gemini, Pinecone, MongoDB and Neo4j.
+Run with `python -m pytest -q` from this directory.
+"""
+import os
+import sys
+
+# Before attendance_agent is imported: no keys, no files, no background compaction
+os.environ.setdefault("GOOGLE_API_KEY", "offline-test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["MEMORY_COMPACT_INTERVAL"] = "0"
+for name in ("EMBED_CACHE_PATH", "EXCUSE_CLUSTERS_PATH", "SESSION_DB_PATH"):
+    os.environ[name] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+# Live-API walkthrough (real Gemini and Pinecone keys), run by hand
+collect_ignore = ["test_simulation.py"]
+
+
+@pytest.fixture
+def embeddings():
+    import fakes
+    return fakes.FakeEmbeddings()
+
+
+@pytest.fixture
+def manager(embeddings):
+    """
+    A VectorMemoryManager on a FakeIndex, with in-memory excuse clusters.
+    """
+    import fakes
+    import attendance_agent
+    mm = attendance_agent.VectorMemoryManager(embeddings=embeddings, index=fakes.FakeIndex(),
+                                              excuse_clusters=attendance_agent.ExcuseClusters(path=""))
+    yield mm
+    mm.close()
+
+
+@pytest.fixture
+def agent():
+    """
+    attendance_agent with its memory manager and LLM swapped for fresh fakes.
+    """
+    import fakes
+    import attendance_agent
+    saved = attendance_agent.memory_manager, attendance_agent.llm
+    fakes.install_attendance_fakes(attendance_agent)
+    yield attendance_agent
+    attendance_agent.memory_manager.close()
+    attendance_agent.memory_manager, attendance_agent.llm = saved
+    attendance_agent.decision_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def server():
+    """
+    agent-server.py on fakes (see fakes.load_agent_server), loaded once.
+    """
+    import fakes
+    return fakes.load_agent_server()
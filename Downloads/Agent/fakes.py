@@ -0,0 +1,369 @@
+"""
+Local stand-ins for the Gemini, Pinecone, MongoDB and Neo4j clients, and a
+notification sink.
+
+They follow the same call contracts the agents use (embed_query / upsert / query /
+invoke / insert_one / session().run and their async variants) so the attendance graph
+and agent-server.py can run fully offline, with an optional simulated latency per
+call. Used by the benchmark scripts and the tests.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from local_index import matches_filter
+
+EMBED_DIM = 768
+
+
+def _simulate_latency(seconds: float):
+    if seconds:
+        time.sleep(seconds)
+
+
+async def _asimulate_latency(seconds: float):
+    if seconds:
+        await asyncio.sleep(seconds)
+
+
+class FakeEmbeddings:
+    """
+    Deterministic bag-of-words embeddings.
+    Each token is hashed onto a fixed dimension, so texts sharing words get a high
+    cosine score (e.g. "bus late" vs "late bus again"), like a real embedding model.
+    """
+    def __init__(self, dim: int = EMBED_DIM, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vec = [0.0] * self.dim
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            slot = int.from_bytes(digest[:4], "little") % self.dim
+            vec[slot] += 1.0 if digest[4] % 2 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        self.calls += 1
+        _simulate_latency(self.latency)
+        return self._vector(text)
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        self.calls += 1
+        _simulate_latency(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str, **kwargs) -> List[float]:
+        self.calls += 1
+        await _asimulate_latency(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        self.calls += 1
+        await _asimulate_latency(self.latency)
+        return [self._vector(t) for t in texts]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    if not na or not nb:
+        return 0.0
+    return dot / (na * nb)
+
+
+class FakeIndex:
+    """
+    In-memory index with Pinecone's upsert/query/delete contract (cosine metric).
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.vectors: Dict[str, Dict[str, Any]] = {}
+        self.upsert_calls = 0
+        self.query_calls = 0
+
+    def upsert(self, vectors: List[Any], **kwargs) -> Dict[str, int]:
+        self.upsert_calls += 1
+        _simulate_latency(self.latency)
+        for item in vectors:
+            if isinstance(item, dict):
+                doc_id, values, metadata = item["id"], item["values"], item.get("metadata", {})
+            else:
+                doc_id, values, metadata = item
+            self.vectors[doc_id] = {"values": list(values), "metadata": dict(metadata or {})}
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = False, include_values: bool = False, **kwargs) -> Dict[str, Any]:
+        self.query_calls += 1
+        _simulate_latency(self.latency)
+        scored = []
+        for doc_id, record in self.vectors.items():
+            if not matches_filter(record["metadata"], filter):
+                continue
+            match = {"id": doc_id, "score": _cosine(vector, record["values"])}
+            if include_metadata:
+                match["metadata"] = dict(record["metadata"])
+            if include_values:
+                match["values"] = list(record["values"])
+            scored.append(match)
+        scored.sort(key=lambda m: m["score"], reverse=True)
+        return {"matches": scored[:top_k]}
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None, **kwargs):
+        _simulate_latency(self.latency)
+        if ids:
+            for doc_id in ids:
+                self.vectors.pop(doc_id, None)
+        elif filter:
+            for doc_id in [k for k, r in self.vectors.items() if matches_filter(r["metadata"], filter)]:
+                del self.vectors[doc_id]
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        return {"dimension": EMBED_DIM, "total_vector_count": len(self.vectors)}
+
+
+class FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeLLM:
+    """
+    Scripted chat model. `script` is either a fixed reply or a callable mapping the
+    prompt to a reply; the default always answers ESCALATE_TL.
+    """
+    def __init__(self, script: Union[str, Callable[[str], str], None] = None, latency: float = 0.0):
+        self.script = script or "ESCALATE_TL | Reason logged. TL Notified."
+        self.latency = latency
+        self.calls = 0
+
+    def _reply(self, prompt: Any) -> FakeResponse:
+        self.calls += 1
+        if isinstance(prompt, list):
+            # Message list, e.g. when called through llm_client.GuardedChatModel
+            prompt = "\n".join(str(getattr(m, "content", m)) for m in prompt)
+        if callable(self.script):
+            return FakeResponse(self.script(prompt))
+        return FakeResponse(self.script)
+
+    def invoke(self, prompt: Any, *args, **kwargs) -> FakeResponse:
+        _simulate_latency(self.latency)
+        return self._reply(prompt)
+
+    async def ainvoke(self, prompt: Any, *args, **kwargs) -> FakeResponse:
+        await _asimulate_latency(self.latency)
+        return self._reply(prompt)
+
+
+class FakeCollection:
+    """
+    In-memory MongoDB collection: insert_one / insert_many / update_one / find_one /
+    find / count_documents / create_index. Filters use the same operator subset as the
+    Pinecone fake ($eq, $in, $gt, ...).
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.docs: List[Dict[str, Any]] = []
+        self.indexes: List[Any] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.write_calls = 0
+        self.read_calls = 0
+
+    def insert_one(self, doc: Dict[str, Any], **kwargs):
+        return self.insert_many([doc], **kwargs)
+
+    def insert_many(self, docs: List[Dict[str, Any]], ordered: bool = True, **kwargs):
+        _simulate_latency(self.latency)
+        with self._lock:
+            self.write_calls += 1
+            for doc in docs:
+                doc.setdefault("_id", next(self._ids))
+                self.docs.append(dict(doc))
+        return {"inserted_count": len(docs)}
+
+    def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, **kwargs):
+        """
+        Supports $set and $setOnInsert; the result has matched_count and upserted_id.
+        """
+        _simulate_latency(self.latency)
+        with self._lock:
+            self.write_calls += 1
+            for doc in self.docs:
+                if matches_filter(doc, filter):
+                    doc.update(update.get("$set", {}))
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            doc.update(update.get("$set", {}))
+            doc.setdefault("_id", next(self._ids))
+            self.docs.append(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, *args, **kwargs) -> List[Dict[str, Any]]:
+        _simulate_latency(self.latency)
+        with self._lock:
+            self.read_calls += 1
+            return [dict(d) for d in self.docs if matches_filter(d, filter)]
+
+    def find_one(self, filter: Optional[Dict[str, Any]] = None, *args, **kwargs) -> Optional[Dict[str, Any]]:
+        found = self.find(filter)
+        return found[0] if found else None
+
+    def count_documents(self, filter: Optional[Dict[str, Any]] = None, **kwargs) -> int:
+        return len(self.find(filter))
+
+    def create_index(self, keys: Any, **kwargs) -> str:
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+
+class _FakeGraphSession:
+    def __init__(self, driver: "FakeGraphDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query: str, **params):
+        _simulate_latency(self.driver.latency)
+        with self.driver._lock:
+            self.driver.runs.append((query, params))
+        return SimpleNamespace(consume=lambda: None, data=lambda: [])
+
+    def execute_write(self, fn: Callable, *args, **kwargs):
+        # The session doubles as the transaction: tx.run records like session.run
+        return fn(self, *args, **kwargs)
+
+    def close(self):
+        pass
+
+
+class FakeGraphDriver:
+    """
+    Neo4j driver stand-in: session().run(query, **params) and session().execute_write(fn)
+    record each statement in `runs`.
+    """
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.runs: List[Any] = []
+        self._lock = threading.Lock()
+
+    def session(self, **kwargs) -> _FakeGraphSession:
+        return _FakeGraphSession(self)
+
+    def verify_connectivity(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class RecordingSink:
+    """
+    Notification sink (notifications.py) that keeps (recipient, text) pairs in `sent`.
+    The first `fail_first` sends raise, to exercise the dispatcher's retries.
+    """
+    def __init__(self, latency: float = 0.0, fail_first: int = 0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.attempts = 0
+        self.sent: List[Any] = []
+
+    async def send(self, recipient: str, text: str):
+        self.attempts += 1
+        await _asimulate_latency(self.latency)
+        if self.attempts <= self.fail_first:
+            raise ConnectionError("simulated send failure")
+        self.sent.append((recipient, text))
+
+    async def close(self):
+        pass
+
+
+# --- Installing the fakes ---
+
+AGENT_SERVER_PATH = os.environ.get(
+    "AGENT_SERVER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "x-force-bot-main", "x-force-bot-main", "agent-server.py"),
+)
+
+def scripted_decision(prompt: Any) -> str:
+    """
+    LLM script for the attendance graph: applies the escalation rule from the prompt's
+    precomputed similar-excuse count, like the real model is asked to.
+    """
+    match = re.search(r"Similar past excuses \(score > [\d.]+\): (\d+)", str(prompt))
+    count = int(match.group(1)) if match else 0
+    if count >= 3:
+        return "ESCALATE_MANAGER | Limit exceeded. Escalating to Manager."
+    return "ESCALATE_TL | Reason logged. TL Notified."
+
+def install_attendance_fakes(agent, embed_latency: float = 0.0, index_latency: float = 0.0,
+                             llm_latency: float = 0.0, script=scripted_decision):
+    """
+    Points attendance_agent at fresh fakes. Returns (embeddings, index, llm).
+    """
+    embeddings = FakeEmbeddings(latency=embed_latency)
+    index = FakeIndex(latency=index_latency)
+    llm = FakeLLM(script, latency=llm_latency)
+    if agent.memory_manager is not None:
+        agent.memory_manager.close()
+    agent.memory_manager = agent.VectorMemoryManager(embeddings=embeddings, index=index)
+    agent.llm = llm
+    return embeddings, index, llm
+
+def load_agent_server(path: str = AGENT_SERVER_PATH, db_latency: float = 0.0, index_latency: float = 0.0,
+                      graph_latency: float = 0.0, llm_latency: float = 0.0, embed_latency: float = 0.0,
+                      script: Union[str, Callable[[str], str], None] = None):
+    """
+    Imports agent-server.py (offline: no Pinecone key, dummy Gemini key) and swaps
+    its MongoDB collections, Pinecone index, embeddings, Neo4j driver and Gemini model for fakes.
+    The ReAct agent is rebuilt on a guarded FakeLLM, so the LangGraph loop still runs.
+    """
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ.pop("PINECONE_API_KEY", None)
+    # Indexes are created below, on the fake collections
+    os.environ.setdefault("MONGO_ENSURE_INDEXES", "0")
+    spec = importlib.util.spec_from_file_location("agent_server", os.path.abspath(path))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+
+    facts = server.fact_system
+    facts.raw_messages = FakeCollection(latency=db_latency)
+    facts.attendance_logs = FakeCollection(latency=db_latency)
+    facts.employee_records = FakeCollection(latency=db_latency)
+    facts.webhook_events = FakeCollection(latency=db_latency)
+    server.webhook_queue.events = facts.webhook_events
+    facts.ensure_indexes()
+    server.memory_system.index = FakeIndex(latency=index_latency)
+    server.memory_system.embeddings = FakeEmbeddings(latency=embed_latency)
+    server.decision_graph.use_driver(FakeGraphDriver(latency=graph_latency))
+
+    from langgraph.prebuilt import create_react_agent
+    from llm_client import guarded, LLMGuard, TokenBucket
+    # Unpaced guard: the benchmark measures the server, not the client-side rate limit
+    llm = FakeLLM(script or "Reason logged and approved per Policy v3.2.", latency=llm_latency)
+    server.llm = guarded(llm, LLMGuard(bucket=TokenBucket(rate_per_min=0)))
+    server.agent_executor = create_react_agent(server.llm, server.tools_orchestrator,
+                                               prompt=server.system_prompt_orchestrator)
+    return server
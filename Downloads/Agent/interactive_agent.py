@@ -12,9 +12,12 @@ os.environ["PINECONE_API_KEY"] = "pcsk_5imSz4_BvLNHRp8hAeiq4VFGGVHUHWjzyWTSCb4kK
 # Add current directory to path so we can import the agent
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from attendance_agent import app
+import attendance_agent
 
 def run_chat():
+    # Connect to Gemini/Pinecone in the background while the user types their ID
+    attendance_agent.start_warm_up()
+
     emp_id = input("Enter Employee ID (e.g., EMP001): ").strip()
     if not emp_id:
         emp_id = f"EMP_USER_{int(time.time())}"
@@ -26,8 +29,6 @@ def run_chat():
     print("Type 'exit' or 'quit' to stop.")
     print("="*50 + "\n")
 
-    chat_history = []
-
     while True:
         try:
             user_input = input("You: ").strip()
@@ -38,32 +39,24 @@ def run_chat():
             if not user_input:
                 continue
 
-            # Add User Message to History
-            chat_history.append(HumanMessage(content=user_input))
-
-            # Run Agent
+            # Run Agent. Only the new message is sent: the agent keeps a bounded
+            # conversation history per employee (session store).
             inputs = {
                 "employee_id": emp_id,
                 "current_input": user_input,
                 "memory_context": [],
-                "messages": chat_history # Pass accumulated history
+                "messages": [HumanMessage(content=user_input)]
             }
             
             # We use invoke directly. Note: The agent script prints logs to stdout.
             # In a real app, we would capture this or silence logs. 
             print("...") 
-            result = app.invoke(inputs)
+            result = attendance_agent.get_app().invoke(inputs, attendance_agent.session_config(emp_id))
             
             # Extract final response
             reply = result.get("response", "No response.")
             print(f"\n🤖 Agent: {reply}\n")
             
-            # Add Bot Message to History (for context in next turn)
-            # We use HumanMessage for simplistic state, or AIMessage if imported
-            # Let's import AIMessage
-            from langchain_core.messages import AIMessage
-            chat_history.append(AIMessage(content=reply))
-            
         except KeyboardInterrupt:
             print("\nGoodbye!")
             break
@@ -0,0 +1,380 @@
+"""
+Rate-limit-aware wrapper shared by the attendance agent and agent-server.py.
+
+Every model call goes through an LLMGuard that:
+  - paces calls with a client-side token bucket (LLM_RATE_PER_MIN, LLM_BURST); a call
+    that would wait longer than LLM_MAX_WAIT fails fast instead of queueing
+  - retries transient failures (429, 5xx, timeouts) with jittered exponential backoff
+  - opens a circuit breaker after LLM_CIRCUIT_THRESHOLD consecutive failures, or at once
+    when the API asks to back off longer than the backoff cap (an exhausted quota). While
+    open, calls raise LLMUnavailable without touching the network, so callers go
+    straight to their deterministic fallback. After the cooldown a single probe call
+    decides whether to close the circuit or stay open for twice as long.
+
+Failures are written to LLM_ERROR_LOG from a background logging thread.
+
+    llm = guarded(ChatGoogleGenerativeAI(model=..., max_retries=1))
+"""
+import os
+import re
+import time
+import queue
+import atexit
+import random
+import asyncio
+import logging
+import threading
+import logging.handlers
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+LLM_RATE_PER_MIN = float(os.environ.get("LLM_RATE_PER_MIN", "60"))
+LLM_BURST = int(os.environ.get("LLM_BURST", "5"))
+LLM_MAX_WAIT = float(os.environ.get("LLM_MAX_WAIT", "5"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "8"))
+LLM_CIRCUIT_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_THRESHOLD", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.environ.get("LLM_CIRCUIT_COOLDOWN", "30"))
+LLM_CIRCUIT_MAX_COOLDOWN = float(os.environ.get("LLM_CIRCUIT_MAX_COOLDOWN", "600"))
+LLM_ERROR_LOG = os.environ.get("LLM_ERROR_LOG", "llm_error.txt")
+
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+# Gemini reports the wait as "Please retry in 54.2s" and "'retryDelay': '54s'"
+_RETRY_HINT = re.compile(r"retry(?:Delay)?\W+(?:in\s+)?(\d+(?:\.\d+)?)s", re.IGNORECASE)
+
+
+class LLMUnavailable(RuntimeError):
+    """
+    Raised instead of calling the model: the circuit is open, the rate budget is
+    spent, or a transient failure outlasted the retries.
+    """
+    def __init__(self, reason: str, retry_after: float = 0.0):
+        super().__init__(f"LLM unavailable ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# --- Error classification ---
+
+def status_code(error: BaseException) -> Optional[int]:
+    """
+    HTTP status of an API error, looking through wrapped causes; falls back to the message.
+    """
+    seen = error
+    while seen is not None:
+        for attr in ("code", "status_code"):
+            value = getattr(seen, attr, None)
+            if isinstance(value, int):
+                return value
+        seen = seen.__cause__ or seen.__context__
+    message = str(error)
+    if "429" in message or "RESOURCE_EXHAUSTED" in message:
+        return 429
+    if "503" in message or "UNAVAILABLE" in message:
+        return 503
+    return None
+
+def is_rate_limit(error: BaseException) -> bool:
+    return isinstance(error, LLMUnavailable) or status_code(error) == 429
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if "Timeout" in type(error).__name__ or "Connect" in type(error).__name__:
+        return True
+    return status_code(error) in TRANSIENT_STATUS
+
+def retry_hint(error: BaseException) -> float:
+    """
+    Server-suggested wait in seconds, or 0.
+    """
+    match = _RETRY_HINT.search(str(error))
+    return float(match.group(1)) if match else 0.0
+
+
+# --- Non-blocking error log ---
+
+logger = logging.getLogger("llm_client")
+_error_log = logging.getLogger("llm_client.errors")
+_error_log.propagate = False
+_listener = None
+_listener_lock = threading.Lock()
+
+def log_error(message: str):
+    """
+    Appends a line to LLM_ERROR_LOG; the file write happens on a background thread.
+    """
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                records = queue.Queue(-1)
+                file_handler = logging.FileHandler(LLM_ERROR_LOG, encoding="utf-8", delay=True)
+                file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                _error_log.addHandler(logging.handlers.QueueHandler(records))
+                _listener = logging.handlers.QueueListener(records, file_handler)
+                _listener.start()
+                atexit.register(_listener.stop)
+    _error_log.error(message)
+
+
+# --- Pacing and circuit breaking ---
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. reserve() takes a token now and returns how long the
+    caller must wait for it, so sync and async callers can share one bucket.
+    """
+    def __init__(self, rate_per_min: float = LLM_RATE_PER_MIN, burst: int = LLM_BURST):
+        self.rate = rate_per_min / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Returns the wait in seconds, or None (nothing taken) if it would exceed max_wait.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures -> half_open after the
+    cooldown (one probe call allowed) -> closed on success, open again on failure.
+    """
+    def __init__(self, threshold: int = LLM_CIRCUIT_THRESHOLD, cooldown: float = LLM_CIRCUIT_COOLDOWN,
+                 max_cooldown: float = LLM_CIRCUIT_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self._open_until:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._open_until - time.monotonic())
+
+    def release_probe(self):
+        """
+        Gives back a half-open probe slot that was not used for a model call.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self._probing = False
+
+    def record_failure(self, retry_after: float = 0.0, trip: bool = False):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                # The probe failed: back off for longer
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                trip = True
+            if trip or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.opened += 1
+                    logger.warning(f"LLM circuit open for {max(self.cooldown, retry_after):.0f}s "
+                                   f"after {self.failures} failures")
+                self.state = "open"
+                self._open_until = time.monotonic() + max(self.cooldown, retry_after)
+            self._probing = False
+
+
+class LLMGuard:
+    """
+    Runs model calls through a TokenBucket, retries with backoff and a CircuitBreaker.
+    One guard is shared per process so all callers see the same quota state.
+    """
+    def __init__(self, bucket: TokenBucket = None, breaker: CircuitBreaker = None,
+                 max_wait: float = LLM_MAX_WAIT, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE, backoff_max: float = LLM_BACKOFF_MAX):
+        self.bucket = bucket or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+                         "rejected": 0, "throttled": 0}
+
+    def call(self, fn: Callable, *args, **kwargs):
+        attempt = 0
+        self._count("calls")
+        while True:
+            wait = self._admit()
+            if wait:
+                time.sleep(wait)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    async def acall(self, fn: Callable, *args, **kwargs):
+        attempt = 0
+        self._count("calls")
+        while True:
+            await asyncio.sleep(self._admit())
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        counters.update(circuit=self.breaker.state, circuit_opened=self.breaker.opened,
+                        circuit_retry_after=round(self.breaker.retry_after(), 1))
+        return counters
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _admit(self) -> float:
+        """
+        Returns the pacing delay before an attempt, or raises LLMUnavailable.
+        """
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise LLMUnavailable("circuit_open", self.breaker.retry_after())
+        wait = self.bucket.reserve(self.max_wait)
+        if wait is None:
+            self._count("throttled")
+            # Not a model failure, so it says nothing about recovery
+            self.breaker.release_probe()
+            raise LLMUnavailable("rate_limited", self.max_wait)
+        return wait
+
+    def _on_success(self):
+        self._count("succeeded")
+        self.breaker.record_success()
+
+    def _on_failure(self, error: Exception, attempt: int) -> float:
+        """
+        Records a failed attempt. Returns the backoff before the next attempt, or raises.
+        """
+        hint = retry_hint(error)
+        transient = is_transient(error)
+        log_error(f"attempt={attempt + 1} status={status_code(error)} transient={transient} "
+                  f"retry_hint={hint} {type(error).__name__}: {error}")
+        if not transient:
+            # A bad request says nothing about the model's health
+            self.breaker.release_probe()
+            self._count("failed")
+            raise error
+
+        # A server hint beyond the backoff cap means the quota is gone for a while
+        quota_dead = hint > self.backoff_max
+        self.breaker.record_failure(retry_after=hint, trip=quota_dead)
+        if quota_dead or attempt >= self.max_retries or self.breaker.state == "open":
+            self._count("failed")
+            raise LLMUnavailable("rate_limited" if status_code(error) == 429 else "unavailable",
+                                 max(hint, self.breaker.retry_after())) from error
+        self._count("retries")
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return max(hint, random.uniform(0, backoff))
+
+
+# --- Chat model wrapper ---
+
+def _as_chat_result(response: Any) -> ChatResult:
+    message = response if isinstance(response, BaseMessage) else AIMessage(content=getattr(response, "content", str(response)))
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class GuardedChatModel(BaseChatModel):
+    """
+    Chat model that forwards to `model` through `guard`. Supports bind_tools (so it
+    works with create_react_agent) by binding the wrapped model's tool kwargs to itself.
+    `model` may also be any object with invoke/ainvoke (e.g. fakes.FakeLLM).
+    """
+    model: Any
+    guard: Any = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"guarded-{getattr(self.model, '_llm_type', type(self.model).__name__)}"
+
+    def bind_tools(self, tools, **kwargs):
+        if not hasattr(self.model, "bind_tools"):
+            # Scripted stand-ins (fakes.FakeLLM) never call tools
+            return self
+        binding = self.model.bind_tools(tools, **kwargs)
+        return self.bind(**binding.kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        return self.guard.call(self._call_model, messages, stop, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        return await self.guard.acall(self._acall_model, messages, stop, **kwargs)
+
+    def _call_model(self, messages, stop, **kwargs) -> ChatResult:
+        if isinstance(self.model, BaseChatModel):
+            return self.model._generate(messages, stop=stop, **kwargs)
+        return _as_chat_result(self.model.invoke(messages, **kwargs))
+
+    async def _acall_model(self, messages, stop, **kwargs) -> ChatResult:
+        if isinstance(self.model, BaseChatModel):
+            return await self.model._agenerate(messages, stop=stop, **kwargs)
+        return _as_chat_result(await self.model.ainvoke(messages, **kwargs))
+
+
+default_guard = LLMGuard()
+
+def guarded(model: Any, guard: LLMGuard = None) -> GuardedChatModel:
+    """
+    Wraps a chat model with the process-wide guard (or the given one).
+    """
+    return GuardedChatModel(model=model, guard=guard or default_guard)
@@ -0,0 +1,347 @@
+"""
+HTTP load generator and replay harness for the agent endpoints.
+
+Targets:
+  chat      serve_agent           POST /chat              {"employee_id", "message"}
+  employee  agent-server.py       POST /agent/employee    {"sender_id", "message"}
+  webhook   agent-server.py       POST /webhook/whatsapp  WhatsApp Cloud API payload
+
+Load is open-loop: check-in sessions arrive as a Poisson process at --rate sessions/s
+(or following a --ramp schedule, e.g. the 9-10 AM burst), whether or not earlier
+requests have finished. Each session is a multi-turn script (greeting, reason,
+transport) sent one turn at a time, waiting --think-time after each reply. An
+employee's turns never overlap. --concurrency caps requests in flight.
+
+Latency is measured from the time a request was *scheduled*, so time spent queued
+behind a slow server counts (no coordinated omission); "service" latency, from
+the actual send, is reported too.
+
+--replay FILE sends recorded traffic instead. FILE is JSONL, one message per line:
+  {"t": 0.4, "employee_id": "EMP001", "message": "Hi"}     (t: seconds from start, optional)
+  {"t": 1.2, "payload": {...raw WhatsApp webhook body...}}  (webhook target only)
+
+Without --url the target server is started in-process on a loopback port with the
+local fakes (fakes.py), so no keys or network are needed.
+
+Usage:
+  python loadgen.py --target chat --rate 20 --duration 30 --concurrency 64
+  python loadgen.py --target webhook --ramp 0:2,30:40,90:40,120:5 --duration 120
+  python loadgen.py --target chat --url http://localhost:8000 --replay morning.jsonl --speed 4
+"""
+# --- SETUP ENV VARS BEFORE IMPORTS ---
+import os
+import sys
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.pop("PINECONE_API_KEY", None)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+from collections import Counter
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION_SCRIPTS = [
+    ["Hi, checking in", "I am late because the bus from Virar got stuck in traffic", "Came by bus"],
+    ["Good morning", "Train was delayed at Dadar", "Took the local train"],
+    ["I'm late", "Heavy rain, roads were flooded", "Came by auto"],
+    ["Check in", "Bus late again due to traffic jam", "By bus"],
+]
+
+
+# --- Arrivals ---
+
+def parse_ramp(spec: str):
+    """
+    "0:2,30:40,90:40,120:5" -> [(0, 2), (30, 40), ...] (seconds, sessions/s), linearly interpolated.
+    """
+    points = []
+    for part in spec.split(","):
+        t, rate = part.split(":")
+        points.append((float(t), float(rate)))
+    return sorted(points)
+
+
+def rate_at(schedule, t: float) -> float:
+    if t <= schedule[0][0]:
+        return schedule[0][1]
+    for (t0, r0), (t1, r1) in zip(schedule, schedule[1:]):
+        if t0 <= t <= t1:
+            return r0 + (r1 - r0) * (t - t0) / (t1 - t0) if t1 > t0 else r1
+    return schedule[-1][1]
+
+
+def arrival_times(schedule, duration: float, rng: random.Random):
+    """
+    Poisson arrivals with a time-varying rate (thinning against the peak rate).
+    """
+    peak = max(rate for _, rate in schedule)
+    if peak <= 0:
+        return []
+    times, t = [], 0.0
+    while True:
+        t += rng.expovariate(peak)
+        if t >= duration:
+            return times
+        if rng.random() * peak <= rate_at(schedule, t):
+            times.append(t)
+
+
+# --- Requests per target ---
+
+def employee_phone(employee_id: str) -> str:
+    digits = "".join(ch for ch in employee_id if ch.isdigit()) or "0"
+    return f"91{int(digits):010d}"
+
+
+def webhook_payload(phone: str, text: str, message_id: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "offline-waba",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"wa_id": phone, "profile": {"name": phone}}],
+                    "messages": [{
+                        "from": phone, "id": message_id, "timestamp": str(int(time.time())),
+                        "type": "text", "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+def build_request(target: str, employee_id: str, message: str, message_id: str, payload: dict = None):
+    if target == "chat":
+        return "/chat", {"employee_id": employee_id, "message": message}
+    if target == "employee":
+        return "/agent/employee", {"sender_id": employee_phone(employee_id), "message": message}
+    return "/webhook/whatsapp", payload or webhook_payload(employee_phone(employee_id), message, message_id)
+
+
+# --- Offline servers ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_offline_server(target: str, args) -> str:
+    """
+    Starts the target app with fakes installed on a loopback port; returns its base URL.
+    """
+    port = _free_port()
+    if target == "chat":
+        if args.server_concurrency:
+            os.environ["CHAT_MAX_CONCURRENCY"] = str(args.server_concurrency)
+        import uvicorn
+        import attendance_agent
+        import serve_agent
+        from fakes import install_attendance_fakes
+
+        install_attendance_fakes(attendance_agent, embed_latency=args.embed_latency,
+                                 index_latency=args.index_latency, llm_latency=args.llm_latency)
+        server = uvicorn.Server(uvicorn.Config(serve_agent.api, host="127.0.0.1", port=port,
+                                               log_level="warning", access_log=False))
+        threading.Thread(target=server.run, name="loadgen-uvicorn", daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+    else:
+        from werkzeug.serving import make_server
+        from fakes import load_agent_server
+
+        agent_server = load_agent_server(db_latency=args.db_latency, index_latency=args.index_latency,
+                                         graph_latency=args.graph_latency, llm_latency=args.llm_latency,
+                                         embed_latency=args.embed_latency)
+        # Same threading model as app.run(): one thread per request
+        server = make_server("127.0.0.1", port, agent_server.app, threaded=True)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        threading.Thread(target=server.serve_forever, name="loadgen-werkzeug", daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+# --- Load generation ---
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.service = []
+        self.errors = Counter()
+        self.sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def report(self, elapsed: float) -> dict:
+        completed = len(self.latencies)
+        failed = sum(self.errors.values())
+        return {
+            "sent": self.sent,
+            "completed": completed,
+            "errors": dict(self.errors),
+            "error_rate": round(failed / self.sent, 4) if self.sent else 0.0,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": percentiles(self.latencies),
+            "service_ms": percentiles(self.service),
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def q(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000, 1)
+    return {"p50": q(0.50), "p90": q(0.90), "p95": q(0.95), "p99": q(0.99), "max": round(ordered[-1] * 1000, 1)}
+
+
+async def run_load(args, base_url: str, sessions) -> dict:
+    """
+    `sessions` is a list of (start offset, employee_id, [(message, payload), ...]).
+    """
+    recorder = Recorder()
+    slots = asyncio.Semaphore(args.concurrency)
+    employee_locks = {}
+    message_ids = iter(range(1, 1 << 62))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        loop_start = time.perf_counter()
+
+        async def send(scheduled: float, employee_id: str, message: str, payload: dict):
+            path, body = build_request(args.target, employee_id, message, f"wamid.load{next(message_ids)}", payload)
+            recorder.sent += 1
+            async with slots:
+                sent_at = time.perf_counter()
+                recorder.in_flight += 1
+                recorder.max_in_flight = max(recorder.max_in_flight, recorder.in_flight)
+                try:
+                    response = await client.post(path, json=body)
+                    if response.status_code >= 400:
+                        recorder.errors[f"http_{response.status_code}"] += 1
+                        return
+                except httpx.TimeoutException:
+                    recorder.errors["timeout"] += 1
+                    return
+                except httpx.HTTPError as e:
+                    recorder.errors[type(e).__name__] += 1
+                    return
+                finally:
+                    recorder.in_flight -= 1
+                done = time.perf_counter()
+                recorder.latencies.append(done - scheduled)
+                recorder.service.append(done - sent_at)
+
+        async def session(offset: float, employee_id: str, turns):
+            delay = loop_start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # The first turn is due at its arrival time, even if an earlier session still holds the employee
+            scheduled = loop_start + offset
+            async with employee_locks.setdefault(employee_id, asyncio.Lock()):
+                for i, (message, payload) in enumerate(turns):
+                    if i:
+                        await asyncio.sleep(args.think_time)
+                        scheduled = time.perf_counter()
+                    await send(scheduled, employee_id, message, payload)
+
+        await asyncio.gather(*(session(*s) for s in sessions))
+        return recorder.report(time.perf_counter() - loop_start)
+
+
+def synthetic_sessions(args):
+    rng = random.Random(args.seed)
+    schedule = parse_ramp(args.ramp) if args.ramp else [(0.0, args.rate)]
+    sessions = []
+    for i, offset in enumerate(arrival_times(schedule, args.duration, rng)):
+        employee_id = f"EMP{i % args.employees:05d}"
+        script = SESSION_SCRIPTS[rng.randrange(len(SESSION_SCRIPTS))][:args.turns]
+        sessions.append((offset, employee_id, [(message, None) for message in script]))
+    return sessions
+
+
+def replay_sessions(args):
+    """
+    One single-turn "session" per recorded message, at its recorded offset (scaled by --speed);
+    lines without "t" are spread at --rate messages/s. Per-employee order is preserved.
+    """
+    rng = random.Random(args.seed)
+    sessions, t = [], 0.0
+    with open(args.replay, encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "t" in record:
+                t = float(record["t"]) / args.speed
+            else:
+                t += rng.expovariate(args.rate) if args.rate > 0 else 0.0
+            employee_id = str(record.get("employee_id") or record.get("from") or f"EMP{n:05d}")
+            sessions.append((t, employee_id, [(record.get("message", ""), record.get("payload"))]))
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["chat", "employee", "webhook"], default="chat")
+    parser.add_argument("--url", help="Base URL of a running server (default: start one offline with fakes)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Session arrivals per second")
+    parser.add_argument("--ramp", help="Arrival rate schedule 't:rate,...' (overrides --rate)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds over which sessions arrive")
+    parser.add_argument("--employees", type=int, default=1000, help="Distinct employees sessions are drawn from")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session (max 3)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between a reply and the next turn")
+    parser.add_argument("--concurrency", type=int, default=64, help="Max requests in flight")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--server-concurrency", type=int,
+                        help="CHAT_MAX_CONCURRENCY for the offline chat server (default: serve_agent's setting)")
+    parser.add_argument("--replay", help="JSONL file of recorded messages to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Offline fakes")
+    parser.add_argument("--index-latency", type=float, default=0.03, help="Offline fakes")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Offline fakes")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Offline fakes (agent-server)")
+    parser.add_argument("--graph-latency", type=float, default=0.005, help="Offline fakes (agent-server)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # One log line per request from the client would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    base_url = args.url or start_offline_server(args.target, args)
+    sessions = replay_sessions(args) if args.replay else synthetic_sessions(args)
+    results = asyncio.run(run_load(args, base_url, sessions))
+    results.update(target=args.target, offline=not args.url, sessions=len(sessions))
+    if not args.replay:
+        results["offered_sessions_per_s"] = round(len(sessions) / args.duration, 2)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"Target:       {args.target} ({'offline fakes' if not args.url else args.url})")
+    print(f"Sessions:     {results['sessions']}"
+          + (f" ({results['offered_sessions_per_s']}/s offered)" if "offered_sessions_per_s" in results else "")
+          + f"   requests sent {results['sent']}, completed {results['completed']}")
+    print(f"Throughput:   {results['throughput_rps']} req/s   (max in flight {results['max_in_flight']})")
+    print(f"Errors:       {results['error_rate']:.2%} {results['errors'] or ''}")
+    print(f"Latency ms:   {results['latency_ms']}")
+    print(f"Service ms:   {results['service_ms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+In-process vector index for MEMORY_BACKEND=local.
+
+Implements the part of Pinecone's Index contract the agent uses (upsert / query /
+delete / describe_index_stats) and returns the same `matches` / `score` / `metadata`
+result shape, so VectorMemoryManager can use it unchanged.
+
+Vectors are partitioned per employee into NumPy matrices of unit-normalized rows, so
+a query filtered on employee_id is one matrix-vector product over a few dozen rows.
+"""
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_DIMENSION = 768
+
+
+def matches_filter(metadata: Dict[str, Any], filter_dict: Optional[Dict[str, Any]]) -> bool:
+    """
+    Evaluates the subset of Pinecone's metadata filter language the agent uses
+    ($eq, $ne, $in, $nin, $gt, $gte, $lt, $lte; a bare value means $eq).
+    """
+    if not filter_dict:
+        return True
+    for key, cond in filter_dict.items():
+        value = metadata.get(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, expected in cond.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+
+class _Partition:
+    """
+    One employee's vectors: a preallocated float32 matrix that grows by doubling.
+    """
+    def __init__(self, dimension: int):
+        self.matrix = np.zeros((8, dimension), dtype=np.float32)
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, doc_id: str, vector: np.ndarray, metadata: Dict[str, Any]):
+        row = self.rows.get(doc_id)
+        if row is None:
+            row = len(self.ids)
+            if row == self.matrix.shape[0]:
+                grown = np.zeros((row * 2, self.matrix.shape[1]), dtype=np.float32)
+                grown[:row] = self.matrix
+                self.matrix = grown
+            self.ids.append(doc_id)
+            self.metadata.append(metadata)
+            self.rows[doc_id] = row
+        else:
+            self.metadata[row] = metadata
+        self.matrix[row] = vector
+
+    def delete(self, doc_id: str) -> bool:
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return False
+        # Swap-remove: move the last row into the freed slot
+        last = len(self.ids) - 1
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.metadata[row] = self.metadata[last]
+            self.rows[self.ids[row]] = row
+        self.ids.pop()
+        self.metadata.pop()
+        return True
+
+
+class LocalVectorIndex:
+    """
+    Cosine-similarity index partitioned by a metadata key (employee_id by default).
+    If `path` is set, the index is loaded from it on start and written back by save()/close().
+    """
+    def __init__(self, dimension: int = DEFAULT_DIMENSION, path: str = "", partition_key: str = "employee_id"):
+        self.dimension = dimension
+        self.path = path
+        self.partition_key = partition_key
+        self._partitions: Dict[str, _Partition] = {}
+        self._owner: Dict[str, str] = {}  # doc id -> partition
+        self._lock = threading.RLock()
+        self._dirty = False
+        if path and os.path.exists(path):
+            self.load(path)
+
+    # --- Pinecone Index contract ---
+
+    def upsert(self, vectors: List[Any], **kwargs) -> Dict[str, int]:
+        with self._lock:
+            for item in vectors:
+                if isinstance(item, dict):
+                    doc_id, values, metadata = item["id"], item["values"], item.get("metadata") or {}
+                else:
+                    doc_id, values, metadata = item
+                    metadata = metadata or {}
+                self._upsert_one(doc_id, self._normalize(values), dict(metadata))
+            self._dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = False, include_values: bool = False, **kwargs) -> Dict[str, Any]:
+        query_vector = self._normalize(vector)
+        # Conditions beyond the partition key are checked per row
+        extra_filter = {k: v for k, v in (filter or {}).items() if k != self.partition_key}
+
+        candidates = []
+        with self._lock:
+            for partition in self._select_partitions(filter):
+                n = len(partition)
+                if not n:
+                    continue
+                scores = partition.matrix[:n] @ query_vector
+                rows = np.arange(n)
+                if extra_filter:
+                    rows = np.array([r for r in range(n) if matches_filter(partition.metadata[r], extra_filter)],
+                                    dtype=np.intp)
+                if len(rows) > top_k:
+                    rows = rows[np.argpartition(-scores[rows], top_k)[:top_k]]
+                candidates.extend((float(scores[r]), partition, int(r)) for r in rows)
+
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            matches = []
+            for score, partition, row in candidates[:top_k]:
+                match = {"id": partition.ids[row], "score": score}
+                if include_metadata:
+                    match["metadata"] = dict(partition.metadata[row])
+                if include_values:
+                    match["values"] = partition.matrix[row].tolist()
+                matches.append(match)
+        return {"matches": matches}
+
+    def fetch(self, ids: List[str], **kwargs) -> Dict[str, Any]:
+        vectors = {}
+        with self._lock:
+            for doc_id in ids:
+                key = self._owner.get(doc_id)
+                if key is None:
+                    continue
+                partition = self._partitions[key]
+                row = partition.rows[doc_id]
+                vectors[doc_id] = {
+                    "id": doc_id,
+                    "values": partition.matrix[row].tolist(),
+                    "metadata": dict(partition.metadata[row]),
+                }
+        return {"vectors": vectors}
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None,
+               delete_all: bool = False, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if delete_all:
+                self._partitions.clear()
+                self._owner.clear()
+            elif ids:
+                for doc_id in ids:
+                    key = self._owner.pop(doc_id, None)
+                    if key is not None:
+                        self._partitions[key].delete(doc_id)
+            elif filter:
+                for partition in list(self._select_partitions(filter)):
+                    doomed = [doc_id for doc_id, meta in zip(partition.ids, partition.metadata)
+                              if matches_filter(meta, filter)]
+                    for doc_id in doomed:
+                        partition.delete(doc_id)
+                        self._owner.pop(doc_id, None)
+            self._dirty = True
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dimension": self.dimension,
+                "total_vector_count": len(self._owner),
+                "partitions": len(self._partitions),
+            }
+
+    def partition_keys(self) -> List[str]:
+        """
+        Keys of the non-empty partitions (employee ids); not part of the Pinecone contract.
+        """
+        with self._lock:
+            return [key for key, partition in self._partitions.items() if len(partition)]
+
+    # --- Persistence ---
+
+    def save(self, path: str = ""):
+        """
+        Writes the index to `path` (an .npz file) atomically.
+        """
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            arrays = {}
+            manifest = []
+            for i, (key, partition) in enumerate(self._partitions.items()):
+                n = len(partition)
+                arrays[f"p{i}"] = partition.matrix[:n]
+                manifest.append({"key": key, "ids": partition.ids, "metadata": partition.metadata})
+            arrays["manifest"] = np.array(json.dumps({"dimension": self.dimension, "partitions": manifest}))
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+            self._dirty = False
+
+    def load(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            manifest = json.loads(str(data["manifest"]))
+            with self._lock:
+                self._partitions.clear()
+                self._owner.clear()
+                for i, entry in enumerate(manifest["partitions"]):
+                    matrix = data[f"p{i}"]
+                    partition = _Partition(self.dimension)
+                    for row, (doc_id, metadata) in enumerate(zip(entry["ids"], entry["metadata"])):
+                        partition.upsert(doc_id, matrix[row], metadata)
+                        self._owner[doc_id] = entry["key"]
+                    self._partitions[entry["key"]] = partition
+                self._dirty = False
+
+    def close(self):
+        if self._dirty:
+            self.save()
+
+    # --- Internals ---
+
+    def _normalize(self, values) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Vector dimension {vector.shape} does not match index dimension {self.dimension}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _upsert_one(self, doc_id: str, vector: np.ndarray, metadata: Dict[str, Any]):
+        key = str(metadata.get(self.partition_key, ""))
+        previous = self._owner.get(doc_id)
+        if previous is not None and previous != key:
+            self._partitions[previous].delete(doc_id)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(self.dimension)
+        partition.upsert(doc_id, vector, metadata)
+        self._owner[doc_id] = key
+
+    def _select_partitions(self, filter_dict: Optional[Dict[str, Any]]):
+        cond = (filter_dict or {}).get(self.partition_key)
+        if cond is None:
+            return list(self._partitions.values())
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        if set(cond) == {"$eq"}:
+            keys = [cond["$eq"]]
+        elif set(cond) == {"$in"}:
+            keys = cond["$in"]
+        else:
+            return [p for k, p in self._partitions.items() if matches_filter({self.partition_key: k}, {self.partition_key: cond})]
+        return [self._partitions[str(k)] for k in keys if str(k) in self._partitions]
@@ -0,0 +1,300 @@
+"""
+Escalation notifications (team leader / manager), coalesced per recipient.
+
+notify(level, message) only queues. A dispatcher thread running its own event loop
+sends at most one message per recipient per NOTIFY_DIGEST_WINDOW seconds: a lone
+escalation goes out at once, and anything arriving within the window is folded into
+one digest sent when the window ends. A repeat of the same employee and reason within
+a digest is dropped. NOTIFY_RATE_PER_HOUR caps messages per recipient on top of that,
+so a mass-lateness morning costs a few digests rather than one message per employee.
+Failed sends are retried with exponential backoff.
+
+The sink does the actual delivery:
+  - LogSink (default): writes the message to the log, as the old stub did
+  - WhatsAppSink: WhatsApp Cloud API over one pooled httpx.AsyncClient, used when
+    WHATSAPP_TOKEN and WHATSAPP_PHONE_NUMBER_ID are set
+  - fakes.RecordingSink: keeps messages in memory (benchmarks, tests)
+"""
+import os
+import time
+import atexit
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from observability import registry
+
+NOTIFY_DIGEST_WINDOW = float(os.environ.get("NOTIFY_DIGEST_WINDOW", "60"))
+NOTIFY_RATE_PER_HOUR = int(os.environ.get("NOTIFY_RATE_PER_HOUR", "30"))
+NOTIFY_DIGEST_MAX_LINES = int(os.environ.get("NOTIFY_DIGEST_MAX_LINES", "20"))
+NOTIFY_RETRIES = int(os.environ.get("NOTIFY_RETRIES", "3"))
+NOTIFY_BACKOFF = float(os.environ.get("NOTIFY_BACKOFF", "1.0"))  # seconds, doubled per attempt
+
+# WhatsApp Cloud API; recipients are phone numbers per level
+WHATSAPP_TOKEN = os.environ.get("WHATSAPP_TOKEN", "")
+WHATSAPP_PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID", "")
+WHATSAPP_API_URL = os.environ.get("WHATSAPP_API_URL", "https://graph.facebook.com/v19.0")
+NOTIFY_TL_NUMBER = os.environ.get("NOTIFY_TL_NUMBER", "")
+NOTIFY_MANAGER_NUMBER = os.environ.get("NOTIFY_MANAGER_NUMBER", "")
+
+logger = logging.getLogger("notifications")
+
+notifications_total = registry.counter("notifications_total", "Escalation notifications by outcome", ["outcome"])
+
+PREFIXES = {
+    "team_leader": "[ALERT - WHATSAPP TO TL]",
+    "manager": "[CRITICAL - WHATSAPP TO MANAGER]",
+}
+
+
+class SendError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LogSink:
+    async def send(self, recipient: str, text: str):
+        logger.info(f"{PREFIXES.get(recipient, '[WHATSAPP]')}: {text}")
+
+    async def close(self):
+        pass
+
+
+class WhatsAppSink:
+    """
+    Sends text messages through the WhatsApp Cloud API. `recipients` maps a level
+    ("team_leader", "manager") to a phone number.
+    """
+    def __init__(self, token: str = WHATSAPP_TOKEN, phone_number_id: str = WHATSAPP_PHONE_NUMBER_ID,
+                 recipients: Dict[str, str] = None, api_url: str = WHATSAPP_API_URL, timeout: float = 10.0):
+        self.url = f"{api_url}/{phone_number_id}/messages"
+        self.token = token
+        self.recipients = recipients if recipients is not None else {
+            "team_leader": NOTIFY_TL_NUMBER, "manager": NOTIFY_MANAGER_NUMBER,
+        }
+        self.timeout = timeout
+        self._client = None
+
+    async def send(self, recipient: str, text: str):
+        import httpx
+        to = self.recipients.get(recipient)
+        if not to:
+            raise SendError(f"No phone number configured for {recipient}", retryable=False)
+        if self._client is None:
+            # One pooled client for the dispatcher's lifetime
+            self._client = httpx.AsyncClient(timeout=self.timeout,
+                                             headers={"Authorization": f"Bearer {self.token}"},
+                                             limits=httpx.Limits(max_connections=10, max_keepalive_connections=10))
+        body = {"messaging_product": "whatsapp", "to": to, "type": "text", "text": {"body": text}}
+        try:
+            response = await self._client.post(self.url, json=body)
+        except httpx.HTTPError as e:
+            raise SendError(f"WhatsApp send failed: {e}")
+        if response.status_code >= 400:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise SendError(f"WhatsApp API returned {response.status_code}: {response.text[:200]}", retryable)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def default_sink():
+    if WHATSAPP_TOKEN and WHATSAPP_PHONE_NUMBER_ID:
+        return WhatsAppSink()
+    return LogSink()
+
+
+class _Recipient:
+    def __init__(self, capacity: int):
+        self.pending: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.last_sent = float("-inf")
+        self.tokens = float(capacity)
+        self.refilled = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class NotificationDispatcher:
+    def __init__(self, sink=None, window: float = NOTIFY_DIGEST_WINDOW, rate_per_hour: int = NOTIFY_RATE_PER_HOUR,
+                 retries: int = NOTIFY_RETRIES, backoff: float = NOTIFY_BACKOFF,
+                 max_lines: int = NOTIFY_DIGEST_MAX_LINES):
+        self.sink = sink
+        self.window = window
+        self.rate_per_hour = max(1, rate_per_hour)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_lines = max_lines
+        self._recipients: Dict[str, _Recipient] = {}  # dispatcher thread only
+        self._pending = 0  # items waiting in a digest, for stats() from other threads
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._idle = threading.Condition(self._lock)
+        self.counts = {"queued": 0, "deduped": 0, "messages": 0, "sent": 0, "failed": 0, "retried": 0}
+
+    def notify(self, level: str, message: str, employee_id: str = None, reason: str = None):
+        """
+        Queues an escalation for `level`. Returns immediately.
+        """
+        loop = self._ensure_started()
+        key = (employee_id, " ".join((reason or "").lower().split())) if employee_id else (None, message)
+        with self._lock:
+            self._in_flight += 1
+        loop.call_soon_threadsafe(self._add, level, key, {"message": message, "employee_id": employee_id,
+                                                          "reason": reason})
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Sends every pending digest now (ignoring the window, not the retries) and
+        waits until nothing is queued or being sent.
+        """
+        if self._loop is None:
+            return True
+        self._loop.call_soon_threadsafe(self._flush_all)
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def close(self, timeout: float = 10.0):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+        if loop is None:
+            return
+        self.flush(timeout)
+        asyncio.run_coroutine_threadsafe(self._sink().close(), loop).result(timeout)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        with self._lock:
+            self._loop = self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counts, "pending": self._pending}
+
+    # --- dispatcher thread ---
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(ready,), name="notifications", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _run(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        ready.set()
+        loop.run_forever()
+        loop.close()
+
+    def _sink(self):
+        if self.sink is None:
+            self.sink = default_sink()
+        return self.sink
+
+    def _add(self, level: str, key: tuple, item: Dict[str, Any]):
+        recipient = self._recipients.setdefault(level, _Recipient(self._capacity()))
+        if key in recipient.pending:
+            recipient.pending[key]["repeats"] += 1
+            self._count("deduped")
+            self._done(1)
+            return
+        recipient.pending[key] = {**item, "repeats": 1}
+        with self._lock:
+            self._pending += 1
+        self._count("queued")
+        if recipient.timer is None:
+            delay = self._delay(recipient)
+            recipient.timer = self._loop.call_later(delay, self._send_pending, level)
+
+    def _capacity(self) -> int:
+        # Bucket size: the hourly cap, spread so a burst cannot use the whole hour at once
+        return max(1, self.rate_per_hour // 6)
+
+    def _delay(self, recipient: _Recipient) -> float:
+        now = time.monotonic()
+        capacity = self._capacity()
+        recipient.tokens = min(capacity, recipient.tokens + (now - recipient.refilled) * self.rate_per_hour / 3600)
+        recipient.refilled = now
+        wait_window = max(0.0, recipient.last_sent + self.window - now)
+        wait_tokens = 0.0 if recipient.tokens >= 1 else (1 - recipient.tokens) * 3600 / self.rate_per_hour
+        return max(wait_window, wait_tokens)
+
+    def _flush_all(self):
+        for level, recipient in self._recipients.items():
+            if recipient.pending:
+                if recipient.timer is not None:
+                    recipient.timer.cancel()
+                self._send_pending(level)
+
+    def _send_pending(self, level: str):
+        recipient = self._recipients[level]
+        recipient.timer = None
+        items = list(recipient.pending.values())
+        recipient.pending.clear()
+        if not items:
+            return
+        with self._lock:
+            self._pending -= len(items)
+        recipient.last_sent = time.monotonic()
+        recipient.tokens -= 1
+        self._loop.create_task(self._deliver(level, self.render(items), len(items)))
+
+    def render(self, items: List[Dict[str, Any]]) -> str:
+        if len(items) == 1:
+            item = items[0]
+            suffix = f" (x{item['repeats']})" if item["repeats"] > 1 else ""
+            return item["message"] + suffix
+        lines = [f"{len(items)} escalations:"]
+        for item in items[:self.max_lines]:
+            suffix = f" (x{item['repeats']})" if item["repeats"] > 1 else ""
+            lines.append(f"- {item['message']}{suffix}")
+        if len(items) > self.max_lines:
+            lines.append(f"... and {len(items) - self.max_lines} more")
+        return "\n".join(lines)
+
+    async def _deliver(self, level: str, text: str, n_items: int):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    await self._sink().send(level, text)
+                    self._count("messages")
+                    self._count("sent", n_items)
+                    return
+                except Exception as e:
+                    retryable = getattr(e, "retryable", True)
+                    if not retryable or attempt == self.retries:
+                        logger.error(f"Notification to {level} failed after {attempt + 1} attempts: {e}")
+                        self._count("failed", n_items)
+                        return
+                    self._count("retried")
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2))
+        finally:
+            self._done(n_items)
+
+    def _count(self, outcome: str, n: int = 1):
+        with self._lock:
+            self.counts[outcome] += n
+        notifications_total.inc(n, outcome=outcome)
+
+    def _done(self, n: int):
+        with self._lock:
+            self._in_flight -= n
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+
+default = NotificationDispatcher()
+notify = default.notify
+flush = default.flush
+
+registry.collector("notifications_queue", "Escalation notification dispatcher", default.stats)
+atexit.register(default.close)
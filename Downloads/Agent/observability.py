@@ -0,0 +1,321 @@
+"""
+Latency spans, metrics and logging setup for the attendance agent.
+
+  - span(name, kind)      times a block and records it in the node/call latency histograms
+  - timed(fn, name)       wraps a (sync or async) LangGraph node in a span
+  - latency_breakdown()   collects the spans of one request (e.g. for a Server-Timing header)
+  - registry.render()     Prometheus text format for serve_agent's /metrics route
+  - registry.snapshot()   the same data as a dict, with p50/p95/p99 per series
+
+Histograms keep cumulative Prometheus buckets for scraping, plus a sliding window of the
+last METRICS_WINDOW samples per series so percentiles can be read without Prometheus.
+"""
+import os
+import sys
+import time
+import queue
+import inspect
+import atexit
+import logging
+import threading
+import functools
+import contextvars
+import logging.handlers
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "2048"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- Logging ---
+
+_log_listener = None
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Routes the root logger through a queue, so log calls on the request path never
+    wait on stdout. Leaves logging alone if the application already configured it.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    if _log_listener is not None or root.handlers:
+        return
+    records = queue.Queue(-1)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    _log_listener = logging.handlers.QueueListener(records, stream)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+
+
+# --- Metrics ---
+
+def _quantile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _label_text(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_label_text(self.labelnames, key)} {value}"
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {",".join(key) or "total": value for key, value in sorted(self._values.items())}
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count", "window")
+
+    def __init__(self, n_buckets: int, window: int):
+        self.buckets = [0] * n_buckets
+        self.sum = 0.0
+        self.count = 0
+        self.window = deque(maxlen=window)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS, window: int = METRICS_WINDOW):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(buckets)
+        self.window = window
+        self._series: Dict[Tuple[str, ...], _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.bounds), self.window)
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    series.buckets[i] += 1
+            series.sum += value
+            series.count += 1
+            series.window.append(value)
+
+    def percentiles(self, **labels) -> Dict[str, float]:
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            values = sorted(series.window) if series else []
+            count = series.count if series else 0
+        return {"count": count, "p50": _quantile(values, 0.50), "p95": _quantile(values, 0.95),
+                "p99": _quantile(values, 0.99)}
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, n in zip(self.bounds, series.buckets):
+                    le = _label_text(self.labelnames, key, f'le="{bound}"')
+                    yield f"{self.name}_bucket{le} {n}"
+                le = _label_text(self.labelnames, key, 'le="+Inf"')
+                yield f"{self.name}_bucket{le} {series.count}"
+                yield f"{self.name}_sum{_label_text(self.labelnames, key)} {series.sum}"
+                yield f"{self.name}_count{_label_text(self.labelnames, key)} {series.count}"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            keys = sorted(self._series)
+        return {",".join(key) or "total": {k: round(v, 6) for k, v in self.percentiles(**dict(zip(self.labelnames, key))).items()}
+                for key in keys}
+
+
+class Registry:
+    """
+    Holds the metric families plus callbacks that report component stats at scrape time.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._collectors: Dict[str, Tuple[str, str, Callable[[], Optional[Dict[str, float]]]]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, labelnames, **kwargs))
+
+    def collector(self, name: str, help: str, fn: Callable[[], Optional[Dict[str, float]]], kind: str = "gauge"):
+        """
+        Registers `fn`, returning {stat: value} (or None when the component is not
+        running); each stat is exported as `name{stat="..."}`.
+        """
+        with self._lock:
+            self._collectors[name] = (help, kind, fn)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, (help, kind, fn) in collectors:
+            values = self._collect(name, fn)
+            if not values:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stat, value in sorted(values.items()):
+                lines.append(f'{name}{{stat="{_escape(stat)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            collectors = list(self._collectors.items())
+        result = {name: metric.snapshot() for name, metric in metrics.items()}
+        for name, (_, _, fn) in collectors:
+            values = self._collect(name, fn)
+            if values:
+                result[name] = values
+        return result
+
+    def reset(self):
+        """
+        Clears all recorded values (e.g. between benchmark phases); collectors are kept.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def _register(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    @staticmethod
+    def _collect(name: str, fn) -> Dict[str, float]:
+        try:
+            values = fn() or {}
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Metrics collector {name} failed: {e}")
+            return {}
+        # Only numeric stats are exported
+        return {k: float(v) for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+registry = Registry()
+
+node_latency = registry.histogram("attendance_node_latency_seconds", "Time spent in each LangGraph node", ["node"])
+call_latency = registry.histogram("attendance_external_call_latency_seconds",
+                                  "Time spent in external calls (embedding, vector index, LLM)", ["call"])
+call_errors = registry.counter("attendance_external_call_errors_total", "External calls that raised", ["call"])
+
+
+# --- Spans ---
+
+# Per-request {span name: seconds}, set by latency_breakdown()
+_breakdown: contextvars.ContextVar = contextvars.ContextVar("latency_breakdown", default=None)
+
+@contextmanager
+def span(name: str, kind: str = "call"):
+    """
+    Times the block into the node ("node") or external call ("call") histogram, and
+    into the current request's breakdown if one is being collected.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if kind == "call":
+            call_errors.inc(call=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if kind == "node":
+            node_latency.observe(elapsed, node=name)
+        else:
+            call_latency.observe(elapsed, call=name)
+        entries = _breakdown.get()
+        if entries is not None:
+            entries[name] = entries.get(name, 0.0) + elapsed
+
+def timed(fn: Callable, name: str) -> Callable:
+    """
+    Wraps a graph node (sync or async) in span(name, kind="node").
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with span(name, kind="node"):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(name, kind="node"):
+            return fn(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def latency_breakdown():
+    """
+    Collects the spans recorded in this context (including LangGraph node tasks and
+    asyncio.to_thread calls, which copy the context) into the yielded dict.
+    """
+    entries: Dict[str, float] = {}
+    token = _breakdown.set(entries)
+    try:
+        yield entries
+    finally:
+        _breakdown.reset(token)
+
+def server_timing(entries: Dict[str, float], total: float = None) -> str:
+    """
+    Formats a breakdown as a Server-Timing header value (durations in ms).
+    """
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in entries.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
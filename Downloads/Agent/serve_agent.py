@@ -1,9 +1,16 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import os
 import sys
+import time
+import asyncio
+import logging
+import weakref
 import uvicorn
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 # --- ENV SETUP ---
 # Ensure keys are present (In production, use strict ENV vars)
@@ -12,10 +19,52 @@ os.environ["PINECONE_API_KEY"] = "pcsk_5imSz4_BvLNHRp8hAeiq4VFGGVHUHWjzyWTSCb4kK
 
 # Import Agent
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from attendance_agent import app
+# attendance_agent defers its heavy imports and connections; warm-up runs in the background
+import attendance_agent
+from attendance_agent import shutdown_memory
 from langchain_core.messages import HumanMessage
+from observability import registry, span, latency_breakdown, server_timing
 
-api = FastAPI(title="Autowhat Attendance Agent API")
+logger = logging.getLogger("serve_agent")
+
+# --- CONCURRENCY ---
+# Max /chat requests running through the graph at once; the rest wait for a slot.
+CHAT_MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", "64"))
+# Seconds a request may wait for a slot before it is rejected with 503.
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "30"))
+
+chat_slots = asyncio.Semaphore(CHAT_MAX_CONCURRENCY)
+
+# --- METRICS ---
+# Adds a Server-Timing header with the per-node / per-call breakdown to /chat responses
+LATENCY_HEADER = os.environ.get("LATENCY_HEADER", "0") == "1"
+
+request_latency = registry.histogram("attendance_request_latency_seconds", "/chat latency by outcome", ["status"])
+
+# One turn at a time per employee, so concurrent messages don't race on the same session
+_employee_locks = weakref.WeakValueDictionary()
+
+def employee_lock(employee_id: str) -> asyncio.Lock:
+    lock = _employee_locks.get(employee_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _employee_locks[employee_id] = lock
+    return lock
+
+@asynccontextmanager
+async def lifespan(api):
+    # The Pinecone client is blocking and runs through asyncio.to_thread, so size
+    # the loop's default executor to the concurrency limit instead of cpu_count + 4.
+    executor = ThreadPoolExecutor(max_workers=CHAT_MAX_CONCURRENCY, thread_name_prefix="agent-io")
+    asyncio.get_running_loop().set_default_executor(executor)
+    # Build the graph and connect Gemini/Pinecone without blocking startup; /ready reports progress
+    api.state.warm_up = asyncio.create_task(asyncio.to_thread(attendance_agent.warm_up))
+    yield
+    # Drain write-behind memory saves before the worker exits
+    await asyncio.to_thread(shutdown_memory)
+    executor.shutdown(wait=False)
+
+api = FastAPI(title="Autowhat Attendance Agent API", lifespan=lifespan)
 
 class ChatRequest(BaseModel):
     employee_id: str
@@ -23,39 +72,87 @@ class ChatRequest(BaseModel):
 
 @api.get("/")
 def health_check():
+    # Liveness: the process is up, regardless of warm-up
     return {"status": "active", "service": "Attendance Agent"}
 
+@api.get("/ready")
+def readiness_check():
+    """
+    Readiness: 200 once the graph and LLM are initialized, 503 while warming up.
+    """
+    state = attendance_agent.readiness()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", **state})
+    return {"status": "ready", **state}
+
+@api.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint: latency histograms, decision/fallback counters, cache stats.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @api.post("/chat")
-def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest, response: Response = None):
     """
     Main endpoint for WhatsApp Webhook to call.
     """
-    try:
-        print(f"Incoming: {req.employee_id} - {req.message}")
-        
-        inputs = {
-            "employee_id": req.employee_id,
-            "current_input": req.message,
-            "memory_context": [],
-            "messages": [HumanMessage(content=req.message)]
-        }
-        
-        # Invoke Agent
-        result = app.invoke(inputs)
-        
-        # Extract Response
-        bot_reply = result.get("response", "Processing error.")
-        decision = result.get("analysis_decision", "LOG_ONLY")
-        
-        return {
-            "reply": bot_reply,
-            "decision": decision,
-            "status": "success"
-        }
-        
-    except Exception as e:
-        print(f"API Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    started = time.perf_counter()
+    status = "error"
+    with latency_breakdown() as breakdown:
+        try:
+            result = await _chat(req)
+            status = "success"
+            return result
+        except HTTPException as e:
+            status = "busy" if e.status_code == 503 else "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            request_latency.observe(elapsed, status=status)
+            if LATENCY_HEADER and response is not None:
+                response.headers["Server-Timing"] = server_timing(breakdown, total=elapsed)
+
+async def _chat(req: ChatRequest):
+    # Per-employee lock first: a second message from the same employee waits here
+    # without holding one of the chat slots other employees need
+    async with employee_lock(req.employee_id):
+        try:
+            with span("queue_wait"):
+                await asyncio.wait_for(chat_slots.acquire(), timeout=CHAT_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Agent is busy, please retry.")
+
+        try:
+            logger.info(f"Incoming: {req.employee_id} - {req.message}")
+            
+            inputs = {
+                "employee_id": req.employee_id,
+                "current_input": req.message,
+                "memory_context": [],
+                "messages": [HumanMessage(content=req.message)]
+            }
+            
+            # Invoke Agent (async graph run, does not hold a threadpool thread)
+            app = await attendance_agent.aget_app()
+            # Conversation history is kept server-side per employee (session store checkpointer)
+            result = await app.ainvoke(inputs, attendance_agent.session_config(req.employee_id))
+            
+            # Extract Response
+            bot_reply = result.get("response", "Processing error.")
+            decision = result.get("analysis_decision", "LOG_ONLY")
+            
+            return {
+                "reply": bot_reply,
+                "decision": decision,
+                "status": "success"
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            chat_slots.release()
 
 if __name__ == "__main__":
     # Run with: python serve_agent.py
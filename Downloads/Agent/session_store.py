@@ -0,0 +1,353 @@
+"""
+Server-side conversation sessions for the attendance graph, as a LangGraph checkpointer.
+
+Each employee is one LangGraph thread (thread_id = employee_id). Only the latest
+checkpoint of a session is kept, so a session costs one serialized state, and the
+state's message list is itself a bounded ring buffer (see SESSION_MAX_MESSAGES in
+attendance_agent). Across sessions the store is bounded by:
+  - TTL:   sessions idle for SESSION_TTL seconds are dropped
+  - count: at most SESSION_MAX_SESSIONS are kept in memory (LRU)
+  - size:  at most SESSION_MAX_BYTES of serialized state in memory (LRU)
+
+With SESSION_DB_PATH set, every checkpoint is also written to a local SQLite file, so
+sessions evicted from memory (or lost on restart) are reloaded on their next turn.
+Writes go through a background writer thread (latest checkpoint per thread, one
+transaction per batch), so put/aput never wait on the disk.
+"""
+import os
+import time
+import random
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "7200"))
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "50000"))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(128 * 1024 * 1024)))
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "")
+
+logger = logging.getLogger("session_store")
+
+
+class _Session:
+    __slots__ = ("checkpoint_ns", "checkpoint_id", "parent_id", "checkpoint", "metadata",
+                 "writes", "last_access", "size")
+
+    def __init__(self, checkpoint_ns, checkpoint_id, parent_id, checkpoint, metadata, last_access):
+        self.checkpoint_ns = checkpoint_ns
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint  # (type, bytes) from serde.dumps_typed
+        self.metadata = metadata
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, Tuple[str, bytes], str]] = {}
+        self.last_access = last_access
+        self.size = len(checkpoint[1]) + len(metadata[1])
+
+
+class SessionStore(BaseCheckpointSaver):
+    """
+    Bounded, latest-checkpoint-only LangGraph checkpointer keyed by thread_id.
+    """
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS,
+                 max_bytes: int = SESSION_MAX_BYTES, db_path: str = SESSION_DB_PATH, serde=None):
+        super().__init__(serde=serde)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()  # LRU order, oldest first
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._pending: Dict[str, Optional[_Session]] = {}  # thread_id -> latest unwritten session (None = delete)
+        self._pending_cv = threading.Condition()
+        self._writer = None
+        self._closing = False
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "thread_id TEXT PRIMARY KEY, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT, "
+                "checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, updated_at REAL)"
+            )
+            self._db.commit()
+            self._writer = threading.Thread(target=self._run_writer, name="session-writer", daemon=True)
+            self._writer.start()
+
+    # --- LangGraph checkpointer contract ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            session = self._get_session(thread_id)
+            if session is None or session.checkpoint_ns != checkpoint_ns:
+                return None
+            # Only the latest checkpoint is retained
+            if checkpoint_id and checkpoint_id != session.checkpoint_id:
+                return None
+            return self._to_tuple(thread_id, session)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if config is None:
+            with self._lock:
+                thread_ids = list(self._sessions)
+        else:
+            thread_ids = [config["configurable"]["thread_id"]]
+        count = 0
+        for thread_id in thread_ids:
+            if limit is not None and count >= limit:
+                return
+            tup = self.get_tuple({"configurable": {"thread_id": thread_id,
+                                                   "checkpoint_ns": (config or {}).get("configurable", {}).get("checkpoint_ns", "")}})
+            if tup is None:
+                continue
+            if filter and not all(tup.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if before and get_checkpoint_id(before) and tup.config["configurable"]["checkpoint_id"] >= get_checkpoint_id(before):
+                continue
+            count += 1
+            yield tup
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        session = _Session(
+            checkpoint_ns=checkpoint_ns,
+            checkpoint_id=checkpoint["id"],
+            parent_id=config["configurable"].get("checkpoint_id"),
+            checkpoint=self.serde.dumps_typed(checkpoint),
+            metadata=self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+            last_access=time.time(),
+        )
+        with self._lock:
+            self._store(thread_id, session)
+            self._persist(thread_id, session)
+            self._evict()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is None or session.checkpoint_id != checkpoint_id:
+                return
+            for idx, (channel, value) in enumerate(writes):
+                key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+                if key[1] >= 0 and key in session.writes:
+                    continue
+                typed = self.serde.dumps_typed(value)
+                session.writes[key] = (task_id, channel, typed, task_path)
+                session.size += len(typed[1])
+                self._bytes += len(typed[1])
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+            self._persist(thread_id, None)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # In-memory operations are fast and disk writes are queued; the async variants run them inline.
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for tup in self.list(config, filter=filter, before=before, limit=limit):
+            yield tup
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    # --- Session management ---
+
+    def reset(self, employee_id: str):
+        """
+        Forgets an employee's conversation (e.g. after a completed check-in).
+        """
+        self.delete_thread(employee_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued write has reached the database.
+        """
+        with self._pending_cv:
+            return self._pending_cv.wait_for(lambda: not self._pending, timeout)
+
+    def close(self, timeout: float = 10.0):
+        if self._writer is not None:
+            with self._pending_cv:
+                self._closing = True
+                self._pending_cv.notify_all()
+            self._writer.join(timeout)
+            self._writer = None
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+                self._db = None
+
+    # --- Internals (callers hold self._lock) ---
+
+    def _get_session(self, thread_id: str) -> Optional[_Session]:
+        now = time.time()
+        session = self._sessions.get(thread_id)
+        if session is None:
+            session = self._load(thread_id)
+            if session is None:
+                return None
+            self._store(thread_id, session)
+        if now - session.last_access > self.ttl:
+            self.expirations += 1
+            self.delete_thread(thread_id)
+            return None
+        session.last_access = now
+        self._sessions.move_to_end(thread_id)
+        self._evict()
+        return self._sessions.get(thread_id)
+
+    def _store(self, thread_id: str, session: _Session):
+        self._drop(thread_id)
+        self._sessions[thread_id] = session
+        self._bytes += session.size
+
+    def _drop(self, thread_id: str):
+        old = self._sessions.pop(thread_id, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    def _evict(self):
+        now = time.time()
+        # Oldest access first, so expired sessions sit at the front
+        while self._sessions:
+            thread_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access > self.ttl:
+                self.expirations += 1
+                self._drop(thread_id)
+            elif len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes:
+                # Still on disk (if persistence is on) and reloaded on the next turn
+                self.evictions += 1
+                self._drop(thread_id)
+            else:
+                break
+
+    def _to_tuple(self, thread_id: str, session: _Session) -> CheckpointTuple:
+        def config_for(checkpoint_id):
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": session.checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}}
+
+        return CheckpointTuple(
+            config=config_for(session.checkpoint_id),
+            checkpoint=self.serde.loads_typed(session.checkpoint),
+            metadata=self.serde.loads_typed(session.metadata),
+            parent_config=config_for(session.parent_id) if session.parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value))
+                            for task_id, channel, value, _ in session.writes.values()],
+        )
+
+    def _persist(self, thread_id: str, session: Optional[_Session]):
+        # Queued for the writer thread; a newer checkpoint replaces an unwritten one
+        if self._writer is None:
+            return
+        with self._pending_cv:
+            self._pending[thread_id] = session
+            self._pending_cv.notify_all()
+
+    def _load(self, thread_id: str) -> Optional[_Session]:
+        if self._db is None:
+            return None
+        with self._pending_cv:
+            if thread_id in self._pending:
+                return self._pending[thread_id]
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint, "
+                "metadata_type, metadata, updated_at FROM sessions WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return _Session(row[0], row[1], row[2], (row[3], row[4]), (row[5], row[6]), row[7])
+
+    # --- Writer thread ---
+
+    def _run_writer(self):
+        while True:
+            with self._pending_cv:
+                self._pending_cv.wait_for(lambda: self._pending or self._closing)
+                if not self._pending:
+                    return
+                batch = dict(self._pending)
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:
+                logger.error(f"Session store write failed for {len(batch)} sessions: {e}")
+            with self._pending_cv:
+                # Entries replaced while this batch was written stay queued
+                for thread_id, session in batch.items():
+                    if self._pending.get(thread_id, batch) is session:
+                        del self._pending[thread_id]
+                self._pending_cv.notify_all()
+
+    def _write(self, batch: Dict[str, Optional[_Session]]):
+        with self._db_lock:
+            for thread_id, session in batch.items():
+                if session is None:
+                    self._db.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+                    continue
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, session.checkpoint_ns, session.checkpoint_id, session.parent_id,
+                     session.checkpoint[0], session.checkpoint[1], session.metadata[0], session.metadata[1],
+                     session.last_access),
+                )
+            self._db.commit()
@@ -0,0 +1,81 @@
+"""
+Side effects that run after the reply (notifications, memory saves, trace logging).
+
+after_reply(name, fn, *args) hands `fn` to a small thread pool and returns at once,
+so the caller's reply only waits for the steps that determine it. A failed side
+effect is logged and counted in side_effects_total{effect, outcome="failed"}
+instead of being lost or raised into the request.
+
+drain() waits for everything submitted so far (benchmarks, tests, shutdown). At exit
+attendance_agent.shutdown_memory() drains the pool before stopping the memory writer.
+"""
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from observability import registry
+
+SIDE_EFFECT_WORKERS = int(os.environ.get("SIDE_EFFECT_WORKERS", "4"))
+# Run side effects inline instead (debugging, or deterministic scripts)
+SIDE_EFFECTS_INLINE = os.environ.get("SIDE_EFFECTS_INLINE", "0") == "1"
+
+logger = logging.getLogger("side_effects")
+
+outcomes = registry.counter("side_effects_total", "Post-reply side effects by outcome", ["effect", "outcome"])
+
+
+class SideEffects:
+    def __init__(self, workers: int = SIDE_EFFECT_WORKERS, inline: bool = SIDE_EFFECTS_INLINE):
+        self.workers = workers
+        self.inline = inline
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs):
+        if self.inline:
+            self._run(name, fn, args, kwargs)
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="side-effect")
+            self._pending += 1
+        # Submitted without the caller's context, so its spans don't land in the reply's breakdown
+        self._pool.submit(self._run_pending, name, fn, args, kwargs)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self._pending, "workers": self.workers}
+
+    def _run_pending(self, name: str, fn: Callable, args, kwargs):
+        try:
+            self._run(name, fn, args, kwargs)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    @staticmethod
+    def _run(name: str, fn: Callable, args, kwargs) -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            outcomes.inc(effect=name, outcome="failed")
+            logger.error(f"Side effect {name} failed: {e}")
+            return None
+        outcomes.inc(effect=name, outcome="ok")
+        return result
+
+
+default = SideEffects()
+after_reply = default.submit
+drain = default.drain
+
+registry.collector("side_effects_queue", "Side effects waiting or running", default.stats)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import fakes
+from batch_agent import GroupedIndex, completed_ids, plan_waves, read_records, run_batch
+
+TRAFFIC = "late because of heavy traffic, came by bus"
+DAY = 86400
+
+
+def record(id, employee_id, timestamp=None, message=TRAFFIC):
+    return {"id": id, "employee_id": employee_id, "message": message, "timestamp": timestamp}
+
+
+def test_read_records_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "in.jsonl"
+    jsonl.write_text('{"employee_id": "E1", "message": "hi", "timestamp": 1700000000}\n\n'
+                     '{"id": "x", "employee_id": 7, "message": "bus late", "timestamp": "2024-01-02T09:00:00Z"}\n')
+    csv = tmp_path / "in.csv"
+    csv.write_text("employee_id,message,timestamp\nE1,hi,\n")
+
+    first, second = read_records(str(jsonl))
+    assert first == {"id": "1", "employee_id": "E1", "message": "hi", "timestamp": 1700000000.0}
+    assert (second["id"], second["employee_id"]) == ("x", "7")
+    assert second["timestamp"] == datetime(2024, 1, 2, 9, tzinfo=timezone.utc).timestamp()
+    assert read_records(str(csv)) == [{"id": "1", "employee_id": "E1", "message": "hi", "timestamp": None}]
+
+
+def test_read_records_requires_employee_and_message(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"employee_id": "E1", "message": ""}\n')
+    with pytest.raises(ValueError, match="row 1"):
+        read_records(str(path))
+
+
+def test_completed_ids_skip_errors_and_cut_lines(tmp_path):
+    out = tmp_path / "out.jsonl"
+    assert completed_ids(str(out)) == set()
+    out.write_text('{"id": "1", "decision": "LOG_ONLY"}\n{"id": "2", "error": "boom"}\n{"id": "3", "deci')
+    assert completed_ids(str(out)) == {"1"}
+
+
+def test_waves_hold_each_employees_kth_message_in_time_order():
+    records = [record("a", "E1", 30), record("b", "E2", 5), record("c", "E1", 10), record("d", "E1", None)]
+    waves = plan_waves(records)
+    assert [[r["id"] for r in wave] for wave in waves] == [["d", "b"], ["c"], ["a"]]
+    assert plan_waves([]) == []
+
+
+def test_grouped_index_answers_repeat_queries_locally(embeddings):
+    index = fakes.FakeIndex()
+    index.upsert(vectors=[("m1", embeddings.embed_query(TRAFFIC), {"employee_id": "E1", "text": TRAFFIC}),
+                          ("m2", embeddings.embed_query("fever"), {"employee_id": "E2", "text": "fever"})])
+    grouped = GroupedIndex(index, scan=100, dimension=768)
+    owner = {"employee_id": {"$eq": "E1"}}
+    query = embeddings.embed_query(TRAFFIC)
+
+    for _ in range(3):
+        matches = grouped.query(query, top_k=5, filter=owner, include_metadata=True)["matches"]
+        assert [m["id"] for m in matches] == ["m1"]
+    grouped.upsert(vectors=[("m3", query, {"employee_id": "E1", "text": TRAFFIC})])
+    assert {m["id"] for m in grouped.query(query, top_k=5, filter=owner)["matches"]} == {"m1", "m3"}
+    grouped.delete(ids=["m1"])
+    assert [m["id"] for m in grouped.query(query, top_k=5, filter=owner)["matches"]] == ["m3"]
+    assert (grouped.remote_queries, grouped.local_queries) == (1, 5)
+
+
+def test_grouped_index_sends_large_histories_to_the_index(embeddings):
+    index = fakes.FakeIndex()
+    index.upsert(vectors=[(f"m{i}", embeddings.embed_query(f"{TRAFFIC} {i}"), {"employee_id": "E1"})
+                          for i in range(3)])
+    grouped = GroupedIndex(index, scan=2, dimension=768)
+    for _ in range(2):
+        grouped.query(embeddings.embed_query(TRAFFIC), top_k=1, filter={"employee_id": {"$eq": "E1"}})
+    assert (grouped.remote_queries, grouped.local_queries) == (3, 0)
+
+
+def test_run_batch_resumes_and_routes_escalations_to_the_given_sink(agent, tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text('{"id": "1", "decision": "ESCALATE_TL"}')  # cut short: no newline
+    sink = fakes.RecordingSink()
+    records = [record("1", "B1", 100), record("2", "B1", 200), record("3", "B2", 100)]
+
+    totals = asyncio.run(run_batch(records, str(out), notify_sink=sink))
+    assert (totals["skipped"], totals["ok"], totals["errors"], totals["waves"]) == (1, 2, 0, 1)
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(r["id"] for r in lines[1:]) == ["2", "3"]
+    assert {r["decision"] for r in lines[1:]} == {"ESCALATE_TL"}
+    # Every escalation reached the batch's sink (maybe as one digest), and the live one is back in place
+    assert {recipient for recipient, _ in sink.sent} == {"team_leader"}
+    sent = "\n".join(text for _, text in sink.sent)
+    assert "Employee B1" in sent and "Employee B2" in sent
+    assert agent.notifications.default.sink is not sink
+
+
+def test_search_window_counts_back_from_the_message_time(agent, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, "MEMORY_SEARCH_WINDOW_DAYS", 7)
+    start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc).timestamp()
+    assert agent._search_since({"timestamp": start}) == start - 7 * DAY
+
+    records = [record("1", "B3", start), record("2", "B3", start + DAY), record("3", "B3", start + 30 * DAY)]
+    asyncio.run(run_batch(records, str(tmp_path / "out.jsonl"), notify_sink=fakes.RecordingSink()))
+    results = {r["id"]: r for r in map(json.loads, (tmp_path / "out.jsonl").read_text().splitlines())}
+    # The day-old excuse is in the second message's window. The month-old ones are not in the
+    # third's, so it is a first occurrence again and gets the first message's cached LLM decision
+    assert [results[i]["decided_by"] for i in "123"] == ["llm", "rules", "cache"]
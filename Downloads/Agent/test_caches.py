@@ -0,0 +1,86 @@
+import time
+
+import attendance_agent
+from attendance_agent import DecisionCache, EmbeddingCache
+
+ESCALATE = {"analysis_decision": "ESCALATE_TL", "response": "TL notified."}
+
+
+def test_embedding_cache_normalizes_keys_and_evicts_lru():
+    cache = EmbeddingCache(max_entries=2, path="")
+    cache.put("Late  because of TRAFFIC", [1.0, 0.0])
+    assert cache.get("late because of traffic") == [1.0, 0.0]
+
+    cache.put("bus broke down", [0.0, 1.0])
+    cache.get("late because of traffic")  # most recently used now
+    cache.put("overslept", [0.5, 0.5])
+    assert cache.get("bus broke down") is None
+    assert cache.get("late because of traffic") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_embedding_cache_persists_per_model(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(path=path, model="models/a").put("train delayed", [0.25, 0.75])
+
+    reopened = EmbeddingCache(path=path, model="models/a")
+    assert reopened.get("Train delayed") == [0.25, 0.75]
+    assert reopened.stats()["disk_hits"] == 1
+    # Vectors from another embedding model are not reused
+    assert EmbeddingCache(path=path, model="models/b").get("train delayed") is None
+
+
+def test_manager_embeds_each_text_once(manager, embeddings):
+    manager.execute("search", "E1", "late because of traffic")
+    manager.execute("save", "E1", "Late because of traffic")
+    assert embeddings.calls == 1
+
+
+def test_decision_cache_expires_entries():
+    cache = DecisionCache(ttl=0.05)
+    cache.put("k", ESCALATE, employee_id="E1")
+    assert cache.get("k") == ESCALATE
+    time.sleep(0.1)
+    assert cache.get("k") is None
+
+
+def test_invalidate_drops_only_that_employees_entries():
+    cache = DecisionCache()
+    cache.put("e1", ESCALATE, employee_id="E1")
+    cache.put("e2", ESCALATE, employee_id="E2")
+    cache.put("shared", {"analysis_decision": "ASK_REASON", "response": "Why?"})
+
+    cache.invalidate("E1")
+    assert cache.get("e1") is None
+    assert cache.get("e2") == ESCALATE
+    assert cache.get("shared") is not None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lru_bound_keeps_employee_index_consistent():
+    cache = DecisionCache(max_entries=2)
+    cache.put("a", ESCALATE, employee_id="E1")
+    cache.put("b", ESCALATE, employee_id="E1")
+    cache.put("c", ESCALATE, employee_id="E2")
+    assert cache.get("a") is None
+    cache.invalidate("E1")
+    assert cache.get("b") is None
+    assert cache.get("c") == ESCALATE
+
+
+def test_key_depends_on_the_repeat_count():
+    state = {"current_input": "late, bus broke down", "memory_context": [], "messages": []}
+    assert DecisionCache.key_for({**state, "similar_count": 1}) != DecisionCache.key_for({**state, "similar_count": 2})
+    assert DecisionCache.key_for(state) == DecisionCache.key_for({**state, "current_input": "Late,  BUS broke down"})
+
+
+def test_memory_save_invalidates_the_employees_decisions(manager):
+    cache = attendance_agent.decision_cache
+    cache.put("before-save", ESCALATE, employee_id="E7")
+    cache.put("other", ESCALATE, employee_id="E8")
+    try:
+        assert manager.execute("save", "E7", "late because of traffic")["status"] == "success"
+        assert cache.get("before-save") is None
+        assert cache.get("other") == ESCALATE
+    finally:
+        cache.clear()
@@ -0,0 +1,74 @@
+import pytest
+
+import attendance_agent
+from batch_agent import GroupedIndex
+from compact_index import CompactVectorIndex
+from local_index import LocalVectorIndex
+
+TRAFFIC = "late because of heavy traffic, came by bus"
+OVERSLEPT = "overslept, alarm did not ring"
+OWNER = {"employee_id": {"$eq": "E1"}}
+
+
+@pytest.fixture(params=[False, True], ids=["truncated", "rerank"])
+def compact_manager(request, tmp_path, embeddings):
+    index = CompactVectorIndex(dimension=768, path=str(tmp_path), dims=256, rerank=request.param)
+    mm = attendance_agent.VectorMemoryManager(embeddings=embeddings, index=index,
+                                              excuse_clusters=attendance_agent.ExcuseClusters(path=""))
+    yield mm
+    mm.close()
+
+
+def test_clusters_use_the_stored_dimension_without_rerank(compact_manager):
+    expected = None if compact_manager.index.rerank else 256
+    assert compact_manager.excuse_clusters.dims == expected
+
+
+def test_counts_survive_compaction(compact_manager):
+    for text in [TRAFFIC] * 4 + [OVERSLEPT] * 2:
+        assert compact_manager.execute("save", "E1", text)["status"] == "success"
+    assert compact_manager.execute("search", "E1", TRAFFIC)["similar_count"] == 4
+
+    result = compact_manager.compact("E1")
+    assert (result["merged"], result["kept"]) == (4, 2)
+    assert compact_manager.execute("search", "E1", TRAFFIC)["similar_count"] == 4
+    assert compact_manager.execute("search", "E1", OVERSLEPT)["similar_count"] == 2
+
+
+def test_rerank_scores_match_the_exact_index(tmp_path, embeddings):
+    exact = LocalVectorIndex(dimension=768)
+    compact = CompactVectorIndex(dimension=768, path=str(tmp_path), dims=256, rerank=True)
+    texts = [TRAFFIC, OVERSLEPT, "train was cancelled", "fever since last night"]
+    for index in (exact, compact):
+        index.upsert(vectors=[(f"m{i}", embeddings.embed_query(t), {"employee_id": "E1"})
+                              for i, t in enumerate(texts)])
+    query = embeddings.embed_query("heavy traffic, bus was late")
+    want = exact.query(vector=query, top_k=2, filter=OWNER)["matches"]
+    got = compact.query(vector=query, top_k=2, filter=OWNER)["matches"]
+    assert [m["id"] for m in got] == [m["id"] for m in want]
+    assert [m["score"] for m in got] == pytest.approx([m["score"] for m in want], abs=1e-4)
+
+
+def test_grouped_index_scores_truncated_and_full_records(tmp_path, embeddings):
+    compact = CompactVectorIndex(dimension=768, path=str(tmp_path), dims=256, rerank=False)
+    compact.upsert(vectors=[("old", embeddings.embed_query(TRAFFIC), {"employee_id": "E1", "text": TRAFFIC})])
+    grouped = GroupedIndex(compact, scan=1000, dimension=768)
+    query = embeddings.embed_query(TRAFFIC)
+
+    first = grouped.query(query, top_k=5, filter=OWNER)["matches"]
+    # Upserted during the run: kept at full length next to the 256-dimension copy
+    grouped.upsert(vectors=[("new", query, {"employee_id": "E1", "text": TRAFFIC})])
+    matches = grouped.query(query, top_k=5, filter=OWNER)["matches"]
+
+    assert first[0]["score"] == pytest.approx(1.0, abs=1e-2)
+    assert {m["id"] for m in matches} == {"old", "new"}
+    assert all(m["score"] == pytest.approx(1.0, abs=1e-2) for m in matches)
+    assert grouped.remote_queries == 1
+
+
+def test_bytes_per_vector_counts_the_rerank_copy():
+    truncated = CompactVectorIndex(dimension=768, dims=256, dtype="int8", rerank=False)
+    reranked = CompactVectorIndex(dimension=768, dims=256, dtype="int8", rerank=True)
+    assert (truncated.scanned_bytes_per_vector(), truncated.bytes_per_vector()) == (260, 260)
+    assert (reranked.scanned_bytes_per_vector(), reranked.bytes_per_vector()) == (260, 260 + 768 * 4)
+    assert reranked.describe_index_stats()["bytes_per_vector"] == 3332
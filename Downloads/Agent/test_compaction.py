@@ -0,0 +1,135 @@
+import array
+import sqlite3
+import time
+import uuid
+
+import attendance_agent
+
+TRAFFIC = "late because of heavy traffic, came by bus"
+OVERSLEPT = "overslept, alarm did not ring"
+DAY = 86400
+
+
+def records(mm, employee_id="E1"):
+    return [r["metadata"] for r in mm.index.vectors.values() if r["metadata"]["employee_id"] == employee_id]
+
+
+def test_near_duplicates_merge_into_the_newest_record(manager):
+    now = time.time()
+    for i in range(5):
+        manager.execute("save", "E1", TRAFFIC, timestamp=now - 50 + i)
+    manager.execute("save", "E1", OVERSLEPT, timestamp=now)
+
+    result = manager.compact("E1")
+    assert result == {"scanned": 6, "merged": 4, "expired": 0, "kept": 2}
+    merged = next(m for m in records(manager) if m["text"] == TRAFFIC)
+    assert (merged["count"], merged["first_seen"], merged["timestamp"]) == (5, now - 50, now - 46)
+    assert manager.execute("search", "E1", TRAFFIC)["similar_count"] == 5
+
+    # A second pass finds nothing left to merge
+    assert manager.compact("E1")["merged"] == 0
+
+
+def test_retention_deletes_old_memories_and_their_counts(manager):
+    now = time.time()
+    for days_ago in (40, 35, 1):
+        manager.execute("save", "E1", TRAFFIC, timestamp=now - days_ago * DAY)
+    manager.execute("save", "E2", TRAFFIC, timestamp=now - 40 * DAY)
+    assert manager.execute("search", "E1", TRAFFIC)["similar_count"] == 3
+
+    result = manager.compact("E1", retention_days=30)
+    assert (result["expired"], result["kept"]) == (2, 1)
+    assert [m["timestamp"] for m in records(manager)] == [now - DAY]
+    assert manager.execute("search", "E1", TRAFFIC)["similar_count"] == 1
+    # Other employees are untouched
+    assert len(records(manager, "E2")) == 1
+
+
+def test_retention_zero_keeps_everything(manager):
+    manager.execute("save", "E1", TRAFFIC, timestamp=time.time() - 400 * DAY)
+    assert manager.compact("E1", retention_days=0)["expired"] == 0
+    assert len(records(manager)) == 1
+
+
+def test_compaction_invalidates_cached_decisions(manager):
+    for _ in range(2):
+        manager.execute("save", "E1", TRAFFIC)
+    attendance_agent.decision_cache.put("k", {"analysis_decision": "LOG_ONLY", "response": "ok"}, employee_id="E1")
+    try:
+        manager.compact("E1")
+        assert attendance_agent.decision_cache.get("k") is None
+    finally:
+        attendance_agent.decision_cache.clear()
+
+
+def test_search_window_leaves_out_older_memories(manager):
+    now = time.time()
+    manager.execute("save", "E1", TRAFFIC, timestamp=now - 10 * DAY)
+    manager.execute("save", "E1", TRAFFIC, timestamp=now - DAY)
+    result = manager.execute("search", "E1", TRAFFIC, since=now - 7 * DAY)
+    assert len(result["matches"]) == 1
+    assert result["similar_count"] == 1
+
+
+def test_windowed_counts_survive_a_restart(tmp_path, embeddings):
+    path = str(tmp_path / "clusters.db")
+    now = time.time()
+    clusters = attendance_agent.ExcuseClusters(path=path)
+    for days_ago in (10, 9, 1):
+        clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC, timestamp=now - days_ago * DAY)
+
+    reopened = attendance_agent.ExcuseClusters(path=path)
+    assert reopened.count("E1", embeddings.embed_query(TRAFFIC)) == 3
+    assert reopened.count("E1", embeddings.embed_query(TRAFFIC), since=now - 7 * DAY) == 1
+
+
+def test_clusters_saved_without_day_counts_still_load(tmp_path, embeddings):
+    path = str(tmp_path / "clusters.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE excuse_clusters (employee_id TEXT, id TEXT, label TEXT, centroid BLOB, "
+               "count INTEGER, first_seen REAL, last_seen REAL, PRIMARY KEY (employee_id, id))")
+    db.execute("INSERT INTO excuse_clusters VALUES (?, ?, ?, ?, ?, ?, ?)",
+               ("E1", "c1", TRAFFIC, array.array("f", embeddings.embed_query(TRAFFIC)).tobytes(), 4,
+                time.time() - 20 * DAY, time.time() - DAY))
+    db.commit()
+    db.close()
+
+    clusters = attendance_agent.ExcuseClusters(path=path)
+    assert clusters.count("E1", embeddings.embed_query(TRAFFIC), since=time.time() - 7 * DAY) == 4
+    clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC)
+    assert attendance_agent.ExcuseClusters(path=path).count("E1", embeddings.embed_query(TRAFFIC)) == 5
+
+
+def new_record(embeddings, text):
+    return (str(uuid.uuid4()), embeddings.embed_query(text),
+            {"employee_id": "E1", "timestamp": time.time(), "text": text})
+
+
+def test_save_missing_from_the_scan_keeps_its_count(manager, embeddings):
+    for _ in range(3):
+        manager.execute("save", "E1", TRAFFIC)
+    # Written and clustered, but not yet returned by queries (index freshness lag)
+    lagging = new_record(embeddings, OVERSLEPT)
+    manager._memory_saving([lagging])
+    manager._memory_saved([lagging])
+
+    manager.compact("E1")
+    assert manager.execute("search", "E1", TRAFFIC)["similar_count"] == 3
+    assert manager.excuse_clusters.count("E1", lagging[1]) == 1
+
+
+def test_save_seen_by_the_scan_before_its_update_counts_once(manager, embeddings):
+    for _ in range(3):
+        manager.execute("save", "E1", TRAFFIC)
+    # Upserted before the compaction's scan, cluster update only after its rebuild
+    racing = new_record(embeddings, TRAFFIC)
+    manager._memory_saving([racing])
+    manager.index.upsert(vectors=[racing])
+    manager.compact("E1")
+    manager._memory_saved([racing])
+
+    assert manager.excuse_clusters.count("E1", racing[1]) == 4
+    # Later compactions neither drop nor re-add it
+    manager.execute("save", "E1", TRAFFIC)
+    manager.compact("E1")
+    assert manager.excuse_clusters.count("E1", racing[1]) == 5
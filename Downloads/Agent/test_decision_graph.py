@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+import fakes
+
+
+@pytest.fixture
+def make_graph(server, monkeypatch):
+    """
+    Builds a DecisionContextGraph on a FakeGraphDriver, with NEO4J_* settings overridden.
+    """
+    graphs = []
+
+    def refuse(*args, **kwargs):
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(server.GraphDatabase, "driver", refuse)
+
+    def make(**settings):
+        for name, value in settings.items():
+            monkeypatch.setattr(server, name, value)
+        graph = server.DecisionContextGraph("bolt://offline", "neo4j", "password")
+        assert graph.driver is None
+        graph.use_driver(fakes.FakeGraphDriver())
+        graphs.append(graph)
+        return graph
+
+    yield make
+    for graph in graphs:
+        graph.close()
+
+
+def trace_runs(graph):
+    return [params["traces"] for query, params in graph.driver.runs if query == graph.TRACE_QUERY]
+
+
+def test_schema_is_created_once_per_driver(make_graph, server):
+    graph = make_graph()
+    assert [query for query, _ in graph.driver.runs] == server.DecisionContextGraph.SCHEMA
+
+
+def test_traces_are_written_as_one_unwind_statement(make_graph):
+    graph = make_graph(NEO4J_BATCH_SIZE=500, NEO4J_FLUSH_INTERVAL=60.0)
+    for i in range(5):
+        graph.log_decision_trace(f"E{i}", "Interaction", "late, traffic")
+    assert graph.flush(5)
+
+    runs = trace_runs(graph)
+    assert len(runs) == 1
+    assert [t["employee_id"] for t in runs[0]] == [f"E{i}" for i in range(5)]
+    assert {t["policy"] for t in runs[0]} == {graph.POLICY_VERSION}
+    assert graph.stats() == {"written": 5, "failed": 0, "batches": 1, "pending": 0, "dropped": 0}
+
+
+def test_batches_are_split_at_the_batch_size(make_graph):
+    graph = make_graph(NEO4J_BATCH_SIZE=2, NEO4J_FLUSH_INTERVAL=60.0)
+    for i in range(5):
+        graph.log_decision_trace(f"E{i}", "Interaction", "late, traffic")
+    assert graph.flush(5)
+    assert [len(traces) for traces in trace_runs(graph)] == [2, 2, 1]
+
+
+def test_without_write_behind_each_trace_is_written_inline(make_graph):
+    graph = make_graph(NEO4J_WRITE_BEHIND=False)
+    assert graph.writer is None
+    graph.log_decision_trace("E1", "Interaction", "late, traffic")
+    assert [len(traces) for traces in trace_runs(graph)] == [1]
+
+
+def test_full_writer_times_out_instead_of_blocking(server):
+    release = threading.Event()
+
+    def write_batch(batch):
+        release.wait(5)
+
+    writer = server.BatchWriter("test", write_batch, batch_size=1,
+                                flush_interval=60.0, max_queue=1)
+    try:
+        # The worker holds at most one item while blocked, the queue one more
+        accepted = [writer.submit(i, timeout=0.05) for i in range(4)]
+        assert accepted[:1] == [True] and accepted[-1] is False
+        start = time.monotonic()
+        assert writer.submit("late", timeout=0.05) is False
+        assert time.monotonic() - start < 1.0
+    finally:
+        release.set()
+        writer.close(5)
+    assert writer.written == accepted.count(True)
+
+
+def test_traces_are_dropped_when_neo4j_falls_behind(make_graph):
+    graph = make_graph(NEO4J_BATCH_SIZE=1, NEO4J_WRITE_QUEUE_SIZE=2, NEO4J_BACKPRESSURE_TIMEOUT=0.02)
+    start = time.monotonic()
+    with graph.driver._lock:
+        # The writer is stuck in session.run; callers wait out the timeout, then shed the trace
+        for i in range(10):
+            graph.log_decision_trace(f"E{i}", "Interaction", "late, traffic")
+        assert time.monotonic() - start < 2.0
+        assert graph.dropped >= 7
+    assert graph.flush(5)
+    stats = graph.stats()
+    assert stats["written"] + stats["dropped"] == 10
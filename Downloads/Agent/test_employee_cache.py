@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+import fakes
+
+
+@pytest.fixture
+def facts(server, monkeypatch):
+    """
+    The server's FactSystem on a fresh employee collection and cache.
+    """
+    facts = server.fact_system
+    monkeypatch.setattr(facts, "employee_records", fakes.FakeCollection())
+    monkeypatch.setattr(facts, "employee_cache", server.RecordCache(max_entries=100, ttl=60, negative_ttl=60))
+    facts.employee_records.insert_many([{"employee_id": "E1", "name": "Asha", "role": "Engineer"},
+                                        {"employee_id": "E2", "name": "Ravi", "role": "Team Leader"}])
+    return facts
+
+
+def rename(facts, employee_id, name):
+    facts.employee_records.update_one({"employee_id": employee_id}, {"$set": {"name": name}})
+
+
+def test_cache_counts_hits_misses_and_negative_hits(server):
+    cache = server.RecordCache(max_entries=10, ttl=60, negative_ttl=60)
+    assert cache.get("E1") == (False, None)
+    cache.put("E1", {"name": "Asha"})
+    cache.put("E9", None)
+    assert cache.get("E1") == (True, {"name": "Asha"})
+    assert cache.get("E9") == (True, None)
+    assert cache.stats() == {"hits": 1, "negative_hits": 1, "misses": 1, "invalidations": 0, "size": 2}
+
+
+def test_entries_expire_after_their_ttl(server):
+    cache = server.RecordCache(max_entries=10, ttl=0.05, negative_ttl=60)
+    cache.put("E1", {"name": "Asha"})
+    cache.put("E9", None)
+    time.sleep(0.06)
+    assert cache.get("E1") == (False, None)
+    assert cache.get("E9") == (True, None)
+    assert cache.stats()["size"] == 1
+
+
+def test_negative_entries_expire_sooner(server):
+    cache = server.RecordCache(max_entries=10, ttl=60, negative_ttl=0.05)
+    cache.put("E1", {"name": "Asha"})
+    cache.put("E9", None)
+    time.sleep(0.06)
+    assert cache.get("E9") == (False, None)
+    assert cache.get("E1") == (True, {"name": "Asha"})
+
+
+def test_least_recently_used_entry_is_dropped(server):
+    cache = server.RecordCache(max_entries=2, ttl=60, negative_ttl=60)
+    cache.put("E1", {"name": "Asha"})
+    cache.put("E2", {"name": "Ravi"})
+    cache.get("E1")
+    cache.put("E3", {"name": "Meera"})
+    assert [cache.get(k)[0] for k in ("E1", "E2", "E3")] == [True, False, True]
+
+
+def test_employee_record_is_read_once(facts):
+    for _ in range(3):
+        assert facts.get_employee_record("E1")["name"] == "Asha"
+    assert facts.employee_records.read_calls == 1
+    # Callers get a copy, not the cached record
+    facts.get_employee_record("E1")["name"] = "changed"
+    assert facts.get_employee_record("E1")["name"] == "Asha"
+
+
+def test_unknown_employee_is_remembered_until_the_negative_ttl(facts, server, monkeypatch):
+    monkeypatch.setattr(facts, "employee_cache", server.RecordCache(max_entries=100, ttl=60, negative_ttl=0.05))
+    assert facts.get_employee_record("E404") == {"employee_id": "E404", "name": "Unknown", "role": "Employee"}
+    facts.employee_records.insert_one({"employee_id": "E404", "name": "New Joiner", "role": "Engineer"})
+    assert facts.get_employee_record("E404")["name"] == "Unknown"
+    assert facts.employee_records.read_calls == 1
+
+    time.sleep(0.06)
+    assert facts.get_employee_record("E404")["name"] == "New Joiner"
+
+
+def test_invalidate_route_drops_one_or_all_employees(facts, server):
+    client = server.app.test_client()
+    facts.get_employee_record("E1")
+    facts.get_employee_record("E2")
+    rename(facts, "E1", "Asha K")
+    rename(facts, "E2", "Ravi S")
+
+    response = client.post("/cache/employees/invalidate", json={"employee_id": "E1"})
+    assert response.get_json() == {"invalidated": ["E1"]}
+    assert facts.get_employee_record("E1")["name"] == "Asha K"
+    assert facts.get_employee_record("E2")["name"] == "Ravi"
+
+    response = client.post("/cache/employees/invalidate", json={})
+    assert response.get_json() == {"invalidated": "all"}
+    assert facts.get_employee_record("E2")["name"] == "Ravi S"
+
+    rename(facts, "E1", "Asha R")
+    rename(facts, "E2", "Ravi T")
+    client.post("/cache/employees/invalidate", json={"employee_ids": ["E1", "E2"]})
+    assert [facts.get_employee_record(e)["name"] for e in ("E1", "E2")] == ["Asha R", "Ravi T"]
+    # E1, then both cached entries, then E2 (E1 was not cached again by then)
+    assert facts.employee_cache.stats()["invalidations"] == 4
+
+
+def test_warm_up_loads_records_ahead_of_lookups(facts):
+    assert facts.warm_employee_cache() == 2
+    reads = facts.employee_records.read_calls
+    facts.get_employee_record("E1")
+    facts.get_employee_record("E2")
+    assert facts.employee_records.read_calls == reads
+    assert facts.employee_cache.stats()["hits"] == 2
@@ -0,0 +1,90 @@
+import pytest
+
+from attendance_agent import ExcuseClusters, _cosine
+
+TRAFFIC = "late because of heavy traffic, came by bus"
+OVERSLEPT = "overslept, alarm did not ring"
+
+
+def test_similar_excuses_merge_into_one_cluster(embeddings):
+    clusters = ExcuseClusters(path="")
+    for i in range(12):
+        clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC, timestamp=1000 + i)
+    clusters.add("E1", embeddings.embed_query(OVERSLEPT), OVERSLEPT, timestamp=2000)
+
+    # Beyond what a top-5 search could count
+    assert clusters.count("E1", embeddings.embed_query(TRAFFIC)) == 12
+    assert clusters.count("E1", embeddings.embed_query(OVERSLEPT)) == 1
+    assert clusters.count("E2", embeddings.embed_query(TRAFFIC)) == 0
+
+    summary = clusters.clusters("E1")
+    assert [c["count"] for c in summary] == [12, 1]
+    assert (summary[0]["first_seen"], summary[0]["last_seen"]) == (1000, 1011)
+
+
+def test_count_since_leaves_out_stale_clusters(embeddings):
+    clusters = ExcuseClusters(path="")
+    clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC, timestamp=1000)
+    assert clusters.count("E1", embeddings.embed_query(TRAFFIC), since=500) == 1
+    assert clusters.count("E1", embeddings.embed_query(TRAFFIC), since=1500) == 0
+
+
+def test_rebuild_replaces_the_employees_clusters(embeddings):
+    clusters = ExcuseClusters(path="")
+    for _ in range(5):
+        clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC)
+    clusters.add("E2", embeddings.embed_query(TRAFFIC), TRAFFIC)
+
+    # What compaction leaves: one merged record standing for 3 excuses, and one single
+    clusters.rebuild("E1", [
+        ("a", embeddings.embed_query(TRAFFIC), {"text": TRAFFIC, "timestamp": 20, "count": 3, "first_seen": 5}),
+        ("b", embeddings.embed_query(OVERSLEPT), {"text": OVERSLEPT, "timestamp": 10}),
+    ])
+    assert clusters.count("E1", embeddings.embed_query(TRAFFIC)) == 3
+    assert clusters.count("E1", embeddings.embed_query(OVERSLEPT)) == 1
+    assert clusters.clusters("E1")[0]["first_seen"] == 5
+    assert clusters.count("E2", embeddings.embed_query(TRAFFIC)) == 1
+
+
+def test_clusters_persist_and_rebuild_clears_the_file(tmp_path, embeddings):
+    path = str(tmp_path / "clusters.db")
+    clusters = ExcuseClusters(path=path)
+    for _ in range(3):
+        clusters.add("E1", embeddings.embed_query(TRAFFIC), TRAFFIC)
+    assert ExcuseClusters(path=path).count("E1", embeddings.embed_query(TRAFFIC)) == 3
+
+    clusters.rebuild("E1", [])
+    assert ExcuseClusters(path=path).count("E1", embeddings.embed_query(TRAFFIC)) == 0
+
+
+def test_oldest_cluster_is_dropped_past_the_limit(embeddings):
+    clusters = ExcuseClusters(path="", max_clusters=2)
+    for i, text in enumerate(["bus broke down", "fever and cold", "family function"]):
+        clusters.add("E1", embeddings.embed_query(text), text, timestamp=i)
+    assert {c["label"] for c in clusters.clusters("E1")} == {"fever and cold", "family function"}
+
+
+def test_fixed_dims_cluster_full_and_truncated_vectors_together(embeddings):
+    clusters = ExcuseClusters(path="", dims=256)
+    full = embeddings.embed_query(TRAFFIC)
+    clusters.add("E1", full, TRAFFIC)
+    # As read back from the compact backend without re-ranking: leading dimensions only
+    clusters.add("E1", full[:256], TRAFFIC)
+    assert clusters.count("E1", full) == 2
+    assert all(len(c["centroid"]) == 256 for c in clusters._clusters["E1"])
+    with pytest.raises(ValueError):
+        clusters.add("E1", full[:128], TRAFFIC)
+
+
+def test_cosine_rejects_mismatched_lengths():
+    assert _cosine([1.0, 0.0], [1.0, 0.0]) == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        _cosine([1.0, 0.0, 0.0], [1.0, 0.0])
+
+
+def test_search_counts_every_similar_save(manager, embeddings):
+    for _ in range(8):
+        assert manager.execute("save", "E1", TRAFFIC)["status"] == "success"
+    result = manager.execute("search", "E1", TRAFFIC)
+    assert len(result["matches"]) == 5
+    assert result["similar_count"] == 8
@@ -0,0 +1,129 @@
+import threading
+
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError
+
+import fakes
+
+
+class RecordingCollection(fakes.FakeCollection):
+    def __init__(self, fail_ids=()):
+        super().__init__()
+        self.fail_ids = set(fail_ids)
+        self.batches = []
+
+    def insert_many(self, docs, ordered=True, **kwargs):
+        self.batches.append((len(docs), ordered))
+        failed = [{"index": i, "code": 11000} for i, d in enumerate(docs) if d["sender_id"] in self.fail_ids]
+        super().insert_many([d for d in docs if d["sender_id"] not in self.fail_ids])
+        if failed:
+            raise BulkWriteError({"writeErrors": failed})
+
+
+@pytest.fixture
+def fact_system(server, monkeypatch):
+    """
+    Builds FactSystems on mongomock, with module settings overridden by keyword.
+    """
+    systems = []
+
+    def make(**settings):
+        monkeypatch.setattr(server, "MongoClient", mongomock.MongoClient)
+        for name, value in settings.items():
+            monkeypatch.setattr(server, name, value)
+        facts = server.FactSystem("mongodb://test")
+        systems.append(facts)
+        return facts
+
+    yield make
+    for facts in systems:
+        if facts.writer is not None:
+            facts.writer.close(5)
+
+
+def store(facts, sender_id="9190000001"):
+    facts.store_raw_message("employee", sender_id, "late, bus broke down")
+
+
+def test_client_uses_the_pool_settings(server, monkeypatch):
+    options = []
+    monkeypatch.setattr(server, "MongoClient", lambda uri, **kwargs: options.append(kwargs) or mongomock.MongoClient())
+    server.FactSystem("mongodb://test")
+    assert options == [{"maxPoolSize": server.MONGO_MAX_POOL_SIZE, "minPoolSize": server.MONGO_MIN_POOL_SIZE,
+                        "serverSelectionTimeoutMS": server.MONGO_SERVER_SELECTION_TIMEOUT_MS}]
+
+
+def test_raw_messages_are_buffered_into_one_unordered_insert(fact_system):
+    facts = fact_system(MONGO_ENSURE_INDEXES=False, MONGO_BATCH_SIZE=100, MONGO_FLUSH_INTERVAL=60)
+    facts.raw_messages = RecordingCollection()
+    for i in range(5):
+        store(facts, f"91900000{i:02d}")
+    assert facts.raw_messages.batches == []
+
+    assert facts.flush(5)
+    assert facts.raw_messages.batches == [(5, False)]
+    assert len(facts.raw_messages.docs) == 5
+    assert facts.writer.stats()["written"] == 5
+
+
+def test_failed_documents_do_not_fail_the_batch(fact_system):
+    facts = fact_system(MONGO_ENSURE_INDEXES=False, MONGO_BATCH_SIZE=100, MONGO_FLUSH_INTERVAL=60)
+    facts.raw_messages = RecordingCollection(fail_ids={"9190000002"})
+    for i in range(1, 5):
+        store(facts, f"919000000{i}")
+    assert facts.flush(5)
+    stats = facts.writer.stats()
+    assert (stats["written"], stats["failed"]) == (3, 1)
+    assert len(facts.raw_messages.docs) == 3
+
+
+def test_without_write_behind_messages_are_written_inline(fact_system):
+    facts = fact_system(MONGO_ENSURE_INDEXES=False, MONGO_WRITE_BEHIND=False)
+    store(facts)
+    assert facts.writer is None
+    assert facts.raw_messages.count_documents({"sender_id": "9190000001"}) == 1
+
+
+def test_indexes_and_raw_message_expiry(fact_system):
+    facts = fact_system(MONGO_ENSURE_INDEXES=False, RAW_MESSAGES_TTL_DAYS=2)
+    facts.ensure_indexes()
+    raw = facts.raw_messages.index_information()
+    assert raw["sender_id_1_timestamp_-1"]["key"] == [("sender_id", 1), ("timestamp", -1)]
+    assert raw["timestamp_1"]["expireAfterSeconds"] == 2 * 86400
+    assert "employee_id_1_timestamp_-1" in facts.attendance_logs.index_information()
+    assert "employee_id_1" in facts.employee_records.index_information()
+    assert "status_1" in facts.webhook_events.index_information()
+
+
+def test_time_series_is_set_up_before_the_first_insert(server, fact_system, monkeypatch):
+    release = threading.Event()
+    order = []
+
+    def ensure_time_series(self):
+        release.wait(5)
+        order.append("time_series")
+        self.db.create_collection("raw_messages")
+
+    monkeypatch.setattr(server.FactSystem, "ensure_time_series", ensure_time_series)
+    facts = fact_system(RAW_MESSAGES_TIMESERIES=True, MONGO_ENSURE_INDEXES=False, MONGO_FLUSH_INTERVAL=60)
+    store(facts)
+    # The writer holds the message until the collection exists
+    assert not facts.flush(timeout=0.2)
+    assert order == []
+
+    release.set()
+    assert facts.flush(5)
+    assert order == ["time_series"]
+    assert facts.raw_messages.count_documents({}) == 1
+
+
+def test_time_series_options(fact_system, monkeypatch):
+    facts = fact_system(MONGO_ENSURE_INDEXES=False, RAW_MESSAGES_TTL_DAYS=1)
+    created = []
+    monkeypatch.setattr(facts.db, "create_collection", lambda name, **options: created.append((name, options)))
+    facts.ensure_time_series()
+    assert created == [("raw_messages", {
+        "timeseries": {"timeField": "timestamp", "metaField": "sender_id", "granularity": "seconds"},
+        "expireAfterSeconds": 86400,
+    })]
@@ -0,0 +1,63 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import attendance_agent
+from attendance_agent import ESCALATION_LIMIT, FAST_PATH_MAX_WORDS, FastPathStats, fast_path_decision
+
+
+def state(text, similar_count=0, history=()):
+    messages = [HumanMessage(content=t) if i % 2 == 0 else AIMessage(content=t) for i, t in enumerate(history)]
+    return {"employee_id": "E1", "current_input": text, "messages": messages, "similar_count": similar_count}
+
+
+@pytest.mark.parametrize("text, similar_count, rule, decision", [
+    ("Good morning sir", 0, "greeting", "ASK_REASON"),
+    ("hi", 5, "greeting", "ASK_REASON"),
+    ("sorry, running a little late today", 0, "missing_reason", "ASK_REASON"),
+    ("stuck in traffic", 0, "missing_transport", "ASK_TRANSPORT"),
+    ("traffic jam, came by bus", 1, "escalate_tl", "ESCALATE_TL"),
+    ("traffic jam, came by bus", ESCALATION_LIMIT - 1, "escalate_tl", "ESCALATE_TL"),
+    ("traffic jam, came by bus", ESCALATION_LIMIT, "escalate_manager", "ESCALATE_MANAGER"),
+    # First occurrence of a full excuse: the LLM may suggest a route
+    ("traffic jam, came by bus", 0, None, None),
+    # No reason word the rules know
+    ("my kid's school called, took the metro", 0, None, None),
+    # Nothing to read: empty, emoji-only, digits-only
+    ("", 0, None, None),
+    ("   ", 0, None, None),
+    ("\U0001F64F\U0001F68C", 0, None, None),
+    ("9:45", 0, None, None),
+])
+def test_rules(text, similar_count, rule, decision):
+    got_rule, got = fast_path_decision(state(text, similar_count))
+    assert got_rule == rule
+    assert (got or {}).get("analysis_decision") == decision
+
+
+def test_reason_and_transport_may_come_in_separate_turns():
+    follow_up = state("came by bus", similar_count=1, history=["stuck in traffic", "How did you travel?"])
+    assert fast_path_decision(follow_up)[0] == "escalate_tl"
+    # A wordless reply does not fall back on the earlier filler
+    assert fast_path_decision(state("\U0001F44D", history=["hi", "Why are you late?"])) == (None, None)
+
+
+def test_long_inputs_go_to_the_llm():
+    short = "traffic jam came by bus " + "today " * (FAST_PATH_MAX_WORDS - 5)
+    assert fast_path_decision(state(short, similar_count=1))[0] == "escalate_tl"
+    assert fast_path_decision(state(short + "today", similar_count=1)) == (None, None)
+
+
+def test_stats_count_the_short_circuited_turns(monkeypatch):
+    stats = FastPathStats()
+    monkeypatch.setattr(attendance_agent, "fast_path_stats", stats)
+    for text in ["hi", "stuck in traffic", "traffic jam, came by bus", ""]:
+        attendance_agent.fast_path_node(state(text))
+
+    assert stats.snapshot() == {"turns": 4, "short_circuited": 2, "rate": 0.5,
+                                "by_rule": {"greeting": 1, "missing_transport": 1}}
+    assert FastPathStats().rate() == 0.0
+
+
+def test_disabled_fast_path_leaves_every_turn_to_the_llm(monkeypatch):
+    monkeypatch.setattr(attendance_agent, "FAST_PATH_ENABLED", False)
+    assert attendance_agent.fast_path_node(state("hi")) == {"decided_by": ""}
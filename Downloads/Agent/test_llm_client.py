@@ -0,0 +1,199 @@
+import asyncio
+import time
+
+import pytest
+
+import fakes
+import llm_client
+from llm_client import CircuitBreaker, LLMGuard, LLMUnavailable, TokenBucket, guarded
+
+
+class APIError(Exception):
+    def __init__(self, code, message=""):
+        super().__init__(message or f"{code} error")
+        self.code = code
+
+
+class Model:
+    """
+    Raises the scripted errors in turn, then answers "ok".
+    """
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def errors_logged(monkeypatch):
+    logged = []
+    monkeypatch.setattr(llm_client, "log_error", logged.append)
+    return logged
+
+
+def make_guard(threshold=3, cooldown=60.0, max_retries=2, rate_per_min=0, burst=1, max_wait=0.0):
+    return LLMGuard(bucket=TokenBucket(rate_per_min=rate_per_min, burst=burst),
+                    breaker=CircuitBreaker(threshold=threshold, cooldown=cooldown, max_cooldown=1.0),
+                    max_wait=max_wait, max_retries=max_retries, backoff_base=0.001, backoff_max=0.01)
+
+
+def test_breaker_opens_after_consecutive_transient_failures():
+    guard = make_guard(threshold=3, max_retries=10)
+    model = Model(*[APIError(503)] * 10)
+    with pytest.raises(LLMUnavailable) as raised:
+        guard.call(model)
+    assert raised.value.reason == "unavailable"
+    assert model.calls == 3
+    assert guard.breaker.state == "open"
+
+    # While open, no model call is made
+    with pytest.raises(LLMUnavailable) as raised:
+        guard.call(model)
+    assert raised.value.reason == "circuit_open"
+    assert raised.value.retry_after > 0
+    assert model.calls == 3
+    stats = guard.stats()
+    assert (stats["calls"], stats["failed"], stats["rejected"], stats["circuit_opened"]) == (2, 1, 1, 1)
+
+
+def test_half_open_allows_one_probe_that_closes_the_circuit():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_twice_as_long():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05, max_cooldown=1.0)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.cooldown == pytest.approx(0.1)
+    assert breaker.retry_after() > 0.05
+    assert not breaker.allow()
+
+
+def test_probe_through_the_guard():
+    guard = make_guard(threshold=1, cooldown=0.05, max_retries=0)
+    with pytest.raises(LLMUnavailable):
+        guard.call(Model(APIError(503)))
+    time.sleep(0.06)
+    assert guard.call(Model()) == "ok"
+    assert guard.breaker.state == "closed"
+
+
+def test_non_transient_errors_are_raised_and_do_not_count(errors_logged):
+    guard = make_guard(threshold=2)
+    model = Model(*[APIError(400, "invalid argument")] * 5)
+    for _ in range(5):
+        with pytest.raises(APIError):
+            guard.call(model)
+    assert model.calls == 5  # never retried
+    assert (guard.breaker.state, guard.breaker.failures) == ("closed", 0)
+    assert (guard.stats()["failed"], guard.stats()["retries"]) == (5, 0)
+    assert len(errors_logged) == 5 and "status=400 transient=False" in errors_logged[0]
+
+
+def test_non_transient_error_gives_back_the_probe():
+    guard = make_guard(threshold=1, cooldown=0.05, max_retries=0)
+    with pytest.raises(LLMUnavailable):
+        guard.call(Model(APIError(503)))
+    time.sleep(0.06)
+    with pytest.raises(APIError):
+        guard.call(Model(APIError(400)))
+    assert guard.call(Model()) == "ok"
+
+
+def test_retries_stop_at_the_limit():
+    guard = make_guard(threshold=100, max_retries=2)
+    model = Model(*[TimeoutError("read timed out")] * 5)
+    with pytest.raises(LLMUnavailable):
+        guard.call(model)
+    assert model.calls == 3
+    assert (guard.stats()["retries"], guard.stats()["failed"]) == (2, 1)
+
+    recovering = Model(APIError(503), APIError(429))
+    assert guard.call(recovering) == "ok"
+    assert recovering.calls == 3
+
+
+def test_backoff_is_jittered_under_the_cap_and_honours_the_hint():
+    guard = make_guard(threshold=100, max_retries=10)
+    delays = [guard._on_failure(APIError(503), attempt) for attempt in range(6)]
+    assert all(0 <= d <= 0.01 for d in delays)
+    assert len(set(delays)) > 1
+    assert guard._on_failure(APIError(429, "Please retry in 0.005s"), 0) >= 0.005
+
+
+def test_long_server_hint_opens_the_circuit_at_once():
+    guard = make_guard(threshold=100, max_retries=5)
+    model = Model(APIError(429, "RESOURCE_EXHAUSTED. Please retry in 54.2s"))
+    with pytest.raises(LLMUnavailable) as raised:
+        guard.call(model)
+    assert raised.value.reason == "rate_limited"
+    assert raised.value.retry_after >= 54
+    assert model.calls == 1
+    assert guard.breaker.state == "open"
+
+
+def test_token_bucket_paces_after_the_burst():
+    bucket = TokenBucket(rate_per_min=60, burst=2)
+    assert bucket.reserve(max_wait=0) == 0.0
+    assert bucket.reserve(max_wait=0) == 0.0
+    assert bucket.reserve(max_wait=0) is None  # nothing taken
+    assert bucket.reserve(max_wait=5) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(max_wait=5) == pytest.approx(2.0, abs=0.05)
+    assert TokenBucket(rate_per_min=0).reserve(max_wait=0) == 0.0
+
+
+def test_throttled_calls_fail_fast_without_a_model_call():
+    guard = make_guard(rate_per_min=60, burst=1, max_wait=0)
+    model = Model()
+    assert guard.call(model) == "ok"
+    with pytest.raises(LLMUnavailable) as raised:
+        guard.call(model)
+    assert raised.value.reason == "rate_limited"
+    assert model.calls == 1
+    assert guard.stats()["throttled"] == 1
+    assert guard.breaker.state == "closed"
+
+
+def test_guarded_chat_model_goes_through_the_guard():
+    guard = make_guard()
+    llm = guarded(fakes.FakeLLM("LOG_ONLY | Noted."), guard)
+    assert llm.invoke("late, traffic").content == "LOG_ONLY | Noted."
+    assert asyncio.run(llm.ainvoke("late, traffic")).content == "LOG_ONLY | Noted."
+    assert llm.bind_tools([]) is llm
+    assert (guard.stats()["calls"], guard.stats()["succeeded"]) == (2, 2)
+
+
+def test_guarded_chat_model_raises_llm_unavailable():
+    class Down(fakes.FakeLLM):
+        def invoke(self, prompt, *args, **kwargs):
+            self.calls += 1
+            raise APIError(503)
+
+    guard = make_guard(threshold=1, max_retries=3)
+    model = Down()
+    llm = guarded(model, guard)
+    with pytest.raises(LLMUnavailable):
+        llm.invoke("late, traffic")
+    with pytest.raises(LLMUnavailable):
+        llm.invoke("late, traffic")
+    assert model.calls == 1
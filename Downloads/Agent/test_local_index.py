@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from local_index import LocalVectorIndex, matches_filter
+
+DIM = 4
+
+
+def unit(i):
+    vector = [0.0] * DIM
+    vector[i] = 1.0
+    return vector
+
+
+def ids(result):
+    return [m["id"] for m in result["matches"]]
+
+
+@pytest.fixture
+def index():
+    index = LocalVectorIndex(dimension=DIM)
+    index.upsert([
+        ("a", [1.0, 0.0, 0.0, 0.0], {"employee_id": "E1", "count": 1}),
+        ("b", [0.9, 0.1, 0.0, 0.0], {"employee_id": "E1", "count": 3}),
+        ("c", [0.5, 0.5, 0.0, 0.0], {"employee_id": "E1", "count": 5}),
+        {"id": "d", "values": [1.0, 0.0, 0.0, 0.0], "metadata": {"employee_id": "E2", "count": 2}},
+    ])
+    return index
+
+
+def test_query_returns_the_top_k_by_cosine_score(index):
+    result = index.query(unit(0), top_k=2, filter={"employee_id": {"$eq": "E1"}}, include_metadata=True)
+    assert ids(result) == ["a", "b"]
+    assert result["matches"][0]["score"] == pytest.approx(1.0)
+    assert result["matches"][1]["metadata"] == {"employee_id": "E1", "count": 3}
+    # Scale does not matter: rows and queries are normalized
+    assert ids(index.query([5.0, 5.0, 0.0, 0.0], top_k=1)) == ["c"]
+    assert ids(index.query(unit(0), top_k=10, filter={"employee_id": "E1"})) == ["a", "b", "c"]
+
+
+def test_query_across_partitions_and_with_extra_conditions(index):
+    assert sorted(ids(index.query(unit(0), top_k=2))) == ["a", "d"]
+    assert sorted(ids(index.query(unit(0), top_k=10, filter={"employee_id": {"$in": ["E1", "E2"]},
+                                                               "count": {"$gte": 2}}))) == ["b", "c", "d"]
+    assert ids(index.query(unit(0), top_k=10, filter={"employee_id": {"$ne": "E1"}})) == ["d"]
+    assert ids(index.query(unit(0), filter={"employee_id": "E9"})) == []
+
+
+@pytest.mark.parametrize("condition, expected", [
+    ({"role": "Engineer"}, True),
+    ({"role": {"$eq": "Manager"}}, False),
+    ({"role": {"$ne": "Manager"}}, True),
+    ({"role": {"$in": ["Engineer", "Manager"]}}, True),
+    ({"role": {"$nin": ["Engineer"]}}, False),
+    ({"count": {"$gt": 2, "$lte": 3}}, True),
+    ({"count": {"$gte": 4}}, False),
+    ({"count": {"$lt": 3}}, False),
+    ({"missing": {"$gt": 0}}, False),
+    ({"role": "Engineer", "count": {"$lt": 1}}, False),
+    ({}, True),
+])
+def test_matches_filter(condition, expected):
+    assert matches_filter({"role": "Engineer", "count": 3}, condition) is expected
+
+
+def test_delete_moves_the_last_row_into_the_gap(index):
+    index.delete(ids=["a"])
+    partition = index._partitions["E1"]
+    assert partition.ids == ["c", "b"]
+    assert partition.rows == {"c": 0, "b": 1}
+    assert ids(index.query(unit(0), top_k=10, filter={"employee_id": "E1"})) == ["b", "c"]
+    assert index.fetch(["c"])["vectors"]["c"]["metadata"]["count"] == 5
+    assert index.describe_index_stats()["total_vector_count"] == 3
+
+
+def test_delete_by_filter_and_all(index):
+    index.delete(filter={"employee_id": "E1", "count": {"$gte": 3}})
+    assert sorted(index.fetch(["a", "b", "c", "d"])["vectors"]) == ["a", "d"]
+    index.delete(delete_all=True)
+    assert index.describe_index_stats()["total_vector_count"] == 0
+
+
+def test_upsert_moves_a_vector_to_its_new_partition(index):
+    index.upsert([("a", unit(1), {"employee_id": "E2"})])
+    assert ids(index.query(unit(1), top_k=1, filter={"employee_id": "E2"})) == ["a"]
+    assert "a" not in index._partitions["E1"].ids
+    assert index.describe_index_stats()["total_vector_count"] == 4
+
+
+def test_partitions_grow_past_their_initial_rows():
+    index = LocalVectorIndex(dimension=DIM)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(20, DIM))
+    index.upsert([(f"v{i}", vectors[i], {"employee_id": "E1"}) for i in range(20)])
+    assert index._partitions["E1"].matrix.shape[0] == 32
+    assert index.describe_index_stats() == {"dimension": DIM, "total_vector_count": 20, "partitions": 1}
+    assert [ids(index.query(vectors[i], top_k=1))[0] for i in range(20)] == [f"v{i}" for i in range(20)]
+
+
+def test_wrong_dimension_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.upsert([("x", [1.0, 0.0], {"employee_id": "E1"})])
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    path = str(tmp_path / "index.npz")
+    index.delete(ids=["a"])
+    index.save(path)
+
+    reloaded = LocalVectorIndex(dimension=DIM, path=path)
+    assert reloaded.describe_index_stats() == index.describe_index_stats()
+    assert sorted(reloaded.partition_keys()) == ["E1", "E2"]
+    for query in (unit(0), unit(1), [0.3, 0.7, 0.0, 0.0]):
+        assert reloaded.query(query, top_k=3, include_metadata=True) == index.query(query, top_k=3, include_metadata=True)
+
+
+def test_close_saves_only_after_changes(tmp_path):
+    path = tmp_path / "index.npz"
+    index = LocalVectorIndex(dimension=DIM, path=str(path))
+    index.close()
+    assert not path.exists()
+    index.upsert([("a", unit(0), {"employee_id": "E1"})])
+    index.close()
+    assert LocalVectorIndex(dimension=DIM, path=str(path)).fetch(["a"])["vectors"]["a"]["values"] == unit(0)
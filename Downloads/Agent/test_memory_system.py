@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+import fakes
+
+TRAFFIC = "late because of heavy traffic, came by bus"
+
+
+@pytest.fixture
+def memory(server):
+    memory = server.MemorySystem(None, "test", embeddings=fakes.FakeEmbeddings(), index=fakes.FakeIndex())
+    yield memory
+    memory.writer.close(5)
+
+
+def embed_concurrently(batcher, texts):
+    start = threading.Barrier(len(texts))
+    results = [None] * len(texts)
+
+    def run(i):
+        start.wait()
+        results[i] = batcher.embed(texts[i]).result(timeout=5)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_embedding_call(server):
+    batches = []
+    embeddings = fakes.FakeEmbeddings()
+
+    def embed_documents(texts):
+        batches.append(list(texts))
+        return embeddings.embed_documents(texts)
+
+    batcher = server.EmbeddingBatcher(embed_documents, window=0.2, max_batch=64)
+    texts = [f"stuck in traffic {i}" for i in range(6)] + ["stuck in traffic 0"] * 2
+    results = embed_concurrently(batcher, texts)
+
+    assert len(batches) == 1
+    assert sorted(batches[0]) == sorted(set(texts))  # duplicates embedded once
+    assert results == [embeddings._vector(t) for t in texts]
+    assert (batcher.calls, batcher.texts) == (1, 6)
+
+
+def test_batches_are_capped_and_errors_reach_every_caller(server):
+    batches = []
+
+    def embed_documents(texts):
+        batches.append(len(texts))
+        raise ConnectionError("embedding service down")
+
+    batcher = server.EmbeddingBatcher(embed_documents, window=0.2, max_batch=2)
+    futures = [batcher.embed(f"text {i}") for i in range(4)]
+    for future in futures:
+        with pytest.raises(ConnectionError):
+            future.result(timeout=5)
+    assert batches == [2, 2]
+    assert batcher.calls == 0
+
+
+def test_store_case_goes_through_the_writer(memory):
+    memory.store_case("employee", "E1", TRAFFIC)
+    memory.store_case("employee", "E1", "overslept, alarm did not ring")
+    assert memory.flush(5)
+
+    stored = sorted(r["metadata"]["text"] for r in memory.index.vectors.values())
+    assert stored == [TRAFFIC, "overslept, alarm did not ring"]
+    assert memory.index.upsert_calls == 1
+    assert memory.stats()["writer"]["written"] == 2
+
+
+def test_search_stays_within_the_sender_and_type(memory):
+    memory.store_case("employee", "E1", TRAFFIC)
+    memory.store_case("employee", "E2", TRAFFIC + " again")
+    memory.store_case("manager", "E1", TRAFFIC + " today")
+    assert memory.flush(5)
+
+    results = memory.search_similar_cases(TRAFFIC, sender_id="E1", sender_type="employee")
+    assert len(results) == 1 and results[0].endswith(TRAFFIC)
+    assert len(memory.search_similar_cases(TRAFFIC, sender_id="E1")) == 2
+    assert memory.search_similar_cases("", sender_id="E1") == []
+
+
+def test_query_vectors_are_cached_and_reused_for_storage(memory):
+    embeddings = memory.embeddings
+    for _ in range(3):
+        memory.search_similar_cases(TRAFFIC, sender_id="E1")
+    assert embeddings.calls == 1
+    # Storing a message that was just searched for needs no new embedding
+    memory.store_case("employee", "E1", "Late because of heavy traffic,  came by bus")
+    assert memory.flush(5)
+    assert embeddings.calls == 1
+
+
+def test_slow_search_returns_no_precedents(server):
+    memory = server.MemorySystem(None, "test", embeddings=fakes.FakeEmbeddings(), index=fakes.FakeIndex(latency=0.3))
+    try:
+        assert memory.search_similar_cases(TRAFFIC, sender_id="E1", budget=0.05) == []
+        assert memory.stats()["degraded"] == 1
+    finally:
+        memory.writer.close(5)
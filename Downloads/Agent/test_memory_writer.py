@@ -0,0 +1,80 @@
+import threading
+import time
+
+import attendance_agent
+from attendance_agent import MemoryWriteBehind
+
+
+def saved_texts(mm, employee_id):
+    return sorted(r["metadata"]["text"] for r in mm.index.vectors.values()
+                  if r["metadata"]["employee_id"] == employee_id)
+
+
+def test_flush_writes_queued_saves_in_one_embedding_call(manager, embeddings):
+    writer = MemoryWriteBehind(manager, batch_size=100, flush_interval=60)
+    for i in range(10):
+        assert writer.enqueue("E1", f"late because of traffic {i}")
+    assert manager.index.vectors == {}
+
+    assert writer.flush(timeout=5)
+    assert len(saved_texts(manager, "E1")) == 10
+    assert embeddings.calls == 1
+    assert writer.saved == 10
+    writer.close()
+
+
+def test_full_batch_is_written_without_a_flush(manager):
+    writer = MemoryWriteBehind(manager, batch_size=4, flush_interval=60, upsert_chunk=2)
+    for i in range(4):
+        writer.enqueue("E1", f"bus broke down {i}")
+    deadline = time.monotonic() + 5
+    while len(manager.index.vectors) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(manager.index.vectors) == 4
+    assert manager.index.upsert_calls == 2
+    writer.close()
+
+
+def test_close_drains_the_queue_and_stops_the_worker(manager):
+    writer = MemoryWriteBehind(manager, batch_size=100, flush_interval=60)
+    writer.enqueue("E1", "overslept", timestamp=1700000000.0)
+    writer.enqueue("E2", "train delayed")
+    writer.close(timeout=5)
+
+    assert saved_texts(manager, "E1") == ["overslept"]
+    assert saved_texts(manager, "E2") == ["train delayed"]
+    stored = next(r for r in manager.index.vectors.values() if r["metadata"]["employee_id"] == "E1")
+    assert stored["metadata"]["timestamp"] == 1700000000.0
+    assert writer._thread is None
+    # Idempotent
+    writer.close(timeout=1)
+
+
+def test_full_queue_falls_back_to_a_direct_write(manager):
+    writer = MemoryWriteBehind(manager, batch_size=1, flush_interval=60, max_queue=1)
+    manager.writer = writer
+    # Hold the worker on its first batch so the queue stays full
+    started, release = threading.Event(), threading.Event()
+    original = manager._embed_batch
+
+    def blocked(texts):
+        started.set()
+        release.wait(5)
+        return original(texts)
+
+    manager._embed_batch = blocked
+    try:
+        writer.enqueue("E1", "first")
+        assert started.wait(5)
+        results = [manager.enqueue_save("E1", f"save {i}") for i in range(3)]
+        assert [r["status"] for r in results] == ["queued", "success", "success"]
+    finally:
+        release.set()
+    assert manager.flush(timeout=5)
+    assert len(saved_texts(manager, "E1")) == 4
+
+
+def test_flush_also_drains_post_reply_side_effects(manager):
+    attendance_agent.after_reply("save_memory", attendance_agent._save_turn, manager, "E1", "came by bus, traffic")
+    assert manager.flush(timeout=5)
+    assert saved_texts(manager, "E1") == ["came by bus, traffic"]
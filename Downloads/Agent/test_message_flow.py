@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from langgraph.prebuilt import create_react_agent
+
+import fakes
+import llm_client
+import side_effects
+from llm_client import CircuitBreaker, LLMGuard, TokenBucket, guarded
+
+
+class Unavailable(fakes.FakeLLM):
+    """
+    Gemini answering 503 on every call.
+    """
+    def invoke(self, prompt, *args, **kwargs):
+        self.calls += 1
+        raise ConnectionError("503 Service Unavailable")
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        return self.invoke(prompt)
+
+
+@pytest.fixture
+def flow(server, monkeypatch):
+    """
+    The server with fresh stores and a fresh graph driver.
+    """
+    facts = server.fact_system
+    monkeypatch.setattr(facts, "raw_messages", fakes.FakeCollection())
+    monkeypatch.setattr(facts, "employee_records", fakes.FakeCollection())
+    monkeypatch.setattr(facts, "employee_cache", server.RecordCache(max_entries=100, ttl=60, negative_ttl=60))
+    monkeypatch.setattr(server.memory_system, "index", fakes.FakeIndex())
+    monkeypatch.setattr(server.decision_graph, "driver", fakes.FakeGraphDriver())
+    facts.employee_records.insert_one({"employee_id": "E1", "name": "Asha", "role": "Engineer"})
+    return server
+
+
+@pytest.fixture
+def use_model(server, monkeypatch):
+    """
+    Rebuilds the ReAct agent on `llm`, behind `guard` (unpaced by default).
+    """
+    def use(llm, guard=None):
+        model = guarded(llm, guard or LLMGuard(bucket=TokenBucket(rate_per_min=0)))
+        monkeypatch.setattr(server, "agent_executor", create_react_agent(
+            model, server.tools_orchestrator, prompt=server.system_prompt_orchestrator))
+        return llm
+    return use
+
+
+def settle(server):
+    # Side effects first: they are what queue the trace and the precedent
+    assert side_effects.drain(5)
+    assert server.decision_graph.flush(5) and server.memory_system.flush(5) and server.fact_system.flush(5)
+
+
+def traces(server):
+    graph = server.decision_graph
+    return [t for query, params in graph.driver.runs if query == graph.TRACE_QUERY for t in params["traces"]]
+
+
+def test_storage_and_profile_lookup_run_side_by_side(flow, use_model, monkeypatch):
+    facts = flow.fact_system
+    both = threading.Barrier(2, timeout=5)
+    threads = []
+
+    def wait_for_the_other(original):
+        def run(*args):
+            threads.append(threading.current_thread().name)
+            both.wait()  # breaks if the two steps ran one after the other
+            return original(*args)
+        return run
+
+    monkeypatch.setattr(facts, "store_raw_message", wait_for_the_other(facts.store_raw_message))
+    monkeypatch.setattr(facts, "get_employee_record", wait_for_the_other(facts.get_employee_record))
+    llm = use_model(fakes.FakeLLM("Reason logged and approved per Policy v3.2."))
+
+    assert flow.process_message_flow("employee", "E1", "flow fan-out: late, heavy traffic") == \
+        "Reason logged and approved per Policy v3.2."
+    assert len(threads) == 2 and all(name.startswith("flow") for name in threads)
+    assert llm.calls == 1
+    settle(flow)
+
+
+def test_profile_and_precedents_reach_the_agent(flow, use_model):
+    flow.memory_system.store_case("employee", "E1", "flow profile: late, bus broke down")
+    flow.memory_system.flush(5)
+    prompts = []
+
+    def reply(prompt):
+        prompts.append(prompt)
+        return "Noted."
+
+    use_model(fakes.FakeLLM(reply))
+    flow.process_message_flow("employee", "E1", "flow profile: late, bus broke down")
+    assert "Profile: Asha (Engineer)" in prompts[0]
+    assert "flow profile: late, bus broke down" in prompts[0].split("Context:")[1]
+    settle(flow)
+
+
+def test_decision_is_traced_and_stored_after_the_reply(flow, use_model):
+    use_model(fakes.FakeLLM("Reason logged and approved per Policy v3.2."))
+    flow.process_message_flow("employee", "E1", "flow trace: late, train cancelled")
+    settle(flow)
+
+    assert [(t["employee_id"], t["reason"], t["approver"]) for t in traces(flow)] == \
+        [("E1", "flow trace: late, train cancelled", "AI_Orchestrator")]
+    stored = [r["metadata"]["text"] for r in flow.memory_system.index.vectors.values()]
+    assert stored == ["flow trace: late, train cancelled"]
+    assert [d["content"] for d in flow.fact_system.raw_messages.docs] == ["flow trace: late, train cancelled"]
+
+
+def test_reply_without_a_decision_is_stored_but_not_traced(flow, use_model):
+    use_model(fakes.FakeLLM("Could you tell me why you were late?"))
+    flow.process_message_flow("employee", "E1", "flow no trace: good morning")
+    settle(flow)
+    assert traces(flow) == []
+    assert len(flow.memory_system.index.vectors) == 1
+
+
+@pytest.mark.parametrize("sender_type", ["employee", "admin"])
+def test_unavailable_llm_gets_the_fallback_reply(flow, use_model, sender_type, monkeypatch):
+    monkeypatch.setattr(llm_client, "log_error", lambda message: None)
+    guard = LLMGuard(bucket=TokenBucket(rate_per_min=0), breaker=CircuitBreaker(threshold=1, cooldown=60),
+                     max_retries=0)
+    llm = use_model(Unavailable(), guard)
+
+    reply = flow.process_message_flow(sender_type, "E1", f"flow fallback {sender_type}: late, rain")
+    assert reply == flow.fallback_reply(sender_type)
+    # With the circuit open the next message does not reach the model at all
+    assert flow.process_message_flow(sender_type, "E1", "flow fallback: still raining") == reply
+    assert llm.calls == 1
+    settle(flow)
+    # The fact is kept; nothing was decided, so nothing is traced or stored as a precedent
+    assert len(flow.fact_system.raw_messages.docs) == 2
+    assert traces(flow) == [] and flow.memory_system.index.vectors == {}
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+import fakes
+from notifications import NotificationDispatcher, SendError
+
+
+@pytest.fixture
+def dispatch():
+    dispatchers = []
+
+    def make(sink=None, **kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        dispatcher = NotificationDispatcher(sink=sink or fakes.RecordingSink(), **kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.close(timeout=5)
+
+
+def escalate(dispatcher, employee_id, reason="traffic", level="team_leader"):
+    dispatcher.notify(level, f"{employee_id} late again: {reason}", employee_id=employee_id, reason=reason)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_lone_escalation_is_sent_at_once(dispatch):
+    dispatcher = dispatch(window=60)
+    escalate(dispatcher, "E1")
+    assert wait_for(lambda: dispatcher.sink.sent)
+    assert dispatcher.sink.sent == [("team_leader", "E1 late again: traffic")]
+
+
+def test_escalations_within_the_window_become_one_digest(dispatch):
+    dispatcher = dispatch(window=60, max_lines=3)
+    escalate(dispatcher, "E0")
+    assert wait_for(lambda: dispatcher.sink.sent)
+    for i in range(1, 6):
+        escalate(dispatcher, f"E{i}")
+    time.sleep(0.05)
+    assert len(dispatcher.sink.sent) == 1  # held for the window
+
+    assert dispatcher.flush(timeout=5)
+    recipient, digest = dispatcher.sink.sent[1]
+    assert recipient == "team_leader"
+    assert digest.splitlines() == ["5 escalations:", "- E1 late again: traffic", "- E2 late again: traffic",
+                                   "- E3 late again: traffic", "... and 2 more"]
+    assert dispatcher.stats()["messages"] == 2
+
+
+def test_repeats_of_an_employee_and_reason_are_folded(dispatch):
+    dispatcher = dispatch(window=60)
+    escalate(dispatcher, "E0")
+    assert wait_for(lambda: dispatcher.sink.sent)
+    escalate(dispatcher, "E1", reason="Traffic ")
+    escalate(dispatcher, "E1", reason="traffic")
+    escalate(dispatcher, "E1", reason="bus broke down")
+    assert dispatcher.flush(timeout=5)
+
+    assert dispatcher.sink.sent[1][1].splitlines() == ["2 escalations:", "- E1 late again: Traffic  (x2)",
+                                                       "- E1 late again: bus broke down"]
+    assert dispatcher.stats()["deduped"] == 1
+
+
+def test_recipients_are_coalesced_separately(dispatch):
+    dispatcher = dispatch(window=60)
+    escalate(dispatcher, "E1", level="team_leader")
+    escalate(dispatcher, "E1", level="manager")
+    assert dispatcher.flush(timeout=5)
+    assert sorted(r for r, _ in dispatcher.sink.sent) == ["manager", "team_leader"]
+
+
+def test_failed_sends_are_retried(dispatch):
+    dispatcher = dispatch(sink=fakes.RecordingSink(fail_first=2), retries=3)
+    escalate(dispatcher, "E1")
+    assert dispatcher.flush(timeout=5)
+    assert len(dispatcher.sink.sent) == 1
+    stats = dispatcher.stats()
+    assert (stats["retried"], stats["sent"], stats["failed"]) == (2, 1, 0)
+
+
+def test_gives_up_after_the_retries(dispatch):
+    dispatcher = dispatch(sink=fakes.RecordingSink(fail_first=10), retries=2)
+    escalate(dispatcher, "E1")
+    assert dispatcher.flush(timeout=5)
+    assert dispatcher.sink.attempts == 3
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_non_retryable_errors_are_not_retried(dispatch):
+    class RejectingSink(fakes.RecordingSink):
+        async def send(self, recipient, text):
+            self.attempts += 1
+            raise SendError("no phone number configured", retryable=False)
+
+    dispatcher = dispatch(sink=RejectingSink(), retries=3)
+    escalate(dispatcher, "E1")
+    assert dispatcher.flush(timeout=5)
+    assert dispatcher.sink.attempts == 1
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_hourly_rate_holds_back_messages(dispatch):
+    # 6 per hour: a bucket of one message, then one every 10 minutes
+    dispatcher = dispatch(window=0, rate_per_hour=6)
+    escalate(dispatcher, "E1")
+    assert wait_for(lambda: dispatcher.sink.sent)
+    escalate(dispatcher, "E2")
+    time.sleep(0.1)
+    assert len(dispatcher.sink.sent) == 1
+    assert dispatcher.stats()["pending"] == 1
+    assert dispatcher.flush(timeout=5)
+    assert len(dispatcher.sink.sent) == 2
+    assert dispatcher.stats()["pending"] == 0
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+import attendance_agent
+
+
+@pytest.fixture
+def flaky_backend(monkeypatch):
+    """
+    Memory init starts over, against a backend that is down until `up` is set.
+    """
+    attempts = []
+    backend = {"up": False, "attempts": attempts}
+
+    def connect():
+        attempts.append(time.monotonic())
+        if not backend["up"]:
+            raise ConnectionError("index unreachable")
+        return "manager"
+
+    monkeypatch.setattr(attendance_agent, "VectorMemoryManager", connect)
+    monkeypatch.setattr(attendance_agent, "memory_manager", None)
+    monkeypatch.setitem(attendance_agent._init_state, "memory", "pending")
+    monkeypatch.setattr(attendance_agent, "_memory_retry_at", 0.0)
+    return backend
+
+
+def test_failed_memory_init_is_retried_after_the_interval(flaky_backend, monkeypatch):
+    monkeypatch.setattr(attendance_agent, "MEMORY_INIT_RETRY", 0.1)
+    assert attendance_agent.get_memory_manager() is None
+    assert attendance_agent.get_memory_manager() is None
+    assert len(flaky_backend["attempts"]) == 1
+    assert attendance_agent.readiness()["components"]["memory"] == "failed"
+
+    flaky_backend["up"] = True
+    time.sleep(0.15)
+    assert attendance_agent.get_memory_manager() == "manager"
+    assert len(flaky_backend["attempts"]) == 2
+    assert attendance_agent.readiness()["components"]["memory"] == "ready"
+
+
+def test_async_callers_also_retry(flaky_backend, monkeypatch):
+    monkeypatch.setattr(attendance_agent, "MEMORY_INIT_RETRY", 0.1)
+    assert asyncio.run(attendance_agent.aget_memory_manager()) is None
+    flaky_backend["up"] = True
+    assert asyncio.run(attendance_agent.aget_memory_manager()) is None
+    time.sleep(0.15)
+    assert asyncio.run(attendance_agent.aget_memory_manager()) == "manager"
+
+
+def test_zero_interval_never_retries(flaky_backend, monkeypatch):
+    monkeypatch.setattr(attendance_agent, "MEMORY_INIT_RETRY", 0)
+    assert attendance_agent.get_memory_manager() is None
+    flaky_backend["up"] = True
+    assert attendance_agent.get_memory_manager() is None
+    assert len(flaky_backend["attempts"]) == 1
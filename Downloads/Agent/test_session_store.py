@@ -0,0 +1,132 @@
+import sqlite3
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+import attendance_agent
+from session_store import SessionStore
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def save(store, thread_id, note=""):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"note": note}
+    return store.put(config(thread_id), checkpoint, {"source": "input", "step": 0}, {})
+
+
+def note(store, thread_id):
+    tup = store.get_tuple(config(thread_id))
+    return None if tup is None else tup.checkpoint["channel_values"]["note"]
+
+
+def test_idle_sessions_expire():
+    store = SessionStore(ttl=0.05)
+    save(store, "E1", "hello")
+    assert note(store, "E1") == "hello"
+    time.sleep(0.06)
+    assert note(store, "E1") is None
+    save(store, "E2")
+    time.sleep(0.06)
+    save(store, "E3")  # expired sessions are also dropped on the way
+    stats = store.stats()
+    assert (stats["sessions"], stats["expirations"]) == (1, 2)
+
+
+def test_least_recently_used_session_is_evicted_past_the_count():
+    store = SessionStore(max_sessions=2)
+    save(store, "E1", "one")
+    save(store, "E2", "two")
+    assert note(store, "E1") == "one"  # E2 is now the least recently used
+    save(store, "E3", "three")
+    assert (note(store, "E1"), note(store, "E2"), note(store, "E3")) == ("one", None, "three")
+    assert store.stats()["evictions"] == 1
+
+
+def test_sessions_are_evicted_past_the_byte_cap():
+    probe = SessionStore()
+    save(probe, "E0", "x" * 1000)
+    size = probe.stats()["bytes"]
+
+    store = SessionStore(max_bytes=int(size * 2.5))
+    for thread_id in ("E1", "E2", "E3"):
+        save(store, thread_id, "x" * 1000)
+    assert store.stats()["sessions"] == 2
+    assert store.stats()["bytes"] <= size * 2.5
+    assert note(store, "E1") is None
+
+
+def test_sessions_reload_from_the_database_after_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(db_path=path)
+    save(store, "E1", "before restart")
+    save(store, "E2", "deleted")
+    store.delete_thread("E2")
+    store.close()
+
+    reopened = SessionStore(db_path=path)
+    assert note(reopened, "E1") == "before restart"
+    assert note(reopened, "E2") is None
+    reopened.close()
+
+
+def test_evicted_sessions_reload_from_the_database(tmp_path):
+    store = SessionStore(max_sessions=1, db_path=str(tmp_path / "sessions.db"))
+    save(store, "E1", "one")
+    save(store, "E2", "two")
+    assert store.stats()["sessions"] == 1
+    assert note(store, "E1") == "one"
+    store.close()
+
+
+def test_puts_do_not_wait_for_the_disk(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(max_sessions=1, db_path=path)
+    with store._db_lock:
+        # The writer thread is stuck; puts still return, and reads see the queued checkpoint
+        for i in range(3):
+            save(store, "E1", f"turn {i}")
+        save(store, "E2", "other")
+        assert not store.flush(timeout=0.1)
+        assert note(store, "E1") == "turn 2"
+    assert store.flush(timeout=5)
+
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT thread_id FROM sessions ORDER BY thread_id").fetchall() == [("E1",), ("E2",)]
+    db.close()
+    store.close()
+    reopened = SessionStore(db_path=path)
+    assert note(reopened, "E1") == "turn 2"
+    reopened.close()
+
+
+def turn(app, employee_id, text):
+    inputs = {"employee_id": employee_id, "current_input": text, "memory_context": [],
+              "messages": [HumanMessage(content=text)]}
+    return app.invoke(inputs, attendance_agent.session_config(employee_id))
+
+
+def test_graph_keeps_the_conversation_between_turns(agent, tmp_path, monkeypatch):
+    path = str(tmp_path / "sessions.db")
+    monkeypatch.setattr(agent, "session_store", SessionStore(db_path=path))
+    app = agent._build_graph()
+
+    assert turn(app, "S1", "Good morning")["analysis_decision"] == "ASK_REASON"
+    # Only the new message is passed; the reason is read together with the stored history
+    second = turn(app, "S1", "stuck in traffic")
+    assert second["analysis_decision"] == "ASK_TRANSPORT"
+    assert [m.content for m in second["messages"]] == ["Good morning", "Why are you late?",
+                                                      "stuck in traffic", "How did you travel?"]
+    agent.session_store.close()
+
+    # After a restart the conversation continues from the database
+    monkeypatch.setattr(agent, "session_store", SessionStore(db_path=path))
+    app = agent._build_graph()
+    assert len(app.get_state(attendance_agent.session_config("S1")).values["messages"]) == 4
+    third = turn(app, "S1", "came by bus")
+    assert third["decided_by"] == "llm"
+    assert third["messages"] == []  # a final decision ends the check-in
+    agent.session_store.close()
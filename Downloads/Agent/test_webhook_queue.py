@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+
+import fakes
+
+
+def event(message_id, sender_id="9190000001", message="late, bus broke down"):
+    return {"message_id": message_id, "sender_id": sender_id, "sender_type": "employee", "message": message}
+
+
+def delivery(*messages):
+    return {"entry": [{"changes": [{"value": {"messages": list(messages)}}]}]}
+
+
+def text_message(message_id, sender_id, body):
+    return {"id": message_id, "from": sender_id, "type": "text", "text": {"body": body}}
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_redeliveries_are_processed_once(server):
+    handled = []
+    events = fakes.FakeCollection()
+    q = server.WebhookQueue(handled.append, events=events, workers=2)
+    assert q.submit(event("m1")) == "accepted"
+    assert q.submit(event("m1")) == "duplicate"
+    assert q.drain(5)
+
+    # After a restart the in-memory ids are gone; the persisted event still catches it
+    restarted = server.WebhookQueue(handled.append, events=events, workers=2)
+    assert restarted.submit(event("m1")) == "duplicate"
+    assert restarted.drain(5)
+    assert [e["message_id"] for e in handled] == ["m1"]
+    assert events.find_one({"_id": "m1"})["status"] == "processed"
+
+
+def test_each_sender_is_processed_in_arrival_order(server):
+    handled = []
+    lock = threading.Lock()
+
+    def handler(e):
+        time.sleep(random.uniform(0, 0.005))
+        with lock:
+            handled.append((e["sender_id"], int(e["message_id"].split("-")[1])))
+
+    q = server.WebhookQueue(handler, workers=4)
+    senders = [f"91900000{i:02d}" for i in range(5)]
+    for n in range(10):
+        for sender in senders:
+            assert q.submit(event(f"{sender}-{n}", sender_id=sender)) == "accepted"
+    assert q.drain(10)
+
+    for sender in senders:
+        assert [n for s, n in handled if s == sender] == list(range(10))
+    assert q.stats()["processed"] == 50
+
+
+def test_recovers_events_left_queued_before_a_restart(server):
+    events = fakes.FakeCollection()
+    events.insert_one({"_id": "old", **event("old"), "status": "queued"})
+    handled = []
+    q = server.WebhookQueue(handled.append, events=events, workers=1)
+    q.start()
+    assert wait_for(lambda: q.stats()["recovered"] == 1)
+    assert q.drain(5)
+    assert [e["message_id"] for e in handled] == ["old"]
+
+
+def test_full_queue_answers_503_and_accepts_the_redelivery(server, monkeypatch):
+    release = threading.Event()
+    handled = []
+
+    def handler(e):
+        release.wait(5)
+        handled.append(e["message_id"])
+
+    q = server.WebhookQueue(handler, workers=1, max_depth=1)
+    monkeypatch.setattr(server, "webhook_queue", q)
+    client = server.app.test_client()
+    body = delivery(text_message("w1", "9190000001", "late, traffic"),
+                    text_message("w2", "9190000002", "sick today"))
+
+    response = client.post("/webhook/whatsapp", json=body)
+    assert response.status_code == 503
+    outcomes = {m["id"]: m["outcome"] for m in response.get_json()["messages"]}
+    assert outcomes == {"w1": "accepted", "w2": "full"}
+
+    release.set()
+    assert q.drain(5)
+    # WhatsApp redelivers the whole batch: the queued message is not processed twice
+    response = client.post("/webhook/whatsapp", json=body)
+    assert response.status_code == 200
+    outcomes = {m["id"]: m["outcome"] for m in response.get_json()["messages"]}
+    assert outcomes == {"w1": "duplicate", "w2": "accepted"}
+    assert q.drain(5)
+    assert handled == ["w1", "w2"]
+
+
+def test_messages_without_sender_or_id_are_reported_invalid(server, monkeypatch):
+    q = server.WebhookQueue(lambda e: None, workers=1)
+    monkeypatch.setattr(server, "webhook_queue", q)
+    response = server.app.test_client().post(
+        "/webhook/whatsapp", json=delivery({"id": "x1", "type": "text", "text": {"body": "hi"}}))
+    assert response.status_code == 200
+    assert response.get_json()["messages"][0]["outcome"] == "invalid"
+    assert q.stats()["invalid"] == 1
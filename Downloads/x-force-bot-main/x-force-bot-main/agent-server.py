@@ -1,12 +1,21 @@
 
 import os
+import sys
 import json
+import time
+import uuid
+import queue
+import atexit
 import logging
 import datetime
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import Dict, Any, List, Optional
 
 from flask import Flask, request, jsonify
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from pinecone import Pinecone
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
@@ -26,6 +35,18 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "attendance-memory")
+# Precedent search: "pinecone", or "local" for the in-process index (tests, single node)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "pinecone")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.6"))
+# Whole search (embedding + query) must finish within this many seconds, or it returns no precedents
+MEMORY_SEARCH_BUDGET = float(os.getenv("MEMORY_SEARCH_BUDGET", "0.8"))
+# Query embeddings from concurrent requests are batched: one call per window / batch
+MEMORY_EMBED_WINDOW = float(os.getenv("MEMORY_EMBED_WINDOW", "0.01"))
+MEMORY_EMBED_BATCH = int(os.getenv("MEMORY_EMBED_BATCH", "32"))
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "5000"))
+MEMORY_QUERY_WORKERS = int(os.getenv("MEMORY_QUERY_WORKERS", "64"))
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "123")
 
@@ -36,6 +57,53 @@ ADMIN_PHONE_NUMBERS = [num.strip() for num in ADMIN_PHONE_NUMBER.split(',') if n
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
+# Decision traces are written in the background, NEO4J_BATCH_SIZE per UNWIND transaction.
+# When the buffer is full, callers wait up to NEO4J_BACKPRESSURE_TIMEOUT seconds, then the trace is dropped.
+NEO4J_WRITE_BEHIND = os.getenv("NEO4J_WRITE_BEHIND", "1") == "1"
+NEO4J_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "500"))
+NEO4J_FLUSH_INTERVAL = float(os.getenv("NEO4J_FLUSH_INTERVAL", "1.0"))
+NEO4J_WRITE_QUEUE_SIZE = int(os.getenv("NEO4J_WRITE_QUEUE_SIZE", "50000"))
+NEO4J_BACKPRESSURE_TIMEOUT = float(os.getenv("NEO4J_BACKPRESSURE_TIMEOUT", "0.2"))
+
+# MongoDB connection pool
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# Buffered raw-message inserts: flush after MONGO_BATCH_SIZE messages or MONGO_FLUSH_INTERVAL seconds
+MONGO_WRITE_BEHIND = os.getenv("MONGO_WRITE_BEHIND", "1") == "1"
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "200"))
+MONGO_FLUSH_INTERVAL = float(os.getenv("MONGO_FLUSH_INTERVAL", "0.5"))
+MONGO_WRITE_QUEUE_SIZE = int(os.getenv("MONGO_WRITE_QUEUE_SIZE", "20000"))
+# Create indexes at startup; optionally expire raw messages (TTL, days) or store them as a time series
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "1") == "1"
+RAW_MESSAGES_TTL_DAYS = float(os.getenv("RAW_MESSAGES_TTL_DAYS", "0"))
+RAW_MESSAGES_TIMESERIES = os.getenv("RAW_MESSAGES_TIMESERIES", "0") == "1"
+# Read-through cache for employee records; unknown ids are cached for the (shorter) negative TTL
+EMPLOYEE_CACHE_ENABLED = os.getenv("EMPLOYEE_CACHE_ENABLED", "1") == "1"
+EMPLOYEE_CACHE_SIZE = int(os.getenv("EMPLOYEE_CACHE_SIZE", "20000"))
+EMPLOYEE_CACHE_TTL = float(os.getenv("EMPLOYEE_CACHE_TTL", "3600"))
+EMPLOYEE_CACHE_NEGATIVE_TTL = float(os.getenv("EMPLOYEE_CACHE_NEGATIVE_TTL", "300"))
+EMPLOYEE_CACHE_WARM = os.getenv("EMPLOYEE_CACHE_WARM", "0") == "1"
+
+# WhatsApp webhook queue: events are acknowledged at once and processed by a worker pool
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_MAX = int(os.getenv("WEBHOOK_QUEUE_MAX", "2000"))
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", "20000"))
+WEBHOOK_PERSIST = os.getenv("WEBHOOK_PERSIST", "1") == "1"
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "5"))
+# Threads for the independent lookups at the start of process_message_flow
+FLOW_WORKERS = int(os.getenv("FLOW_WORKERS", "32"))
+
+# Shared Python modules from the attendance agent (llm_client.py, ...)
+AGENT_MODULES_DIR = os.getenv(
+    "AGENT_MODULES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Agent"),
+)
+sys.path.append(os.path.abspath(AGENT_MODULES_DIR))
+from llm_client import guarded, LLMUnavailable
+from observability import registry
+import side_effects
+from side_effects import after_reply
 
 
 # Initialize Logging
@@ -45,18 +113,259 @@ logger = logging.getLogger(__name__)
 # Initialize Flask
 app = Flask(__name__)
 
+# --- Background batch writer ---
+class BatchWriter:
+    """
+    Write-behind buffer: callers submit items and return; a worker thread passes them
+    to `write_batch` in lists of up to `batch_size`, at least every `flush_interval`
+    seconds. `write_batch` may return the number of items that failed.
+    """
+    def __init__(self, name, write_batch, batch_size, flush_interval, max_queue):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def submit(self, item, timeout: float = 0.0) -> bool:
+        """
+        Queues an item, waiting up to `timeout` seconds for room. Returns False if
+        the queue stayed full (caller should write directly or drop).
+        """
+        self._ensure_started()
+        try:
+            self._queue.put(("item", item), timeout=timeout) if timeout else self._queue.put_nowait(("item", item))
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until everything submitted so far has been written.
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Drains the queue and stops the worker thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(("stop", done))
+        if not done.wait(timeout):
+            logger.warning(f"{self.name} writer did not drain within {timeout}s")
+        thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "failed": self.failed, "batches": self.batches, "pending": self.pending()}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        pending = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Flush interval elapsed
+                self._flush(pending)
+                pending = []
+                continue
+
+            if kind == "item":
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(payload)
+                if len(pending) >= self.batch_size:
+                    self._flush(pending)
+                    pending = []
+                continue
+
+            # "flush" / "stop": the queue is FIFO, so every earlier item is in `pending`
+            self._flush(pending)
+            pending = []
+            payload.set()
+            if kind == "stop":
+                return
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        self.batches += 1
+        try:
+            failed = self.write_batch(pending) or 0
+        except Exception as e:
+            logger.error(f"{self.name} writer failed to write {len(pending)} items: {e}")
+            failed = len(pending)
+        self.failed += failed
+        self.written += len(pending) - failed
+
+
+class RecordCache:
+    """
+    LRU cache with per-entry expiry. A cached None means "known not to exist".
+    """
+    def __init__(self, max_entries, ttl, negative_ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Returns (found, value); value is None for a cached miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                if entry[1] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Drops one key, or everything when key is None.
+        """
+        with self._lock:
+            if key is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "negative_hits": self.negative_hits, "misses": self.misses,
+                    "invalidations": self.invalidations, "size": len(self._entries)}
+
+
 # --- 1. Fact System (MongoDB) ---
 class FactSystem:
     def __init__(self, uri):
+        self.writer = None
+        # Set once raw_messages is set up (time series); raw-message inserts wait for it
+        self.collections_ready = threading.Event()
+        self.employee_cache = (RecordCache(EMPLOYEE_CACHE_SIZE, EMPLOYEE_CACHE_TTL, EMPLOYEE_CACHE_NEGATIVE_TTL)
+                               if EMPLOYEE_CACHE_ENABLED else None)
         try:
-            self.client = MongoClient(uri)
+            self.client = MongoClient(
+                uri,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            )
             self.db = self.client["human_in_the_loop_db"]
             self.raw_messages = self.db["raw_messages"]
             self.attendance_logs = self.db["attendance_logs"]
             self.employee_records = self.db["employee_records"]
+            self.webhook_events = self.db["webhook_events"]
             logger.info("Connected to Fact System (MongoDB).")
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
+            return
+        if MONGO_WRITE_BEHIND:
+            self.writer = BatchWriter("raw_messages", self._insert_raw_messages, MONGO_BATCH_SIZE,
+                                      MONGO_FLUSH_INTERVAL, MONGO_WRITE_QUEUE_SIZE)
+            atexit.register(self.writer.close)
+        if RAW_MESSAGES_TIMESERIES or MONGO_ENSURE_INDEXES:
+            # In the background: MongoClient connects lazily and the server may still be starting
+            threading.Thread(target=self._initialize, name="mongo-init", daemon=True).start()
+        else:
+            self.collections_ready.set()
+        if EMPLOYEE_CACHE_WARM and self.employee_cache is not None:
+            threading.Thread(target=self.warm_employee_cache, name="employee-cache-warm", daemon=True).start()
+
+    def _initialize(self):
+        try:
+            if RAW_MESSAGES_TIMESERIES:
+                # Before the first raw-message insert, which would create a plain collection
+                self.ensure_time_series()
+        finally:
+            self.collections_ready.set()
+        if MONGO_ENSURE_INDEXES:
+            self.ensure_indexes()
+
+    def ensure_time_series(self):
+        """
+        Creates raw_messages as a time series collection if it does not exist yet.
+        """
+        ttl = int(RAW_MESSAGES_TTL_DAYS * 86400)
+        try:
+            if "raw_messages" not in self.db.list_collection_names():
+                options = {"timeseries": {"timeField": "timestamp", "metaField": "sender_id", "granularity": "seconds"}}
+                if ttl:
+                    options["expireAfterSeconds"] = ttl
+                self.db.create_collection("raw_messages", **options)
+        except Exception as e:
+            logger.error(f"Failed to create the raw_messages time series collection: {e}")
+
+    def ensure_indexes(self):
+        """
+        Creates the collections' indexes (idempotent), and the raw_messages TTL index
+        when configured. A failed index is logged and the rest are still created.
+        """
+        ttl = int(RAW_MESSAGES_TTL_DAYS * 86400)
+        indexes = [
+            (self.raw_messages, [("sender_id", 1), ("timestamp", -1)], {}),
+            (self.raw_messages, "timestamp",
+             {"expireAfterSeconds": ttl} if ttl and not RAW_MESSAGES_TIMESERIES else {}),
+            (self.attendance_logs, [("employee_id", 1), ("timestamp", -1)], {}),
+            (self.attendance_logs, "timestamp", {}),
+            (self.employee_records, "employee_id", {}),
+            (self.webhook_events, "status", {}),
+        ]
+        failed = 0
+        for collection, keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to create MongoDB index {collection.name} {keys}: {e}")
+        if not failed:
+            logger.info("MongoDB indexes ensured.")
 
     def store_raw_message(self, sender_type, sender_id, message, intent_guess=None, confidence=0.0):
         doc = {
@@ -68,19 +377,144 @@ class FactSystem:
             "timestamp": datetime.datetime.utcnow(),
             "status": "received"
         }
-        self.raw_messages.insert_one(doc)
+        # Buffered when possible; written inline if the buffer is full
+        if self.writer is None or not self.writer.submit(doc):
+            self.collections_ready.wait()
+            self.raw_messages.insert_one(doc)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Writes out buffered raw messages.
+        """
+        return self.writer.flush(timeout) if self.writer else True
+
+    def _insert_raw_messages(self, docs):
+        self.collections_ready.wait()
+        try:
+            self.raw_messages.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Unordered: everything except the reported documents was written
+            errors = e.details.get("writeErrors", [])
+            logger.error(f"{len(errors)} of {len(docs)} raw messages failed to insert: {errors[:1]}")
+            return len(errors)
 
     def get_employee_record(self, employee_id):
+        # Profiles change rarely: served from the cache, which also remembers unknown ids
+        if self.employee_cache is None:
+            record = self.employee_records.find_one({"employee_id": employee_id})
+        else:
+            found, record = self.employee_cache.get(employee_id)
+            if not found:
+                record = self.employee_records.find_one({"employee_id": employee_id})
+                self.employee_cache.put(employee_id, record)
         # Mock record if not found
-        return self.employee_records.find_one({"employee_id": employee_id}) or {"employee_id": employee_id, "name": "Unknown", "role": "Employee"}
+        return dict(record) if record else {"employee_id": employee_id, "name": "Unknown", "role": "Employee"}
+
+    def invalidate_employee(self, employee_id=None):
+        """
+        Call when an employee record changes (or with None after a bulk import).
+        """
+        if self.employee_cache is not None:
+            self.employee_cache.invalidate(employee_id)
+
+    def warm_employee_cache(self, query=None, limit: Optional[int] = None) -> int:
+        """
+        Loads employee records (all, or those matching `query`) into the cache.
+        """
+        if self.employee_cache is None:
+            return 0
+        limit = limit or self.employee_cache.max_entries
+        loaded = 0
+        try:
+            for record in self.employee_records.find(query or {}):
+                if loaded >= limit:
+                    break
+                if record.get("employee_id") is not None:
+                    self.employee_cache.put(record["employee_id"], record)
+                    loaded += 1
+        except Exception as e:
+            logger.error(f"Employee cache warm-up failed after {loaded} records: {e}")
+        logger.info(f"Employee cache warmed with {loaded} records.")
+        return loaded
 
 fact_system = FactSystem(MONGO_URI)
 
 # --- 2. Memory System (Pinecone) ---
+class EmbeddingBatcher:
+    """
+    Collects embedding requests from concurrent threads. The first request opens a
+    window of `window` seconds; everything arriving meanwhile (up to `max_batch`
+    texts) is embedded with a single `embed_documents` call.
+    """
+    def __init__(self, embed_documents, window=MEMORY_EMBED_WINDOW, max_batch=MEMORY_EMBED_BATCH):
+        self.embed_documents = embed_documents
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def embed(self, text: str) -> Future:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.embed_documents(texts)))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.calls += 1
+            self.texts += len(texts)
+            for text, future in batch:
+                future.set_result(vectors[text])
+
+
 class MemorySystem:
-    def __init__(self, api_key, index_name):
-        self.index = None
-        if api_key:
+    """
+    Precedent search over past messages, scoped to one sender and sender type.
+    Query embeddings are cached and micro-batched across concurrent requests; a
+    search that runs past MEMORY_SEARCH_BUDGET returns no precedents instead of
+    holding up the reply.
+    """
+    def __init__(self, api_key, index_name, embeddings=None, index=None, backend=MEMORY_BACKEND):
+        self.index = index
+        self.embeddings = embeddings
+        self.vector_cache = RecordCache(QUERY_VECTOR_CACHE_SIZE, ttl=float("inf"), negative_ttl=0)
+        self.batcher = EmbeddingBatcher(lambda texts: self._get_embeddings().embed_documents(texts))
+        self.writer = BatchWriter("memory_cases", self._write_cases, 64, 1.0, 10000)
+        atexit.register(self.writer.close)
+        self._queries = ThreadPoolExecutor(max_workers=MEMORY_QUERY_WORKERS, thread_name_prefix="memory-query")
+        self.counts = {"searches": 0, "degraded": 0, "errors": 0}
+        self._counts_lock = threading.Lock()
+        if self.index is not None:
+            return
+        if backend == "local":
+            from local_index import LocalVectorIndex
+            self.index = LocalVectorIndex()
+            logger.info("Using the local in-memory index for the Memory System.")
+        elif api_key:
             try:
                 pc = Pinecone(api_key=api_key)
                 if index_name not in [i.name for i in pc.list_indexes()]:
@@ -90,52 +524,192 @@ class MemorySystem:
             except Exception as e:
                 logger.error(f"Failed to connect to Pinecone: {e}")
 
-    def search_similar_cases(self, query_text):
-        if not self.index:
+    def _count(self, name: str):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def _get_embeddings(self):
+        if self.embeddings is None:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            self.embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=GOOGLE_API_KEY)
+        return self.embeddings
+
+    @staticmethod
+    def _scope(sender_id, sender_type) -> Optional[Dict[str, Any]]:
+        scope = {}
+        if sender_id:
+            scope["employee_id"] = {"$eq": sender_id}
+        if sender_type:
+            scope["sender_type"] = {"$eq": sender_type}
+        return scope or None
+
+    def _query_vector(self, text: str, timeout: float) -> List[float]:
+        key = " ".join(text.lower().split())
+        found, vector = self.vector_cache.get(key)
+        if not found:
+            vector = self.batcher.embed(text).result(timeout=timeout)
+            self.vector_cache.put(key, vector)
+        return vector
+
+    def search_similar_cases(self, query_text, sender_id=None, sender_type=None, budget=MEMORY_SEARCH_BUDGET):
+        if not self.index or not query_text:
+            return []
+        self._count("searches")
+        deadline = time.monotonic() + budget
+        try:
+            vector = self._query_vector(query_text, budget)
+            query = self._queries.submit(self.index.query, vector=vector, top_k=MEMORY_TOP_K,
+                                         filter=self._scope(sender_id, sender_type), include_metadata=True)
+            results = query.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            self._count("degraded")
+            logger.warning(f"Precedent search for {sender_id} exceeded {budget}s, continuing without precedents")
             return []
-        # Implement embedding + search logic here
-        return []
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Precedent search failed for {sender_id}: {e}")
+            return []
+        return [
+            f"({match['score']:.2f}) {match['metadata'].get('text', '')}"
+            for match in results.get('matches', [])
+            if match['score'] >= MEMORY_MIN_SCORE
+        ]
+
+    def store_case(self, sender_type, sender_id, message):
+        """
+        Queues a message as a future precedent; embedded and upserted in batches.
+        """
+        if self.index is not None and message:
+            self.writer.submit({"employee_id": sender_id, "sender_type": sender_type, "text": message,
+                                "timestamp": time.time()})
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return self.writer.flush(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "embed_calls": self.batcher.calls, "embedded_texts": self.batcher.texts,
+                "vector_cache": self.vector_cache.stats(), "writer": self.writer.stats()}
+
+    def _write_cases(self, cases):
+        # Reuses query vectors when a stored message was also searched for
+        vectors, missing = {}, []
+        for case in cases:
+            key = " ".join(case["text"].lower().split())
+            found, vector = self.vector_cache.get(key)
+            if found:
+                vectors[case["text"]] = vector
+            elif case["text"] not in missing:
+                missing.append(case["text"])
+        if missing:
+            vectors.update(zip(missing, self._get_embeddings().embed_documents(missing)))
+        self.index.upsert(vectors=[(str(uuid.uuid4()), vectors[case["text"]], case) for case in cases])
 
 memory_system = MemorySystem(PINECONE_API_KEY, PINECONE_INDEX_NAME)
 
 # --- 3. Decision Context Graph (Neo4j) ---
 class DecisionContextGraph:
+    POLICY_VERSION = "v3.2"
+
+    SCHEMA = [
+        "CREATE CONSTRAINT employee_id IF NOT EXISTS FOR (e:Employee) REQUIRE e.id IS UNIQUE",
+        "CREATE CONSTRAINT policy_version IF NOT EXISTS FOR (p:Policy) REQUIRE p.version IS UNIQUE",
+        "CREATE INDEX event_type_reason IF NOT EXISTS FOR (ev:Event) ON (ev.type, ev.reason)",
+    ]
+
+    # One statement per batch. Every trace is a new Decision, so it is CREATEd rather than MERGEd.
+    TRACE_QUERY = """
+    UNWIND $traces AS t
+    MERGE (e:Employee {id: t.employee_id})
+    MERGE (ev:Event {type: t.event_type, reason: t.reason})
+    MERGE (e)-[:EXPERIENCED]->(ev)
+    MERGE (p:Policy {version: t.policy})
+    MERGE (ev)-[:EVALUATED_AGAINST]->(p)
+    CREATE (d:Decision {approver: t.approver, status: 'Approved', timestamp: datetime(t.timestamp)})
+    CREATE (ev)-[:RESULTED_IN]->(d)
+    """
+
     def __init__(self, uri, user, password):
         self.driver = None
+        self.writer = None
+        self.dropped = 0
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
-            self.driver.verify_connectivity()
+            driver = GraphDatabase.driver(uri, auth=(user, password))
+            driver.verify_connectivity()
             logger.info("Connected to Decision Context Graph (Neo4j).")
         except Exception as e:
             logger.info(f"Neo4j not detected (Connection refused). Graph features will be disabled. This is normal if Neo4j is not installed.")
+            return
+        self.use_driver(driver)
+
+    def use_driver(self, driver):
+        """
+        Starts logging traces to `driver`: creates the schema and the background writer.
+        """
+        self.driver = driver
+        self.ensure_schema()
+        if NEO4J_WRITE_BEHIND and self.writer is None:
+            self.writer = BatchWriter("decision_traces", self._write_traces, NEO4J_BATCH_SIZE,
+                                      NEO4J_FLUSH_INTERVAL, NEO4J_WRITE_QUEUE_SIZE)
+            atexit.register(self.writer.close)
+
+    def ensure_schema(self):
+        """
+        Uniqueness constraints (which also index) for the MERGE keys; idempotent.
+        """
+        try:
+            with self.driver.session() as session:
+                for statement in self.SCHEMA:
+                    session.run(statement).consume()
+        except Exception as e:
+            logger.error(f"Failed to create Neo4j constraints: {e}")
 
     def close(self):
+        if self.writer:
+            self.writer.close()
         if self.driver:
             self.driver.close()
 
     def log_decision_trace(self, employee_id, event_type, reason, approver="AI"):
         if not self.driver: return
-        query = """
-        MERGE (e:Employee {id: $employee_id})
-        MERGE (ev:Event {type: $event_type, reason: $reason})
-        MERGE (e)-[:EXPERIENCED]->(ev)
-        MERGE (p:Policy {version: 'v3.2'})
-        MERGE (ev)-[:EVALUATED_AGAINST]->(p)
-        MERGE (d:Decision {approver: $approver, status: 'Approved', timestamp: datetime()})
-        MERGE (ev)-[:RESULTED_IN]->(d)
-        """
+        trace = {
+            "employee_id": employee_id,
+            "event_type": event_type,
+            "reason": reason,
+            "approver": approver,
+            "policy": self.POLICY_VERSION,
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        }
+        if self.writer is None:
+            self._write_traces([trace])
+            return
+        # Backpressure: wait briefly for room when Neo4j falls behind, then shed the trace
+        if not self.writer.submit(trace, timeout=NEO4J_BACKPRESSURE_TIMEOUT):
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Decision trace buffer full, {self.dropped} traces dropped so far")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return self.writer.flush(timeout) if self.writer else True
+
+    def stats(self) -> Dict[str, int]:
+        return {**(self.writer.stats() if self.writer else {}), "dropped": self.dropped}
+
+    def _write_traces(self, traces):
         with self.driver.session() as session:
-            session.run(query, employee_id=employee_id, event_type=event_type, reason=reason, approver=approver)
+            session.execute_write(lambda tx: tx.run(self.TRACE_QUERY, traces=traces).consume())
 
 decision_graph = DecisionContextGraph(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
 
 # --- Initialize Gemini ---
-llm = ChatGoogleGenerativeAI(
+# Wrapped in the shared rate-limit guard (token bucket, backoff, circuit breaker);
+# the client itself makes a single attempt per call.
+llm = guarded(ChatGoogleGenerativeAI(
     model="gemini-2.5-flash-lite",
     temperature=0.3,
     google_api_key=GOOGLE_API_KEY,
-    convert_system_message_to_human=True
-)
+    convert_system_message_to_human=True,
+    max_retries=1
+))
 
 # --- 4. Agent Orchestration (Operational Agents) ---
 
@@ -197,6 +771,16 @@ agent_executor = create_react_agent(llm, tools_orchestrator, prompt=system_promp
 
 # --- Core Logic with Step Flow ---
 
+FALLBACK_REPLIES = {
+    "employee": "Your message has been logged. The assistant is busy right now; your admin will follow up if needed.",
+    "admin": "The AI assistant is temporarily unavailable (rate limited). Please try again in a few minutes.",
+}
+
+def fallback_reply(sender_type: str) -> str:
+    return FALLBACK_REPLIES.get(sender_type, FALLBACK_REPLIES["employee"])
+
+flow_pool = ThreadPoolExecutor(max_workers=FLOW_WORKERS, thread_name_prefix="flow")
+
 def process_message_flow(sender_type: str, sender_id: str, message: str):
     """
     Implements the 5-Step Flow from the Architecture Plan:
@@ -207,29 +791,309 @@ def process_message_flow(sender_type: str, sender_id: str, message: str):
     5. Feedback loop.
     """
     
-    # Step 1: Fact Entry
-    fact_system.store_raw_message(sender_type, sender_id, message)
-    
-    # Step 2: Memory Retrieval
-    similar_cases = memory_system.search_similar_cases(message)
+    # Steps 1-2 and the profile lookup don't depend on each other: run them side by side
+    stored = flow_pool.submit(fact_system.store_raw_message, sender_type, sender_id, message)
+    profile = flow_pool.submit(fact_system.get_employee_record, sender_id)
+    similar_cases = memory_system.search_similar_cases(message, sender_id, sender_type)
     context_str = "\n".join(similar_cases) if similar_cases else "No direct precedents found."
+    stored.result()
+    try:
+        record = profile.result()
+    except Exception as e:
+        logger.warning(f"Employee record lookup failed for {sender_id}: {e}")
+        record = None
     
     # Step 3 & 4: Agent Execution & Decision
     input_text = f"User ({sender_type}:{sender_id}) says: {message}\nContext: {context_str}"
+    if record and record.get("name") != "Unknown":
+        input_text += f"\nProfile: {record.get('name')} ({record.get('role')})"
     
     # LangGraph invocation
-    result = agent_executor.invoke({"messages": [("human", input_text)]})
+    try:
+        result = agent_executor.invoke({"messages": [("human", input_text)]})
+    except LLMUnavailable as e:
+        # Quota exhausted or circuit open: answer deterministically instead of failing
+        logger.warning(f"LLM unavailable for {sender_type}:{sender_id}, using fallback reply: {e}")
+        return fallback_reply(sender_type)
     
     # result['messages'] is a list of BaseMessage. The last one is the AI response.
     output_text = result['messages'][-1].content
     
-    # Step 5: Decision Logging (Graph)
+    # Step 5: Decision Logging (Graph), after the reply
     # Heuristic to detect if a decision was made
     if "approved" in output_text.lower() or "logged" in output_text.lower():
-        decision_graph.log_decision_trace(sender_id, "Interaction", message, approver="AI_Orchestrator")
+        after_reply("decision_trace", decision_graph.log_decision_trace, sender_id, "Interaction", message,
+                    approver="AI_Orchestrator")
+
+    # Becomes a precedent for this sender's later messages
+    after_reply("store_case", memory_system.store_case, sender_type, sender_id, message)
         
     return output_text
 
+# --- 5. Webhook Queue (acknowledge, then process) ---
+class WebhookQueue:
+    """
+    WhatsApp deliveries are recorded and acknowledged at once; a pool of worker
+    threads runs the agent flow afterwards, so webhook latency no longer depends on
+    the agent and slow turns no longer trigger WhatsApp redeliveries.
+
+    - Deduplicated by WhatsApp message id: recent ids are kept in memory, and the
+      `webhook_events` collection catches redeliveries across restarts.
+    - At most `max_depth` events wait. Beyond that the webhook answers 503 so
+      WhatsApp redelivers later.
+    - One sender's events are processed one at a time, in arrival order; different
+      senders are processed in parallel.
+    """
+    def __init__(self, handler, events=None, workers=WEBHOOK_WORKERS, max_depth=WEBHOOK_QUEUE_MAX,
+                 dedupe_size=WEBHOOK_DEDUPE_SIZE):
+        self.handler = handler
+        self.events = events
+        self.workers = workers
+        self.max_depth = max_depth
+        self.dedupe_size = dedupe_size
+        self._seen = OrderedDict()
+        # sender_id -> waiting events; a sender stays here while one of its events is processed
+        self._pending: Dict[str, deque] = {}
+        # Senders with waiting events and no event in progress
+        self._ready = queue.Queue()
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self.counts = {"accepted": 0, "duplicate": 0, "rejected": 0, "skipped": 0, "invalid": 0, "processed": 0,
+                       "failed": 0, "recovered": 0}
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f"webhook-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        # Off the request path: the first webhook should not wait on the events query.
+        # Redeliveries arriving meanwhile are still caught by _persist.
+        threading.Thread(target=self._recover, name="webhook-recover", daemon=True).start()
+
+    def submit(self, event: Dict[str, Any]) -> str:
+        """
+        Queues {"message_id", "sender_id", "sender_type", "message"}; returns
+        "accepted", "duplicate" or "full".
+        """
+        self.start()
+        message_id = event["message_id"]
+        with self._lock:
+            if message_id in self._seen:
+                self.counts["duplicate"] += 1
+                return "duplicate"
+            if self._depth >= self.max_depth:
+                self.counts["rejected"] += 1
+                return "full"
+            self._remember(message_id)
+            self._depth += 1
+        if not self._persist(event):
+            with self._lock:
+                self._depth -= 1
+                self.counts["duplicate"] += 1
+            return "duplicate"
+        self._push(event)
+        with self._lock:
+            self.counts["accepted"] += 1
+        return "accepted"
+
+    def skip(self, event: Dict[str, Any], reason: str) -> str:
+        """
+        Records a message that will not be processed (e.g. an unsupported type);
+        returns "skipped", or "duplicate" for a redelivery.
+        """
+        with self._lock:
+            if event["message_id"] in self._seen:
+                self.counts["duplicate"] += 1
+                return "duplicate"
+            self._remember(event["message_id"])
+            self.counts["skipped"] += 1
+        if self.events is None or not WEBHOOK_PERSIST:
+            return "skipped"
+        try:
+            self.events.update_one(
+                {"_id": event["message_id"]},
+                {"$setOnInsert": {**event, "status": "skipped", "reason": reason,
+                                  "received_at": datetime.datetime.utcnow()}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Could not persist webhook event {event['message_id']}: {e}")
+        return "skipped"
+
+    def invalid(self, event: Dict[str, Any]) -> str:
+        """
+        Counts a message that cannot be queued (no sender or id); returns "invalid".
+        """
+        logger.warning(f"Invalid webhook message {event.get('message_id')} from {event.get('sender_id')}: "
+                       f"{event['invalid']}")
+        with self._lock:
+            self.counts["invalid"] += 1
+        return "invalid"
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every queued event has been processed.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._depth == 0, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counts, "depth": self._depth, "senders": len(self._pending),
+                    "workers": len(self._threads)}
+
+    def _remember(self, message_id: str):
+        self._seen[message_id] = True
+        while len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+    def _push(self, event: Dict[str, Any]):
+        sender_id = event["sender_id"]
+        with self._lock:
+            waiting = self._pending.get(sender_id)
+            if waiting is not None:
+                waiting.append(event)
+                return
+            self._pending[sender_id] = deque([event])
+        self._ready.put(sender_id)
+
+    def _work(self):
+        while True:
+            sender_id = self._ready.get()
+            with self._lock:
+                event = self._pending[sender_id].popleft()
+            try:
+                self.handler(event)
+                outcome = "processed"
+            except Exception as e:
+                logger.error(f"Webhook event {event['message_id']} from {sender_id} failed: {e}")
+                outcome = "failed"
+            self._mark(event["message_id"], outcome)
+            with self._lock:
+                self.counts[outcome] += 1
+                self._depth -= 1
+                if self._pending[sender_id]:
+                    self._ready.put(sender_id)
+                else:
+                    del self._pending[sender_id]
+                if self._depth == 0:
+                    self._idle.notify_all()
+
+    def _persist(self, event: Dict[str, Any]) -> bool:
+        """
+        Records the event; False if it was already recorded (a redelivery).
+        """
+        if self.events is None or not WEBHOOK_PERSIST:
+            return True
+        try:
+            result = self.events.update_one(
+                {"_id": event["message_id"]},
+                {"$setOnInsert": {**event, "status": "queued", "received_at": datetime.datetime.utcnow()}},
+                upsert=True,
+            )
+            return result.upserted_id is not None
+        except Exception as e:
+            # Processing the message matters more than recording it
+            logger.warning(f"Could not persist webhook event {event['message_id']}: {e}")
+            return True
+
+    def _mark(self, message_id: str, status: str):
+        if self.events is None or not WEBHOOK_PERSIST:
+            return
+        try:
+            self.events.update_one({"_id": message_id},
+                                   {"$set": {"status": status, "processed_at": datetime.datetime.utcnow()}})
+        except Exception as e:
+            logger.warning(f"Could not update webhook event {message_id}: {e}")
+
+    def _recover(self):
+        """
+        Re-queues events recorded but not processed before the last shutdown.
+        """
+        if self.events is None or not WEBHOOK_PERSIST:
+            return
+        try:
+            leftover = sorted(self.events.find({"status": "queued"}),
+                              key=lambda doc: doc.get("received_at") or datetime.datetime.min)
+        except Exception as e:
+            logger.warning(f"Could not load queued webhook events: {e}")
+            return
+        for doc in leftover[:self.max_depth]:
+            event = {k: doc.get(k) for k in ("message_id", "sender_id", "sender_type", "message")}
+            with self._lock:
+                if event["message_id"] in self._seen:
+                    continue
+                self._remember(event["message_id"])
+                self._depth += 1
+                self.counts["recovered"] += 1
+            self._push(event)
+        if leftover:
+            logger.info(f"Re-queued {min(len(leftover), self.max_depth)} unprocessed webhook events.")
+
+
+def message_text(msg: Dict[str, Any]) -> Optional[str]:
+    """
+    The text the agent should see for a WhatsApp message, or None for types it cannot handle.
+    """
+    kind = msg.get('type', 'text')
+    if kind == 'text':
+        return (msg.get('text') or {}).get('body')
+    if kind == 'button':
+        return (msg.get('button') or {}).get('text')
+    if kind == 'interactive':
+        interactive = msg.get('interactive') or {}
+        reply = interactive.get('button_reply') or interactive.get('list_reply') or {}
+        return reply.get('title')
+    if kind in ('image', 'video', 'document'):
+        return (msg.get(kind) or {}).get('caption')
+    if kind == 'location':
+        location = msg.get('location') or {}
+        return f"Shared location: {location.get('latitude')}, {location.get('longitude')}"
+    return None
+
+def parse_webhook_messages(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Flattens every entry -> change -> message of a delivery, in delivery order.
+    Events whose text could not be extracted have message None; messages without a
+    sender or id are returned with "invalid" set to the reason.
+    """
+    events = []
+    for entry in data.get('entry') or []:
+        for change in entry.get('changes') or []:
+            # Status updates (sent / delivered / read) carry no messages
+            for msg in (change.get('value') or {}).get('messages') or []:
+                sender_id = msg.get('from')
+                if not sender_id or not msg.get('id'):
+                    missing = [field for field in ('from', 'id') if not msg.get(field)]
+                    events.append({"message_id": msg.get('id'), "sender_id": sender_id,
+                                   "invalid": f"missing {' and '.join(missing)}"})
+                    continue
+                events.append({
+                    "message_id": msg['id'],
+                    "sender_id": sender_id,
+                    "sender_type": "admin" if sender_id in ADMIN_PHONE_NUMBERS else "employee",
+                    "type": msg.get('type', 'text'),
+                    "message": message_text(msg),
+                })
+    return events
+
+def handle_webhook_event(event: Dict[str, Any]):
+    response_text = process_message_flow(event["sender_type"], event["sender_id"], event["message"])
+    logger.info(f"Response for {event['sender_id']}: {response_text}")
+
+webhook_queue = WebhookQueue(handle_webhook_event, events=getattr(fact_system, "webhook_events", None))
+# atexit runs last-registered first: in-flight events, then their side effects, then the writers.
+# Anything left is re-queued on the next start.
+atexit.register(side_effects.drain, WEBHOOK_DRAIN_TIMEOUT)
+atexit.register(webhook_queue.drain, WEBHOOK_DRAIN_TIMEOUT)
+
 # --- Routes ---
 
 @app.route('/', methods=['GET'])
@@ -238,7 +1102,39 @@ def home():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "Human-in-the-Loop Agent Server (Graph-Enabled)"}), 200
+    return jsonify({"status": "healthy", "service": "Human-in-the-Loop Agent Server (Graph-Enabled)",
+                    "webhook_queue": webhook_queue.stats(),
+                    "raw_message_writer": fact_system.writer.stats() if fact_system.writer else None,
+                    "employee_cache": fact_system.employee_cache.stats() if fact_system.employee_cache else None,
+                    "decision_traces": decision_graph.stats() if decision_graph.driver else None,
+                    "memory": memory_system.stats() if memory_system.index else None}), 200
+
+registry.collector("agent_server_webhook_queue", "WhatsApp webhook queue", webhook_queue.stats)
+registry.collector("agent_server_raw_message_writer", "Buffered raw-message inserts",
+                   lambda: fact_system.writer.stats() if fact_system.writer else None)
+registry.collector("agent_server_decision_traces", "Neo4j decision-trace writer",
+                   lambda: decision_graph.stats() if decision_graph.driver else None)
+registry.collector("agent_server_memory", "Precedent search",
+                   lambda: memory_system.stats() if memory_system.index else None)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format: side-effect outcomes plus the component counters below
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+@app.route('/cache/employees/invalidate', methods=['POST'])
+def invalidate_employee_cache():
+    """
+    Hook for whatever updates employee records: {"employee_id": ...} or
+    {"employee_ids": [...]}; an empty body clears the whole cache.
+    """
+    data = request.get_json(silent=True) or {}
+    employee_ids = data.get('employee_ids') or ([data['employee_id']] if data.get('employee_id') else [])
+    if not employee_ids:
+        fact_system.invalidate_employee()
+    for employee_id in employee_ids:
+        fact_system.invalidate_employee(employee_id)
+    return jsonify({"invalidated": employee_ids or "all"}), 200
 
 @app.route('/agent/employee', methods=['POST'])
 def agent_employee():
@@ -288,25 +1184,29 @@ def webhook_whatsapp():
             
     if request.method == 'POST':
         try:
-            data = request.json
-            entry = data['entry'][0]
-            changes = entry['changes'][0]
-            value = changes['value']
-            messages = value.get('messages')
-            
-            if messages:
-                msg = messages[0]
-                sender_id = msg['from']
-                text = msg['text']['body']
-                sender_type = "admin" if sender_id in ADMIN_PHONE_NUMBERS else "employee"
-                
-                response_text = process_message_flow(sender_type, sender_id, text)
-                logger.info(f"Response for {sender_id}: {response_text}")
-                
+            events = parse_webhook_messages(request.get_json(silent=True) or {})
         except Exception as e:
             logger.error(f"Error processing webhook: {e}")
-            
-        return 'EVENT_RECEIVED', 200
+            return 'EVENT_RECEIVED', 200
+
+        # Messages are queued in delivery order: the queue keeps each sender's order and
+        # spreads different senders over its workers.
+        outcomes = []
+        for event in events:
+            if event.get("invalid"):
+                outcome = webhook_queue.invalid(event)
+            elif not event["message"]:
+                outcome = webhook_queue.skip(event, f"unsupported type {event['type']}")
+            else:
+                outcome = webhook_queue.submit(event)
+            outcomes.append({"id": event["message_id"], "from": event["sender_id"], "outcome": outcome})
+
+        deferred = [o for o in outcomes if o["outcome"] == "full"]
+        if deferred:
+            # Not acknowledged: WhatsApp redelivers the batch, and the messages already queued are deduplicated
+            logger.warning(f"Webhook queue full, deferring {len(deferred)} of {len(outcomes)} messages")
+            return jsonify({"status": "QUEUE_FULL", "messages": outcomes}), 503
+        return jsonify({"status": "EVENT_RECEIVED", "messages": outcomes}), 200
 
 if __name__ == '__main__':
     port = int(os.environ.get("AGENT_PORT", 5000))